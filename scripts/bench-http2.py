@@ -0,0 +1,134 @@
+#!/usr/bin/env -S uv run --script
+# /// script
+# requires-python = ">=3.10"
+# dependencies = ["twscrape[curl,http2]", "hypercorn", "trustme"]
+#
+# [tool.uv.sources]
+# twscrape = { path = "..", editable = true }
+# ///
+"""
+Usage:
+  uv run scripts/bench-http2.py                                # both backends
+  uv run scripts/bench-http2.py --backend httpx --concurrency 100 --delay 0.05
+
+Compares HTTP/1.1 and HTTP/2 modes of twscrape HTTP clients against local TLS server
+(hypercorn, self-signed cert). Each round sends `concurrency` requests at once with one
+client, as workers sharing an account / proxy do; server answers after `delay` seconds.
+
+Columns: negotiated protocol, TCP connections opened (seen by server), mean / p95 latency of
+request and wall time of all rounds.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import trustme
+from hypercorn.asyncio import serve
+from hypercorn.config import Config
+
+from twscrape.http import make_client
+from twscrape.logger import set_log_level
+
+
+class Server:
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.conns: set[tuple] = set()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                msg = await receive()
+                if msg["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif msg["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+
+        self.conns.add(tuple(scope["client"]))  # client port is unique per connection
+        await asyncio.sleep(self.delay)
+        body = b'{"data":{}}'
+        headers = [(b"content-type", b"application/json")]
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+
+async def run(args, url: str, server: Server, backend: str, http2: bool) -> dict:
+    server.conns.clear()
+    kwargs = {"verify": False} if backend == "curl" else {}  # httpx uses SSL_CERT_FILE
+
+    latencies: list[float] = []
+    versions: set[str] = set()
+
+    async def one(clt):
+        t0 = time.perf_counter()
+        rep = await clt.get(url, **kwargs)
+        latencies.append(time.perf_counter() - t0)
+        versions.add(rep.http_version)
+
+    t0 = time.perf_counter()
+    async with make_client(backend, http2=http2) as clt:
+        for _ in range(args.rounds):
+            await asyncio.gather(*(one(clt) for _ in range(args.concurrency)))
+    wall = time.perf_counter() - t0
+
+    latencies.sort()
+    return {
+        "protocol": ",".join(sorted(versions)),
+        "conns": len(server.conns),
+        "mean": f"{statistics.mean(latencies) * 1000:.1f}ms",
+        "p95": f"{latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f}ms",
+        "wall": f"{wall:.2f}s",
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark HTTP/2 vs HTTP/1.1 clients")
+    parser.add_argument("--backend", nargs="+", choices=["httpx", "curl"], default=None)
+    parser.add_argument("--concurrency", type=int, default=50, help="requests at once")
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--delay", type=float, default=0.02, help="server response time")
+    parser.add_argument("--port", type=int, default=8443)
+    args = parser.parse_args()
+
+    set_log_level("ERROR")
+    ca = trustme.CA()
+    cert = ca.issue_cert("127.0.0.1", "localhost")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        ca_file, cert_file = Path(tmp) / "ca.pem", Path(tmp) / "cert.pem"
+        ca.cert_pem.write_to_path(str(ca_file))
+        cert.private_key_and_cert_chain_pem.write_to_path(str(cert_file))
+        os.environ["SSL_CERT_FILE"] = str(ca_file)
+
+        config = Config()
+        config.bind = [f"127.0.0.1:{args.port}"]
+        config.certfile = config.keyfile = str(cert_file)
+        config.alpn_protocols = ["h2", "http/1.1"]
+        config.accesslog = config.errorlog = None
+
+        server, shutdown = Server(args.delay), asyncio.Event()
+        task = asyncio.create_task(serve(server, config, shutdown_trigger=shutdown.wait))
+        await asyncio.sleep(0.5)
+
+        url = f"https://127.0.0.1:{args.port}/"
+        cols = ["backend", "mode", "protocol", "conns", "mean", "p95", "wall"]
+        print(" ".join(f"{x:>10}" for x in cols))
+        try:
+            for backend in args.backend or ["httpx", "curl"]:
+                for http2 in (False, True):
+                    rs = await run(args, url, server, backend, http2)
+                    row = [backend, "http2" if http2 else "http1.1", *[rs[x] for x in cols[2:]]]
+                    print(" ".join(f"{x:>10}" for x in row))
+        finally:
+            shutdown.set()
+            await task
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,83 @@
+#!/usr/bin/env -S uv run --script
+# /// script
+# requires-python = ">=3.10"
+# dependencies = ["twscrape"]
+#
+# [tool.uv.sources]
+# twscrape = { path = "..", editable = true }
+# ///
+"""
+Usage:
+  uv run scripts/bench-parse.py                                 # all tests/mocked-data/raw_*
+  uv run scripts/bench-parse.py --rounds 500 raw_search raw_user_tweets
+
+Compares page handling before and after `RepIndex` on responses of tests/mocked-data. Old
+way walks page separately to find entries & cursor (`get_by_path`, `find_obj`) and to collect
+typed objects (`to_old_rep`); new way collects everything in one walk, shared by pagination
+of API and parsers.
+
+Columns: response, size of json, mean time per page of old and new way, speedup.
+"""
+
+import argparse
+import json
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from twscrape.models import rep_index
+from twscrape.utils import find_obj, get_by_path, get_typed_object
+
+DATA_DIR = Path(__file__).parent.parent / "tests" / "mocked-data"
+
+
+def old_way(obj: dict):
+    entries = get_by_path(obj, "entries") or get_by_path(obj, "items_results") or []
+    cur = find_obj(obj, lambda x: x.get("cursorType") == "Bottom")
+    if cur is None:
+        cur = get_by_path(obj, "next_cursor")
+    return entries, cur, get_typed_object(obj, defaultdict(list))
+
+
+def new_way(obj: dict):
+    idx = rep_index(obj)
+    entries = idx.get("entries") or idx.get("items_results") or []
+    cur = idx.cursors.get("Bottom") or idx.get("next_cursor")
+    return entries, cur, idx.typed
+
+
+def timeit(fn, obj: dict, rounds: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        fn(obj)
+    return (time.perf_counter() - t0) / rounds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark response indexing")
+    parser.add_argument("names", nargs="*", help="mocked-data files (default: raw_*)")
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    names = [x.removesuffix(".json") for x in args.names]
+    files = [DATA_DIR / f"{x}.json" for x in names] or sorted(DATA_DIR.glob("raw_*.json"))
+
+    cols = ["response", "size", "old", "new", "speedup"]
+    print(f"{cols[0]:<32}" + " ".join(f"{x:>10}" for x in cols[1:]))
+    total_old, total_new = 0.0, 0.0
+    for file in files:
+        obj = json.loads(file.read_text())
+        old = timeit(old_way, obj, args.rounds)
+        new = timeit(new_way, obj, args.rounds)
+        total_old, total_new = total_old + old, total_new + new
+
+        row = [f"{file.stat().st_size // 1024}KB", f"{old * 1e6:.0f}us", f"{new * 1e6:.0f}us"]
+        row.append(f"{old / new:.2f}x")
+        print(f"{file.stem:<32}" + " ".join(f"{x:>10}" for x in row))
+
+    print(f"{'total':<32}{'':>10} {total_old * 1e6:>8.0f}us {total_new * 1e6:>8.0f}us", end="")
+    print(f" {total_old / total_new:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env -S uv run --script
+# /// script
+# requires-python = ">=3.10"
+# dependencies = ["twscrape"]
+#
+# [tool.uv.sources]
+# twscrape = { path = "..", editable = true }
+# ///
+"""
+Usage:
+  uv run scripts/bench-strategies.py                            # all strategies, sql & memory
+  uv run scripts/bench-strategies.py --strategy lru random      # only selected ones
+  uv run scripts/bench-strategies.py --accounts 200 --workers 20 --minutes 60
+
+Compares account selection strategies of AccountsPool on simulated workload: `workers`
+accounts are leased every simulated second, each does a few requests and is released with
+rate limit headers of the simulated API (`limit` requests per 15 minutes per account). Time
+is simulated, so an hour of traffic runs in seconds; pool code and SQLite are real.
+
+Columns: requests served, rate limit locks hit, time of first lock, share of accounts used,
+coefficient of variation of requests per account (lower is more even) and real time per
+acquire.
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from unittest.mock import patch
+
+from twscrape import AccountsPool
+from twscrape.account import RateLimit
+from twscrape.logger import set_log_level
+from twscrape.strategy import STRATEGIES
+from twscrape.utils import utc
+
+Q = "SearchTimeline"
+WINDOW = 15 * 60
+
+
+class Clock:
+    def __init__(self):
+        self.ts = float(int(time.time()))
+
+    def now(self) -> datetime:
+        return datetime.fromtimestamp(self.ts, tz=timezone.utc)
+
+
+async def run(args, strategy: str, in_memory: bool, clock: Clock) -> dict:
+    rng = random.Random(args.seed)
+    start = clock.ts
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pool = AccountsPool(str(Path(tmp) / "bench.db"), in_memory=in_memory, strategy=strategy)
+        for x in range(args.accounts):
+            await pool.add_account(f"user{x:04d}", "pass", "email", "email_pass")
+            await pool.set_active(f"user{x:04d}", True)
+
+        windows: dict[str, RateLimit] = {}  # simulated api state
+        served = {f"user{x:04d}": 0 for x in range(args.accounts)}
+        locks, first_lock, acquire_time, acquires = 0, None, 0.0, 0
+
+        while clock.ts < start + args.minutes * 60:
+            t0 = time.perf_counter()
+            accs = await pool.get_many_for_queue(Q, args.workers)
+            acquire_time, acquires = acquire_time + time.perf_counter() - t0, acquires + 1
+
+            for acc in accs:
+                now = int(clock.ts)
+                rl = windows.get(acc.username)
+                if rl is None or rl.reset <= now:
+                    rl = windows[acc.username] = RateLimit(args.limit, args.limit, now + WINDOW)
+
+                pages = rng.randint(1, args.pages)
+                done = min(pages, rl.remaining)
+                rl.remaining -= done
+                served[acc.username] += done
+
+                if rl.remaining == 0:
+                    locks += 1
+                    first_lock = first_lock or clock.ts - start
+                    await pool.lock_until(acc.username, Q, rl.reset, done, RateLimit(**vars(rl)))
+                else:
+                    await pool.unlock(acc.username, Q, done, RateLimit(**vars(rl)))
+
+            clock.ts += 1
+
+        await pool.close()
+
+    counts = list(served.values())
+    mean = statistics.mean(counts)
+    return {
+        "requests": sum(counts),
+        "locks": locks,
+        "first_lock": f"{first_lock / 60:.1f}m" if first_lock is not None else "-",
+        "used": f"{sum(1 for x in counts if x > 0) / len(counts):.0%}",
+        "cv": f"{statistics.pstdev(counts) / mean:.2f}" if mean else "-",
+        "acquire": f"{acquire_time / max(acquires, 1) * 1e6:.0f}us",
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark account selection strategies")
+    parser.add_argument("--strategy", nargs="+", choices=list(STRATEGIES), default=None)
+    parser.add_argument("--accounts", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=1, help="accounts leased per second")
+    parser.add_argument("--minutes", type=int, default=30, help="simulated time")
+    parser.add_argument("--limit", type=int, default=50, help="requests per 15 min window")
+    parser.add_argument("--pages", type=int, default=10, help="max requests per lease")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    set_log_level("ERROR")
+    clock = Clock()
+
+    cols = ["strategy", "mode", "requests", "locks", "first_lock", "used", "cv", "acquire"]
+    print(" ".join(f"{x:>12}" for x in cols))
+    with patch.object(utc, "now", clock.now):  # simulated time for pool
+        for strategy in args.strategy or list(STRATEGIES):
+            for in_memory in (False, True):
+                rs = await run(args, strategy, in_memory, clock)
+                row = [strategy, "memory" if in_memory else "sql", *[rs[x] for x in cols[2:]]]
+                print(" ".join(f"{x:>12}" for x in row))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,6 +1,7 @@
 import pytest
+import pytest_asyncio
 
-from twscrape import telemetry
+from twscrape import db, telemetry
 from twscrape.account import Account
 from twscrape.accounts_pool import AccountsPool
 from twscrape.api import API
@@ -22,6 +23,19 @@ def reset_telemetry():
     telemetry.reset()
 
 
+@pytest_asyncio.fixture(autouse=True, loop_scope="function")
+async def close_db():
+    yield
+    await db.close()
+
+
+@pytest.fixture(autouse=True, scope="session")
+def xclid_cache_dir(tmp_path_factory):
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv("TWS_CACHE_DIR", str(tmp_path_factory.mktemp("cache")))
+        yield
+
+
 @pytest.fixture(autouse=True)
 def mock_xclidgenstore(monkeypatch):
     async def mock_get(*args, **kwargs):
@@ -8,7 +8,7 @@ def _raw(*, status_code: int = 200, json_data=None, text: str = "", headers: dic
     raw = MagicMock()
     raw.status_code = status_code
     raw.text = text
-    raw.content = text.encode()
+    raw.content = _json.dumps(json_data).encode() if json_data is not None else text.encode()
     raw.headers = headers or {}
     raw.url = "https://mock.local"
     raw.request = MagicMock()
@@ -2,9 +2,12 @@ import os
 
 import pytest
 
+from twscrape.account import Account
 from twscrape.accounts_pool import NoAccountError
-from twscrape.api import API
-from twscrape.utils import gather, get_env_bool
+from twscrape.api import API, GQL_FEATURES, gql_op
+from twscrape.utils import encode_params, gather, get_env_bool
+
+from .mock_http import MockClient
 
 
 class MockedError(Exception):
@@ -48,6 +51,24 @@ async def test_gql_params(api_mock: API, monkeypatch):
         assert args[0][0][1]["count"] == 100, f"count not changed in {func}"
 
 
+def test_gql_op_encodes_same_params():
+    kv = {"rawQuery": "elon", "count": 20, "cursor": None}
+    gql = gql_op("hash/SearchTimeline", {"extra_enabled": True})
+    assert gql is gql_op("hash/SearchTimeline", {"extra_enabled": True})
+    assert gql.url == "https://x.com/i/api/graphql/hash/SearchTimeline"
+
+    params = {
+        "variables": {**kv, "cursor": "abc"},
+        "features": {**GQL_FEATURES, "extra_enabled": True},
+        "fieldToggles": {"withArticleRichContentState": False},
+    }
+    assert gql.encode(kv, "abc") == encode_params(params)
+    assert gql.encode(kv)["variables"] == '{"rawQuery":"elon","count":20}'
+
+    gql = gql_op("hash/UserByScreenName")
+    assert list(gql.encode({"screen_name": "elon"})) == ["variables", "features"]
+
+
 async def test_raise_when_no_account(api_mock: API):
     await api_mock.pool.delete_accounts(["user1"])
     assert len(await api_mock.pool.get_all()) == 0
@@ -64,3 +85,43 @@ async def test_raise_when_no_account(api_mock: API):
 
     del os.environ["TWS_RAISE_WHEN_NO_ACCOUNT"]
     assert get_env_bool("TWS_RAISE_WHEN_NO_ACCOUNT") is False
+
+
+async def test_session_keeps_account(api_mock: API, monkeypatch):
+    mock, clients = MockClient(), []
+    monkeypatch.setattr(Account, "make_client", lambda self, proxy=None: clients.append(1) or mock)
+    for _ in range(3):
+        mock.add_response(json={"data": {}})
+
+    async with api_mock.session("UserByScreenName") as s:
+        assert (await api_mock.pool.get("user1")).locks.get("UserByScreenName") is not None
+        for x in ("a", "b", "c"):
+            rep = await s.user_by_login_raw(x)
+            assert rep is not None
+
+    assert len(clients) == 1  # one lease & http client for all calls
+    acc = await api_mock.pool.get("user1")
+    assert "UserByScreenName" not in acc.locks
+    assert acc.stats["UserByScreenName"] == 3
+    assert api_mock._sessions is None
+
+
+async def test_session_rotates_on_rate_limit(api_mock: API, monkeypatch):
+    await api_mock.pool.add_account("user2", "pass2", "e2", "ep2", cookies="auth_token=t; ct0=c")
+    await api_mock.pool.set_active("user2", True)
+    mock = MockClient()
+    monkeypatch.setattr(Account, "make_client", lambda self, proxy=None: mock)
+
+    reset = {"x-rate-limit-remaining": "0", "x-rate-limit-reset": "9999999999"}
+    mock.add_response(json={"data": {}})
+    mock.add_response(json={"data": {}}, headers=reset)
+    mock.add_response(json={"data": {}})
+
+    async with api_mock.session() as s:
+        first = getattr(await s.user_about_raw("a"), "__username")
+        second = getattr(await s.user_about_raw("b"), "__username")
+        assert first != second
+
+    accs = {x.username: x for x in await api_mock.pool.get_all()}
+    assert accs[first].locks.get("AboutAccountQuery") is not None
+    assert "AboutAccountQuery" not in accs[second].locks
@@ -94,7 +94,7 @@ async def test_add_cookie_reads_stdin(tmp_path, monkeypatch):
 async def test_add_accounts_prints_next_step(tmp_path, monkeypatch, capsys):
     called = {}
 
-    async def mock_load_from_file(self, file_path, line_format):
+    async def mock_load_from_file(self, file_path, line_format, **kwargs):
         called["file_path"] = file_path
         called["line_format"] = line_format
 
@@ -108,6 +108,8 @@ async def test_add_accounts_prints_next_step(tmp_path, monkeypatch, capsys):
         manual=False,
         file_path="accounts.txt",
         line_format="username:password:email:email_password",
+        sync=False,
+        deactivate_missing=False,
     )
 
     await cli.main(args)
@@ -195,6 +197,11 @@ async def test_tweet_details_raw_prints_raw_json(tmp_path, monkeypatch, capsys):
     assert "threaded_conversation_with_injections_v2" in json.dumps(doc)
 
 
+async def test_version_shows_json_codec(capsys):
+    await cli.main(argparse.Namespace(command="version", debug=False))
+    assert f"JSON codec: {cli.codec.get_codec().name}" in capsys.readouterr().out
+
+
 async def test_run_flushes_telemetry(monkeypatch):
     called = []
 
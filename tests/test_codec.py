@@ -0,0 +1,64 @@
+import importlib.util
+import json
+from dataclasses import asdict
+
+import pytest
+
+from tests.test_parser import fake_rep
+from twscrape import codec
+from twscrape.models import parse_tweets, parse_users
+
+CODECS = [
+    pytest.param(
+        x,
+        marks=pytest.mark.skipif(
+            x != "json" and importlib.util.find_spec(x) is None, reason=f"{x} not installed"
+        ),
+    )
+    for x in codec.CODECS
+]
+
+
+@pytest.fixture(params=CODECS)
+def json_codec(request, monkeypatch):
+    monkeypatch.setenv("TWS_JSON", request.param)
+    codec.get_codec.cache_clear()
+    yield codec.get_codec()
+    codec.get_codec.cache_clear()
+
+
+def test_codec_is_chosen_by_env(json_codec):
+    assert json_codec.name == codec.get_codec().name
+
+
+def test_codec_dumps_models_as_stdlib(json_codec):
+    docs = [*parse_tweets(fake_rep("raw_search")), *parse_users(fake_rep("raw_followers"))]
+    assert len(docs) > 0
+
+    for doc in docs:
+        assert json.loads(doc.json()) == json.loads(json.dumps(asdict(doc), default=str))
+
+
+def test_codec_dumps_values_as_stdlib(json_codec):
+    obj = {"big": 2**70, "keys": {1: "a"}, "nested": [(1, 2)], "text": "привет"}
+    assert json.loads(json_codec.dumps(obj)) == json.loads(json.dumps(obj, default=str))
+
+
+def test_codec_loads_bytes(json_codec):
+    assert json_codec.loads(b'{"a": [1, "\\u00e9"]}') == {"a": [1, "é"]}
+    with pytest.raises(json.JSONDecodeError):
+        json_codec.loads(b"<html>")
+
+
+def test_codec_env_errors(monkeypatch):
+    monkeypatch.setenv("TWS_JSON", "simdjson")
+    with pytest.raises(ValueError, match="Invalid TWS_JSON"):
+        codec._detect_codec()
+
+    monkeypatch.setenv("TWS_JSON", "msgspec")
+    monkeypatch.setattr(importlib.util, "find_spec", lambda name: None)
+    with pytest.raises(ImportError, match="msgspec is not installed"):
+        codec._detect_codec()
+
+    monkeypatch.setenv("TWS_JSON", "")
+    assert codec._detect_codec() == "json"
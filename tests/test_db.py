@@ -0,0 +1,136 @@
+import json
+import sqlite3
+from datetime import datetime, timezone
+
+from twscrape import db
+from twscrape.accounts_pool import AccountsPool
+
+
+async def test_connection_is_reused(tmp_path):
+    db_path = str(tmp_path / "test.db")
+
+    await db.execute(db_path, "SELECT 1")
+    conn = db._conns[db_path]
+    await db.fetchone(db_path, "SELECT 1")
+    await db.fetchall(db_path, "SELECT 1")
+    assert db._conns[db_path] is conn
+
+    await db.close(db_path)
+    assert db_path not in db._conns
+
+
+async def test_connection_uses_wal(tmp_path):
+    rs = await db.fetchone(str(tmp_path / "test.db"), "PRAGMA journal_mode")
+    assert rs is not None
+    assert rs[0] == "wal"
+
+
+async def test_version_checked_once(tmp_path, monkeypatch):
+    calls = []
+
+    async def check_version():
+        calls.append(1)
+
+    monkeypatch.setattr(db, "_version_checked", False)
+    monkeypatch.setattr(db, "check_version", check_version)
+
+    await db.execute(str(tmp_path / "a.db"), "SELECT 1")
+    await db.execute(str(tmp_path / "b.db"), "SELECT 1")
+    assert len(calls) == 1
+
+
+async def test_failed_query_rolls_back(tmp_path):
+    db_path = str(tmp_path / "test.db")
+    await db.execute(db_path, "CREATE TABLE t (x INTEGER PRIMARY KEY)")
+    await db.execute(db_path, "INSERT INTO t VALUES (1)")
+
+    try:
+        await db.executemany(db_path, "INSERT INTO t VALUES (:x)", [{"x": 2}, {"x": 1}])
+    except Exception:
+        pass
+
+    rs = await db.fetchall(db_path, "SELECT x FROM t")
+    assert [x[0] for x in rs] == [1]
+
+
+async def test_migrate_locks_to_table(tmp_path):
+    db_path = str(tmp_path / "test.db")
+    await db.execute(db_path, "SELECT 1")  # create schema
+    await db.close(db_path)
+
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("DROP TABLE account_locks")
+        conn.execute("PRAGMA user_version = 4")
+        conn.execute(
+            """
+            INSERT INTO accounts (username, password, email, email_password, user_agent, locks, stats)
+            VALUES ('user1', 'p', 'e', 'ep', 'ua', :locks, :stats)
+            """,
+            {
+                "locks": json.dumps({"SearchTimeline": "2030-01-01T00:00:00+00:00"}),
+                "stats": json.dumps({"SearchTimeline": 5, "UserTweets": 2}),
+            },
+        )
+    db.DB._init_once.pop(db_path)
+
+    pool = AccountsPool(db_path)
+    acc = await pool.get("user1")
+    assert acc.locks == {"SearchTimeline": datetime(2030, 1, 1, tzinfo=timezone.utc)}
+    assert acc.stats == {"SearchTimeline": 5, "UserTweets": 2}
+
+    rs = await db.fetchall(db_path, "SELECT queue FROM account_locks ORDER BY queue")
+    assert [x[0] for x in rs] == ["SearchTimeline", "UserTweets"]
+
+
+async def test_next_unlock_uses_index(tmp_path):
+    db_path = str(tmp_path / "test.db")
+    qs = "EXPLAIN QUERY PLAN SELECT unlock_at FROM account_locks WHERE queue = 'Q' ORDER BY unlock_at"
+    rs = await db.fetchall(db_path, qs)
+    assert any("account_locks_queue" in x[-1] for x in rs)
+
+
+async def test_deferred_writes_are_committed_together(tmp_path, monkeypatch):
+    db_path = str(tmp_path / "test.db")
+    await db.execute(db_path, "CREATE TABLE t (x INTEGER PRIMARY KEY)")
+
+    commits = []
+    commit = db._commit
+
+    async def _commit(db_path, items):
+        commits.append(len(items))
+        await commit(db_path, items)
+
+    monkeypatch.setattr(db, "_commit", _commit)
+
+    for x in range(100):
+        db.execute_later(db_path, "INSERT INTO t VALUES (:x)", {"x": x})
+    await db.flush(db_path)
+
+    assert commits == [100]
+    rs = await db.fetchone(db_path, "SELECT COUNT(*) FROM t")
+    assert rs is not None
+    assert rs[0] == 100
+
+
+async def test_failed_deferred_write_keeps_others(tmp_path):
+    db_path = str(tmp_path / "test.db")
+    await db.execute(db_path, "CREATE TABLE t (x INTEGER PRIMARY KEY)")
+
+    db.execute_later(db_path, "INSERT INTO t VALUES (:x)", {"x": 1})
+    db.execute_later(db_path, "INSERT INTO t VALUES (:x)", {"x": 1})
+    db.execute_later(db_path, "INSERT INTO t VALUES (:x)", {"x": 2})
+    await db.flush(db_path)
+
+    rs = await db.fetchall(db_path, "SELECT x FROM t ORDER BY x")
+    assert [x[0] for x in rs] == [1, 2]
+
+
+async def test_close_flushes_deferred_writes(tmp_path):
+    db_path = str(tmp_path / "test.db")
+    await db.execute(db_path, "CREATE TABLE t (x INTEGER PRIMARY KEY)")
+
+    db.execute_later(db_path, "INSERT INTO t VALUES (:x)", {"x": 1})
+    await db.close(db_path)
+
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT x FROM t").fetchall() == [(1,)]
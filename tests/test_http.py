@@ -1,12 +1,15 @@
-from unittest.mock import AsyncMock, MagicMock, patch
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, call, patch
 
 import httpx
 import pytest
 from curl_cffi.const import CurlECode
 from curl_cffi.requests.errors import RequestsError
 
+from twscrape import codec
 from twscrape.http import (
     _CURL_MAX_RETRIES,
+    ClientCache,
     ConnectError,
     CurlClient,
     HttpClient,
@@ -14,6 +17,7 @@ from twscrape.http import (
     HttpStatusError,
     HttpxClient,
     NetworkError,
+    ProxyPools,
     Response,
     _detect_backend,
     _resolve_browser,
@@ -281,12 +285,11 @@ async def test_curl_client_returns_response_wrapper():
 
     raw = MagicMock()
     raw.status_code = 200
-    raw.text = "hello"
-    raw.content = b"hello"
+    raw.text = '{"ok": true}'
+    raw.content = b'{"ok": true}'
     raw.headers = {}
     raw.url = "https://example.com"
     raw.request = MagicMock()
-    raw.json.return_value = {"ok": True}
     raw.raise_for_status.return_value = None
 
     client = CurlClient()
@@ -396,9 +399,69 @@ def test_response_content_and_headers():
 def test_response_json_is_cached():
     raw = _raw(status_code=200, json_data={"x": 1})
     rep = Response(raw)
-    _ = rep.json()
-    _ = rep.json()
-    assert raw.json.call_count == 1
+    with patch.object(codec, "loads", wraps=codec.loads) as loads:
+        assert rep.json() == {"x": 1}
+        assert rep.json() == {"x": 1}
+    assert loads.call_args_list == [call(b'{"x": 1}')]
+
+
+def test_response_http_version():
+    raw = httpx.Response(200, request=httpx.Request("GET", "https://example.com"))
+    raw.extensions["http_version"] = b"HTTP/2"
+    assert Response(raw).http_version == "HTTP/2"
+
+    for version, expected in ((2, "HTTP/1.1"), (3, "HTTP/2"), (30, "HTTP/3"), (0, "unknown")):
+        raw = MagicMock()
+        raw.http_version = version
+        assert Response(raw).http_version == expected
+
+    assert Response(_raw()).http_version == "unknown"
+
+
+# --- HTTP/2 ---
+
+
+@pytest.mark.parametrize("http2", [None, False, True])
+async def test_httpx_client_http2(http2):
+    if http2:
+        pytest.importorskip("h2")
+
+    with patch("httpx.AsyncHTTPTransport", wraps=httpx.AsyncHTTPTransport) as transport:
+        client = HttpxClient(http2=http2)
+    assert transport.call_args.kwargs["http2"] is bool(http2)
+    await client.aclose()
+
+
+def test_httpx_client_http2_requires_h2():
+    with (
+        patch("importlib.util.find_spec", return_value=None),
+        pytest.raises(ImportError, match="twscrape\\[http2\\]"),
+    ):
+        HttpxClient(http2=True)
+
+
+async def test_curl_client_http2():
+    from curl_cffi.const import CurlHttpVersion
+
+    expected = {None: None, False: CurlHttpVersion.V1_1, True: CurlHttpVersion.V2TLS}
+    for http2, version in expected.items():
+        client = CurlClient(http2=http2)
+        assert client._session.http_version == version
+        await client.aclose()
+
+
+@pytest.mark.parametrize("env, expected", [(None, None), ("1", True), ("0", False)])
+async def test_make_client_http2_from_env(monkeypatch, env, expected):
+    if env is None:
+        monkeypatch.delenv("TWS_HTTP2", raising=False)
+    else:
+        monkeypatch.setenv("TWS_HTTP2", env)
+
+    with patch("twscrape.http.CurlClient") as clt:
+        make_client("curl")
+        make_client("curl", http2=False)
+    assert clt.call_args_list[0].kwargs["http2"] is expected
+    assert clt.call_args_list[1].kwargs["http2"] is False
 
 
 # --- Browser resolution helpers ---
@@ -475,3 +538,142 @@ def test_httpx_client_resolves_ua_hint_to_real_string():
     ua = dict(client._client.headers).get("user-agent", "")
     assert ua == expected_ua
     assert "@" not in ua
+
+
+# --- ClientCache ---
+
+
+class FakeClient(HttpClient):
+    backend = "httpx"
+
+    def __init__(self):
+        self.closed = False
+
+    async def request(self, method, url, **kwargs) -> Response:
+        raise NotImplementedError()
+
+    async def aclose(self) -> None:
+        self.closed = True
+
+    @property
+    def cookies(self):
+        return {}
+
+    @property
+    def headers(self):
+        return {}
+
+
+async def test_client_cache_reuses_idle_client(monkeypatch):
+    monkeypatch.setenv("TWS_HTTP_BACKEND", "httpx")
+    cache, clt = ClientCache(), FakeClient()
+
+    await cache.put("user1", None, "fp", clt)
+    assert await cache.take("user1", "http://proxy", "fp") is None
+    assert await cache.take("USER1", None, "fp") is clt
+    assert await cache.take("user1", None, "fp") is None  # taken already
+    assert not clt.closed
+
+
+async def test_client_cache_drops_client_of_changed_account(monkeypatch):
+    monkeypatch.setenv("TWS_HTTP_BACKEND", "httpx")
+    cache, clt = ClientCache(), FakeClient()
+
+    await cache.put("user1", None, "fp1", clt)
+    assert await cache.take("user1", None, "fp2") is None
+    assert clt.closed
+
+
+async def test_client_cache_evicts_lru_and_idle(monkeypatch):
+    monkeypatch.setenv("TWS_HTTP_BACKEND", "httpx")
+    cache = ClientCache(maxsize=2, idle_timeout=60)
+    clts = [FakeClient() for _ in range(3)]
+    for i, x in enumerate(clts):
+        await cache.put(f"user{i}", None, "fp", x)
+    assert [x.closed for x in clts] == [True, False, False]
+
+    cache.idle_timeout = 0
+    assert await cache.take("user2", None, "fp") is None
+    assert all(x.closed for x in clts)
+
+
+# --- ProxyPools ---
+
+
+async def test_proxy_pools_share_httpx_connections(monkeypatch):
+    pools = ProxyPools(max_connections=5)
+    monkeypatch.setattr("twscrape.http.proxy_pools", pools)
+
+    clt1 = HttpxClient(proxy="http://proxy:8080", cookies={"ct0": "a"})
+    clt2 = HttpxClient(proxy="http://proxy:8080", cookies={"ct0": "b"})
+    clt3 = HttpxClient(proxy="http://other:8080")
+    shared = getattr(clt1._client._transport, "_transport")
+    assert getattr(clt2._client._transport, "_transport") is shared
+    assert getattr(clt3._client._transport, "_transport") is not shared
+    assert shared._pool._max_connections == 5
+
+    sent = []
+
+    async def handle(request):
+        sent.append(request.headers["cookie"])
+        return httpx.Response(200, json={})
+
+    with patch.object(shared, "handle_async_request", handle):
+        await clt1.get("https://x.com/")
+        await clt2.get("https://x.com/")
+    assert sent == ["ct0=a", "ct0=b"]  # cookies stay per account
+
+    with patch.object(shared, "aclose", AsyncMock()) as aclose:
+        await clt1.aclose()
+        await clt2.aclose()
+        assert aclose.call_count == 0  # owned by pools
+        await pools.aclose()
+        assert aclose.call_count == 1
+
+    await clt3.aclose()
+
+
+async def test_proxy_pools_disabled(monkeypatch):
+    monkeypatch.delenv("TWS_PROXY_MAX_CONNECTIONS", raising=False)
+    assert ProxyPools().max_connections == 0  # opt-in
+
+    monkeypatch.setattr("twscrape.http.proxy_pools", ProxyPools(max_connections=0))
+    clt = HttpxClient(proxy="http://proxy:8080")
+    assert isinstance(clt._client._transport, httpx.AsyncHTTPTransport)
+    await clt.aclose()
+
+
+async def test_proxy_pools_share_curl_connections(monkeypatch):
+    pools = ProxyPools(max_connections=2)
+    monkeypatch.setattr("twscrape.http.proxy_pools", pools)
+
+    clt1, clt2 = CurlClient(proxy="http://proxy:8080"), CurlClient(proxy="http://proxy:8080")
+    assert clt1._session.acurl is clt2._session.acurl
+    assert clt1._slots is clt2._slots
+
+    running, peak = 0, 0
+
+    async def request(*args, **kwargs):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return _raw()
+
+    with (
+        patch.object(clt1._session, "request", request),
+        patch.object(clt2._session, "request", request),
+    ):
+        await asyncio.gather(*(x.get("https://x.com/") for x in [clt1, clt2] * 3))
+    assert peak == 2
+
+    await clt1.aclose()
+    await clt2.aclose()
+    await pools.aclose()
+
+
+def test_proxy_pools_need_running_loop():
+    pools = ProxyPools(max_connections=5)
+    assert pools.httpx_transport(None, False) is None
+    assert pools.curl_pool(None) is None
@@ -0,0 +1,100 @@
+import asyncio
+import email as emaillib
+
+import pytest
+
+from twscrape import imap
+from twscrape.imap import ImapSessions
+
+
+class FakeImap:
+    def __init__(self, email: str, codes: list[str] | None = None):
+        self.email = email
+        self.closed = False
+        self.codes = codes or []
+
+    def logout(self):
+        self.closed = True
+
+    def select(self, mailbox: str):
+        return "OK", [str(len(self.codes)).encode()]
+
+    def close(self):
+        pass
+
+    def fetch(self, idx: str, parts: str):
+        msg = emaillib.message.Message()
+        msg["Date"] = "Sat, 17 Oct 2026 10:00:00 +0000"
+        msg["From"] = "info@x.com"
+        msg["Subject"] = f"Your X confirmation code is {self.codes[int(idx) - 1]}"
+        msg["Message-ID"] = f"<{idx}@x.com>"
+        return "OK", [(b"1 (RFC822)", msg.as_bytes())]
+
+
+async def test_imap_sessions_are_shared_per_mailbox(monkeypatch):
+    opened = []
+
+    def connect(email: str, password: str):
+        opened.append(email)
+        return FakeImap(email)
+
+    monkeypatch.setattr(imap, "_imap_connect", connect)
+
+    sessions = ImapSessions()
+    one = await sessions.get("user@mail.com", "pass")
+    async with sessions.lock("USER@mail.com", "pass"):
+        assert await sessions.get("USER@mail.com", "pass") is one
+
+    other = await sessions.get("other@mail.com", "pass")
+    assert other is not one
+    assert opened == ["user@mail.com", "other@mail.com"]
+
+    await sessions.close()
+    assert one.closed and other.closed
+
+
+async def test_imap_sessions_lock_mailbox(monkeypatch):
+    sessions, order = ImapSessions(), []
+
+    async def login(idx: int, email: str):
+        async with sessions.lock(email, "pass"):
+            order.append(f"start{idx}")
+            await asyncio.sleep(0.01)
+            order.append(f"end{idx}")
+
+    await asyncio.gather(login(1, "user@mail.com"), login(2, "USER@mail.com"))
+    assert order == ["start1", "end1", "start2", "end2"]
+
+
+async def test_imap_sessions_give_code_to_one_login(monkeypatch):
+    mailbox = FakeImap("user@mail.com", codes=["111111"])
+    monkeypatch.setattr(imap, "_imap_connect", lambda email, password: mailbox)
+    monkeypatch.setattr(imap, "TWS_WAIT_EMAIL_CODE", 0)
+
+    sessions = ImapSessions()
+    assert await sessions.get_email_code("user@mail.com", "pass", None) == "111111"
+
+    # next login to the same mailbox does not take code of previous one
+    with pytest.raises(imap.EmailCodeTimeoutError):
+        await sessions.get_email_code("user@mail.com", "pass", None)
+
+    mailbox.codes.append("222222")
+    assert await sessions.get_email_code("user@mail.com", "pass", None) == "222222"
+
+
+async def test_imap_sessions_drop_session_on_failure(monkeypatch):
+    monkeypatch.setattr(imap, "_imap_connect", lambda email, password: FakeImap(email))
+
+    sessions = ImapSessions()
+    one = await sessions.get("user@mail.com", "pass")
+
+    def select(mailbox: str):
+        raise OSError("connection reset")
+
+    monkeypatch.setattr(one, "select", select)
+
+    with pytest.raises(OSError):
+        await sessions.get_email_code("user@mail.com", "pass", None)
+
+    assert one.closed
+    assert await sessions.get("user@mail.com", "pass") is not one
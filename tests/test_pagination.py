@@ -7,8 +7,15 @@ Regression tests for pagination bugs:
 import json
 import os
 
-from twscrape import API, gather
+import httpx
+import pytest
+
+import twscrape.api as api_mod
+from twscrape import API, gather, telemetry
+from twscrape.api import GQL_TIMELINES, gql_op, read_timeline
+from twscrape.http import Response
 from twscrape.queue_client import QueueClient
+from twscrape.utils import find_obj, get_by_path
 
 BASE_DIR = os.path.dirname(__file__)
 DATA_DIR = os.path.join(BASE_DIR, "mocked-data")
@@ -164,3 +171,79 @@ async def test_search_stops_on_repeated_page_with_new_cursor(monkeypatch, api_mo
 
     assert len(reps) == 1
     assert calls == 2
+
+
+@pytest.mark.parametrize(
+    ("filename", "queue"),
+    [
+        ("raw_community_members", "membersSliceTimeline_Query"),
+        ("raw_community_moderators", "moderatorsSliceTimeline_Query"),
+        ("raw_community_tweets", "CommunityTweetsTimeline"),
+        ("raw_followers", "Followers"),
+        ("raw_following", "Following"),
+        ("raw_list_members", "ListMembers"),
+        ("raw_list_timeline", "ListLatestTweetsTimeline"),
+        ("raw_retweeters", "Retweeters"),
+        ("raw_search", "SearchTimeline"),
+        ("raw_subscriptions", "UserCreatorSubscriptions"),
+        ("raw_trends", "GenericTimelineById"),
+        ("raw_tweet_replies", "TweetDetail"),
+        ("raw_tweet_thread", "TweetDetail"),
+        ("raw_user_media", "UserMedia"),
+        ("raw_user_tweets", "UserTweets"),
+        ("raw_user_tweets_and_replies", "UserTweetsAndReplies"),
+        ("raw_verified_followers", "BlueVerifiedFollowers"),
+    ],
+)
+def test_read_timeline_matches_deep_search(filename, queue):
+    with open(os.path.join(DATA_DIR, f"{filename}.json")) as f:
+        obj = json.load(f)
+
+    page = read_timeline(obj, GQL_TIMELINES[queue])
+    assert page is not None
+
+    els = get_by_path(obj, "entries") or get_by_path(obj, "items_results") or []
+    cur = find_obj(obj, lambda x: x.get("cursorType") == "Bottom")
+    assert page == (els, cur["value"] if cur else get_by_path(obj, "next_cursor"))
+
+
+def test_read_timeline_finds_cursor_in_module():
+    cursor = {"cursorType": "ShowMoreThreads", "value": "more"}
+    obj = {
+        "instructions": [
+            {"type": "TimelineClearCache"},
+            {"entries": [{"entryId": "tweet-1", "content": {}}]},
+            {"moduleItems": [{"entryId": "x", "item": {"itemContent": {"cursorType": "Top"}}}]},
+            {"entry": {"content": {"items": [{"item": {"itemContent": cursor}}]}}},
+        ]
+    }
+
+    assert read_timeline(obj, "instructions", "ShowMoreThreads") == (
+        [{"entryId": "tweet-1", "content": {}}],
+        "more",
+    )
+    assert read_timeline({"instructions": {}}, "instructions") is None
+    assert read_timeline({"instructions": ["x"]}, "instructions") is None
+
+
+async def test_gql_page_reads_known_path_without_deep_search(monkeypatch, api_mock: API):
+    with open(os.path.join(DATA_DIR, "raw_followers.json")) as f:
+        rep = Response(httpx.Response(200, json=json.load(f)))
+
+    def rep_index(rep):
+        raise AssertionError("deep search")
+
+    monkeypatch.setattr(api_mod, "rep_index", rep_index)
+    els, cur = api_mock._gql_page(gql_op("hash/Followers"), rep)
+    assert len(els) == 69
+    assert cur is not None
+
+
+async def test_gql_page_falls_back_to_deep_search(api_mock: API):
+    page = make_content_page("user-1", "next")
+    rep = Response(httpx.Response(200, json=page))
+    els, cur = api_mock._gql_page(gql_op("hash/Followers"), rep)
+
+    assert [x["entryId"] for x in els] == ["user-1"]
+    assert cur == "next"
+    assert any(x["event"] == "gql_layout_fallback" for x in telemetry.snapshot())
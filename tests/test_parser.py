@@ -1,5 +1,6 @@
 import json
 import os
+from collections import defaultdict
 from typing import Any, Callable, cast
 
 import pytest
@@ -17,7 +18,7 @@ from twscrape.models import (
     parse_tweet,
     parse_tweets,
 )
-from twscrape.utils import find_obj, to_old_rep
+from twscrape.utils import RepIndex, find_obj, get_by_path, get_typed_object, to_old_rep
 
 BASE_DIR = os.path.dirname(__file__)
 DATA_DIR = os.path.join(BASE_DIR, "mocked-data")
@@ -66,6 +67,22 @@ def mock_rep(fn: Callable[..., Any], filename: str, as_generator=False):
     setattr(owner, name, cb)
 
 
+@pytest.mark.parametrize(
+    "filename", sorted(x for x in os.listdir(DATA_DIR) if x.startswith("raw_"))
+)
+def test_rep_index_matches_deep_search(filename):
+    obj = fake_rep(filename).json()
+    idx = RepIndex(obj)
+
+    assert idx.typed == get_typed_object(obj, defaultdict(list))
+    for key in RepIndex.keys:
+        assert idx.get(key) is get_by_path(obj, key)
+    for cursor_type in ("Top", "Bottom", "ShowMoreThreads"):
+        assert idx.cursors.get(cursor_type) is find_obj(
+            obj, lambda x: x.get("cursorType") == cursor_type
+        )
+
+
 @pytest.mark.parametrize("path", ["core", "author_results"])
 def test_tweet_parser_uses_embedded_author_when_users_map_is_missing(path):
     obj = to_old_rep(fake_rep("raw_search").json())
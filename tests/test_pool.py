@@ -1,7 +1,17 @@
+import asyncio
+import socket
+import subprocess
+import sys
+import time
+from unittest.mock import patch
+
 import pytest
 
-from twscrape.accounts_pool import AccountsPool, NoAccountError
+from twscrape import db
+from twscrape.account import Account, RateLimit
+from twscrape.accounts_pool import AccountsPool, NoAccountError, lease_owner, owner_alive
 from twscrape.api import API
+from twscrape.login import LoginConfig
 from twscrape.utils import utc
 
 
@@ -135,6 +145,55 @@ async def test_get_for_queue(pool_mock: AccountsPool):
     assert acc is None
 
 
+@pytest.mark.parametrize("sqlite_version", [(3, 45, 0), (3, 34, 0)])
+async def test_get_many_for_queue(pool_mock: AccountsPool, monkeypatch, sqlite_version):
+    Q = "test_queue"
+    monkeypatch.setattr("twscrape.accounts_pool.sqlite3.sqlite_version_info", sqlite_version)
+    pool_mock._order_by = "username"
+
+    for x in range(1, 5):
+        await pool_mock.add_account(f"user{x}", f"pass{x}", f"email{x}", f"email_pass{x}")
+        await pool_mock.set_active(f"user{x}", x != 4)
+
+    # should lock only available accounts, in pool order
+    accs = await pool_mock.get_many_for_queue(Q, 2)
+    assert [x.username for x in accs] == ["user1", "user2"]
+    assert all(Q in x.locks for x in accs)
+
+    accs = await pool_mock.get_many_for_queue(Q, 5)
+    assert [x.username for x in accs] == ["user3"]
+
+    assert await pool_mock.get_many_for_queue(Q, 5) == []
+    assert await pool_mock.get_many_for_queue("other_queue", 0) == []
+
+
+async def test_get_for_queue_prefers_most_budget(pool_mock: AccountsPool):
+    Q = "test_queue"
+    pool_mock._order_by = "username"
+
+    for x in range(1, 5):
+        await pool_mock.add_account(f"user{x}", f"pass{x}", f"email{x}", f"email_pass{x}")
+        await pool_mock.set_active(f"user{x}", True)
+
+    now = utc.ts()
+    await pool_mock.unlock("user1", Q, rate_limit=RateLimit(5, 50, now + 600))
+    await pool_mock.unlock("user2", Q, rate_limit=RateLimit(40, 50, now + 600))
+    await pool_mock.unlock("user3", Q, rate_limit=RateLimit(1, 50, now - 10))  # window reset
+
+    # not used accounts first, then most requests left
+    accs = await pool_mock.get_many_for_queue(Q, 4)
+    assert [x.username for x in accs] == ["user4", "user3", "user2", "user1"]
+
+    # budget is kept when header is missing on next release
+    await pool_mock.unlock("user1", Q)
+    await pool_mock.flush()
+    rs = await db.fetchone(
+        pool_mock._db_file, "SELECT * FROM account_locks WHERE username = 'user1'"
+    )
+    assert rs is not None
+    assert (rs["rl_remaining"], rs["rl_limit"], rs["rl_reset"]) == (5, 50, now + 600)
+
+
 async def test_account_unlock(pool_mock: AccountsPool):
     Q = "test_queue"
 
@@ -158,6 +217,69 @@ async def test_account_unlock(pool_mock: AccountsPool):
     assert int(acc.locks[Q].timestamp()) == end_time
 
 
+async def test_account_lease(pool_mock: AccountsPool):
+    Q = "test_queue"
+
+    await pool_mock.add_account("user1", "pass1", "email1", "email_pass1")
+    await pool_mock.set_active("user1", True)
+    acc = await pool_mock.get_for_queue(Q)
+    assert acc is not None
+    assert int(acc.locks[Q].timestamp()) == utc.ts() + pool_mock._lease_seconds
+
+    rs = await db.fetchone(pool_mock._db_file, "SELECT * FROM account_leases")
+    assert rs is not None
+    assert rs["owner"] == lease_owner()
+
+    # should extend lease
+    await db.execute(pool_mock._db_file, "UPDATE account_leases SET expires_at = :ts", {"ts": 1})
+    await pool_mock.renew("user1", Q)
+    acc = await pool_mock.get("user1")
+    assert int(acc.locks[Q].timestamp()) == utc.ts() + pool_mock._lease_seconds
+
+    # rate-limit lock replaces lease
+    await pool_mock.lock_until("user1", Q, utc.ts() + 600)
+    await pool_mock.flush()
+    assert await db.fetchall(pool_mock._db_file, "SELECT * FROM account_leases") == []
+    acc = await pool_mock.get("user1")
+    assert int(acc.locks[Q].timestamp()) == utc.ts() + 600
+
+
+async def test_expired_lease_is_reaped(pool_mock: AccountsPool):
+    Q = "test_queue"
+
+    await pool_mock.add_account("user1", "pass1", "email1", "email_pass1")
+    await pool_mock.set_active("user1", True)
+    assert await pool_mock.get_for_queue(Q) is not None
+    assert await pool_mock.get_for_queue(Q) is None
+
+    # owner stopped renewing
+    await db.execute(pool_mock._db_file, "UPDATE account_leases SET expires_at = :ts", {"ts": 1})
+    assert await pool_mock.reap_leases() == 1
+    assert await pool_mock.get_for_queue(Q) is not None
+
+
+async def test_dead_owner_lease_is_reaped(pool_mock: AccountsPool):
+    Q = "test_queue"
+
+    await pool_mock.add_account("user1", "pass1", "email1", "email_pass1")
+    await pool_mock.set_active("user1", True)
+    assert await pool_mock.get_for_queue(Q) is not None
+
+    proc = subprocess.Popen([sys.executable, "-c", "pass"])
+    proc.wait()
+
+    owner = f"{socket.gethostname()}:{proc.pid}"
+    qs = "UPDATE account_leases SET owner = :owner"
+    await db.execute(pool_mock._db_file, qs, {"owner": owner})
+    assert not owner_alive(owner)
+    assert owner_alive(lease_owner())
+
+    # should not wait for lease expiration
+    pool = AccountsPool(pool_mock._db_file, wait_timeout=0.5, wait_interval=0.1)
+    acc = await pool.get_for_queue_or_wait(Q)
+    assert acc is not None
+
+
 async def test_get_stats(pool_mock: AccountsPool):
     Q = "SearchTimeline"
 
@@ -217,6 +339,29 @@ async def test_username_lists_are_parameterized(pool_mock: AccountsPool, monkeyp
     assert await pool_mock.get_all() == []
 
 
+async def test_login_all_runs_concurrently_with_domain_limit(pool_mock: AccountsPool, monkeypatch):
+    pool = AccountsPool(pool_mock._db_file, login_config=LoginConfig(concurrency=4, per_domain=1))
+    for x in range(6):
+        await pool.add_account(f"user{x}", "pass", f"user{x}@d{x % 3}.com", "ep")
+
+    running: dict[str, int] = {}
+    peak = {"total": 0, "domain": 0}
+
+    async def fake_login(account: Account):
+        domain = account.email.split("@")[1]
+        running[domain] = running.get(domain, 0) + 1
+        peak["total"] = max(peak["total"], sum(running.values()))
+        peak["domain"] = max(peak["domain"], running[domain])
+        await asyncio.sleep(0.01)
+        running[domain] -= 1
+        return account.username != "user0"
+
+    monkeypatch.setattr(pool, "login", fake_login)
+    assert await pool.login_all() == {"total": 6, "success": 5, "failed": 1}
+    assert pool._imaps is None  # IMAP sessions closed at the end of login_all
+    assert peak == {"total": 3, "domain": 1}
+
+
 async def test_login_all_empty_username_list_is_noop(pool_mock: AccountsPool):
     assert await pool_mock.login_all([]) == {"total": 0, "success": 0, "failed": 0}
 
@@ -295,26 +440,104 @@ async def test_get_for_queue_or_wait_raises_via_env(pool_mock: AccountsPool, mon
         await pool_mock.get_for_queue_or_wait("TestQueue")
 
 
-async def test_get_for_queue_or_wait_waits_for_locked_account(pool_mock: AccountsPool, monkeypatch):
+async def test_get_for_queue_or_wait_waits_for_locked_account(pool_mock: AccountsPool):
     queue = "TestQueue"
-    pool = AccountsPool(pool_mock._db_file, wait_timeout=1, wait_interval=0.1)
+    pool = AccountsPool(pool_mock._db_file, wait_timeout=5, wait_interval=5)
     await pool.add_account("user1", "pass1", "email1", "ep1")
     await pool.set_active("user1", True)
     await pool.get_for_queue(queue)
 
-    intervals = []
-
-    async def release_account(interval):
-        intervals.append(interval)
+    async def release_account():
+        await asyncio.sleep(0.05)
         await pool.unlock("user1", queue)
 
-    monkeypatch.setattr("twscrape.accounts_pool.asyncio.sleep", release_account)
-
+    task = asyncio.create_task(release_account())
+    started = time.monotonic()
     account = await pool.get_for_queue_or_wait(queue)
+    await task
 
+    # woken by unlock, not by the fallback poll
     assert account is not None
     assert account.username == "user1"
-    assert intervals == [0.1]
+    assert time.monotonic() - started < 1
+
+
+async def test_get_for_queue_or_wait_not_missing_release_during_query(pool_mock: AccountsPool):
+    queue = "TestQueue"
+    pool = AccountsPool(pool_mock._db_file, wait_timeout=5, wait_interval=5)
+    await pool.add_account("user1", "pass1", "email1", "ep1")
+    await pool.set_active("user1", True)
+    await pool.get_for_queue(queue)
+
+    get_for_queue, calls = pool.get_for_queue, 0
+
+    async def released_while_querying(q: str):
+        nonlocal calls
+        calls += 1
+        acc = await get_for_queue(q)
+        if calls == 1:
+            await pool.unlock("user1", q)  # released right after the first query saw it locked
+        return acc
+
+    started = time.monotonic()
+    with patch.object(pool, "get_for_queue", released_while_querying):
+        account = await pool.get_for_queue_or_wait(queue)
+
+    assert account is not None
+    assert time.monotonic() - started < 1
+
+
+async def test_get_for_queue_or_wait_wakes_at_unlock_time(pool_mock: AccountsPool):
+    queue = "TestQueue"
+    pool = AccountsPool(pool_mock._db_file, wait_timeout=5, wait_interval=5)
+    await pool.add_account("user1", "pass1", "email1", "ep1")
+    await pool.set_active("user1", True)
+    await pool.lock_until("user1", queue, utc.ts() + 1)
+
+    started = time.monotonic()
+    account = await pool.get_for_queue_or_wait(queue)
+
+    assert account is not None
+    assert time.monotonic() - started < 3
+
+
+async def test_get_for_queue_or_wait_serves_waiters_in_order(pool_mock: AccountsPool):
+    queue = "TestQueue"
+    pool = AccountsPool(pool_mock._db_file, wait_timeout=5, wait_interval=5)
+    await pool.add_account("user1", "pass1", "email1", "ep1")
+    await pool.set_active("user1", True)
+    await pool.get_for_queue(queue)
+
+    order = []
+
+    async def consumer(idx: int):
+        acc = await pool.get_for_queue_or_wait(queue)
+        assert acc is not None
+        order.append(idx)
+        await pool.unlock(acc.username, queue)
+
+    tasks = []
+    for i in range(3):
+        tasks.append(asyncio.create_task(consumer(i)))
+        await asyncio.sleep(0.01)  # let each consumer get in line
+
+    await pool.unlock("user1", queue)
+    await asyncio.wait_for(asyncio.gather(*tasks), 3)
+
+    assert order == [0, 1, 2]
+    assert not pool._waiters[queue]
+
+
+async def test_get_for_queue_or_wait_timeout_in_line(pool_mock: AccountsPool):
+    queue = "TestQueue"
+    pool = AccountsPool(pool_mock._db_file, wait_timeout=0.2, wait_interval=0.05)
+    await pool.add_account("user1", "pass1", "email1", "ep1")
+    await pool.set_active("user1", True)
+    await pool.get_for_queue(queue)
+
+    rs = await asyncio.gather(*[pool.get_for_queue_or_wait(queue) for _ in range(3)])
+    assert rs == [None, None, None]
+    assert not pool._waiters[queue]
 
 
 async def test_get_for_queue_or_wait_returns_none_when_timeout_is_zero(pool_mock: AccountsPool):
@@ -367,3 +590,156 @@ async def test_load_from_file(pool_mock: AccountsPool, tmp_path):
     usernames = {x.username for x in await pool_mock.get_all()}
     assert "user1" in usernames
     assert "user2" in usernames
+
+
+async def test_load_from_file_in_chunks(pool_mock: AccountsPool, tmp_path):
+    filepath = tmp_path / "accounts.txt"
+    filepath.write_text("\n".join(f"user{x}:pass:email:ep:proxy{x}" for x in range(25)))
+
+    fmt = "username:password:email:email_password:proxy"
+    rep = await pool_mock.load_from_file(str(filepath), fmt, chunk_size=10)
+    assert rep == {"total": 25, "added": 25, "updated": 0, "deactivated": 0}
+
+    acc = await pool_mock.get("user7")
+    assert acc.proxy == "proxy7"
+    assert acc.active is False
+
+    # existing accounts are kept without sync
+    filepath.write_text("user7:pass:email:ep:other")
+    rep = await pool_mock.load_from_file(str(filepath), fmt)
+    assert rep["added"] == 0 and rep["updated"] == 0
+    assert (await pool_mock.get("user7")).proxy == "proxy7"
+
+
+async def test_load_from_file_sync(pool_mock: AccountsPool, tmp_path):
+    fmt = "username:password:email:email_password:proxy:cookies"
+    filepath = tmp_path / "accounts.txt"
+    filepath.write_text("user1:p:e:ep:proxy1:\nuser2:p:e:ep:proxy2:\nuser3:p:e:ep::")
+    await pool_mock.load_from_file(str(filepath), fmt)
+    for x in ("user1", "user2", "user3"):
+        await pool_mock.set_active(x, True)
+
+    cookies = '{"auth_token": "a", "ct0": "b"}'  # json, contains delimiter
+    filepath.write_text(f"user1:p:e:ep:proxy1:{cookies}\nUSER2:p:e:ep:new:\nuser4:p:e:ep::")
+    rep = await pool_mock.load_from_file(str(filepath), fmt, sync=True, deactivate_missing=True)
+    assert rep == {"total": 3, "added": 1, "updated": 2, "deactivated": 1}
+
+    acc = await pool_mock.get("user1")
+    assert acc.cookies == {"auth_token": "a", "ct0": "b"}
+    assert acc.active is True
+    assert (await pool_mock.get("user2")).proxy == "new"
+    assert (await pool_mock.get("user3")).active is False
+    assert (await pool_mock.get("user4")).active is False
+
+
+async def test_load_cookies_from_file(pool_mock: AccountsPool, tmp_path):
+    await pool_mock.add_account("user1", "pass1", "email1", "ep1")
+
+    filepath = tmp_path / "cookies.txt"
+    filepath.write_text("user1:auth_token=t1; ct0=c1\nuser2:auth_token=t2; ct0=c2\n")
+    rep = await pool_mock.load_from_file(str(filepath), "username:cookies")
+    assert rep["added"] == 1 and rep["updated"] == 1
+
+    accs = {x.username: x for x in await pool_mock.get_all()}
+    assert accs["user1"].password == "pass1"
+    assert accs["user1"].cookies == {"auth_token": "t1", "ct0": "c1"}
+    assert accs["user2"].login_method == "cookies"
+    assert all(x.active for x in accs.values())
+
+
+async def test_load_from_file_invalid_line_rolls_back(pool_mock: AccountsPool, tmp_path):
+    filepath = tmp_path / "cookies.txt"
+    filepath.write_text("user1:auth_token=t1; ct0=c1\nuser2:ct0=c2\n")
+
+    with pytest.raises(ValueError):
+        await pool_mock.load_from_file(str(filepath), "username:cookies")
+    assert await pool_mock.get_all() == []
+
+    with pytest.raises(ValueError):
+        await pool_mock.load_from_file(str(filepath), "username:password:email:phone")
+
+
+async def test_save_keeps_locks_and_stats(pool_mock: AccountsPool):
+    Q = "TestQueue"
+    await pool_mock.add_account("user1", "pass1", "email1", "ep1")
+
+    acc = await pool_mock.get("user1")
+    acc.locks = {Q: utc.from_ts(utc.ts() + 60)}
+    acc.stats = {Q: 7, "Other": 1}
+    await pool_mock.save(acc)
+
+    same = await pool_mock.get("user1")
+    assert same.locks == acc.locks
+    assert same.stats == acc.stats
+
+    await pool_mock.unlock("user1", Q, req_count=3)
+    same = await pool_mock.get("user1")
+    assert same.locks == {}
+    assert same.stats == {Q: 10, "Other": 1}
+
+
+@pytest.mark.parametrize("in_memory", [False, True])
+async def test_max_leases(tmp_path, in_memory: bool):
+    Q = "test_queue"
+    pool = AccountsPool(str(tmp_path / "test.db"), in_memory=in_memory, max_leases=3)
+    await pool.add_account("user1", "pass1", "email1", "email_pass1")
+    await pool.set_active("user1", True)
+
+    accs = [await pool.get_for_queue(Q) for _ in range(4)]
+    assert [x.username if x else None for x in accs] == ["user1", "user1", "user1", None]
+    assert (await pool.stats())["leases_test_queue"] == 3
+
+    # one lease released, one can be taken again
+    await pool.unlock("user1", Q)
+    assert await pool.get_for_queue(Q) is not None
+    assert await pool.get_for_queue(Q) is None
+
+    # rate limit of one lease is kept when other ones are released
+    await pool.lock_until("user1", Q, utc.ts() + 60)
+    await pool.unlock("user1", Q)
+    await pool.unlock("user1", Q)
+    assert await pool.get_for_queue(Q) is None
+    assert (await pool.get("user1")).locks[Q] is not None
+
+
+@pytest.mark.parametrize("in_memory", [False, True])
+async def test_max_leases_limited_by_budget(tmp_path, in_memory: bool):
+    Q = "test_queue"
+    pool = AccountsPool(str(tmp_path / "test.db"), in_memory=in_memory, max_leases=3)
+    await pool.add_account("user1", "pass1", "email1", "email_pass1")
+    await pool.set_active("user1", True)
+    await pool.unlock("user1", Q, rate_limit=RateLimit(2, 50, utc.ts() + 600))
+
+    accs = [await pool.get_for_queue(Q) for _ in range(3)]
+    assert [x.username if x else None for x in accs] == ["user1", "user1", None]
+
+
+@pytest.mark.parametrize("in_memory", [False, True])
+def test_release_is_kept_after_event_loop_exit(tmp_path, in_memory: bool):
+    Q, db_file = "test_queue", str(tmp_path / "test.db")
+    unlock_at = utc.ts() + 600
+
+    async def release():
+        pool = AccountsPool(db_file, in_memory=in_memory)
+        for x in ["user1", "user2"]:
+            await pool.add_account(x, "pass", f"{x}@example.com", "email_pass")
+            await pool.set_active(x, True)
+
+        assert await pool.get_for_queue(Q) is not None
+        assert await pool.get_for_queue(Q) is not None
+        await pool.lock_until("user1", Q, unlock_at)
+        await pool.mark_inactive("user2", "banned")
+        # pool is not closed, loop exits right after release
+
+    async def read():
+        pool = AccountsPool(db_file)
+        user1, user2 = await pool.get("user1"), await pool.get("user2")
+        await pool.close()
+        return user1, user2
+
+    asyncio.run(release())
+    user1, user2 = asyncio.run(read())
+
+    assert int(user1.locks[Q].timestamp()) == unlock_at
+    assert user2.active is False
+    assert user2.error_msg == "banned"
@@ -1,9 +1,12 @@
+import asyncio
 from collections import OrderedDict
 from contextlib import aclosing
+from unittest.mock import AsyncMock, patch
 
 import pytest
 
 import twscrape.queue_client as queue_client_module
+from twscrape import db
 from twscrape.account import Account
 from twscrape.accounts_pool import AccountsPool
 from twscrape.http import ConnectError, NetworkError
@@ -53,6 +56,99 @@ async def test_lock_account_when_used(client_fixture: CF):
     assert len(locked) == 0
 
 
+async def test_http_client_reused_on_next_lease(pool_mock: AccountsPool, monkeypatch):
+    clients: list[MockClient] = []
+
+    def make_client(self, proxy=None):
+        clients.append(MockClient())
+        clients[-1].backend = "httpx"
+        clients[-1].add_response(json={"ok": True}).add_response(json={"ok": True})
+        return clients[-1]
+
+    monkeypatch.setenv("TWS_HTTP_BACKEND", "httpx")
+    monkeypatch.setattr(Account, "make_client", make_client)
+    await pool_mock.add_account("user1", "p", "e", "ep", cookies="auth_token=t; ct0=c")
+
+    for _ in range(2):
+        async with QueueClient(pool_mock, "SearchTimeline") as client:
+            assert await client.get(URL) is not None
+    assert len(clients) == 1
+
+    # client is not reused after account session changed
+    acc = await pool_mock.get("user1")
+    acc.cookies["ct0"] = "c2"
+    await pool_mock.save(acc)
+    async with QueueClient(pool_mock, "SearchTimeline") as client:
+        assert await client.get(URL) is not None
+    assert len(clients) == 2
+
+
+async def test_use_pre_leased_accounts(client_fixture: CF):
+    pool, _, mock = client_fixture
+
+    clients = await QueueClient.many(pool, "SearchTimeline", 5)
+    assert [x.account.username for x in clients if x.account] == ["user1", "user2"]
+    assert await get_locked(pool) == {"user1", "user2"}
+
+    mock.add_response(json={"foo": "bar"})
+    async with clients[1] as client:
+        rep = await client.get(URL)
+        assert rep is not None
+        assert getattr(rep, "__username") == "user2"
+
+    assert await get_locked(pool) == {"user1"}
+
+
+async def test_pre_leased_account_replaced_when_lease_expired(client_fixture: CF):
+    pool, _, mock = client_fixture
+
+    clients = await QueueClient.many(pool, "SearchTimeline", 1)
+    assert clients[0].account is not None
+    assert clients[0].account.username == "user1"
+
+    # lease of user1 expired before the client was used, and another consumer took it
+    later = utc.ts() + pool._lease_seconds + 1
+    with patch.object(utc, "now", lambda: utc.from_ts(later)):
+        await pool.set_active("user2", False)
+        other = await pool.get_for_queue("SearchTimeline")
+        assert other is not None
+        assert other.username == "user1"
+        await pool.set_active("user2", True)
+
+        mock.add_response(json={"foo": "bar"})
+        async with clients[0] as client:
+            rep = await client.get(URL)
+            assert rep is not None
+            assert getattr(rep, "__username") == "user2"
+
+        # lease of the other consumer is kept
+        await pool.flush()
+        qs = "SELECT username FROM account_leases WHERE expires_at > :now"
+        rs = await db.fetchall(pool._db_file, qs, {"now": later})
+        assert [x[0] for x in rs] == ["user1"]
+
+
+async def test_lease_renewed_while_in_use(client_fixture: CF, monkeypatch):
+    pool, client, _ = client_fixture
+    monkeypatch.setattr(pool, "_lease_seconds", 0.15)
+
+    renewed = []
+
+    async def renew(username: str, queue: str):
+        renewed.append((username, queue))
+
+    monkeypatch.setattr(pool, "renew", renew)
+
+    async with client:
+        await asyncio.sleep(0.12)
+    assert renewed[:2] == [("user1", "SearchTimeline"), ("user1", "SearchTimeline")]
+
+    # should stop after release
+    count = len(renewed)
+    await asyncio.sleep(0.1)
+    assert len(renewed) == count
+
+
 async def test_do_not_switch_account_on_200(client_fixture: CF):
     pool, client, mock = client_fixture
 
@@ -227,7 +323,7 @@ async def test_queue_client_passes_effective_proxy_to_xclid(pool_mock: AccountsP
         def calc(self, *args, **kwargs):
             return "mocked-clid"
 
-    async def fake_get(cls, username, proxy=None, cookies=None, fresh=False):
+    async def fake_get(cls, username, proxy=None, cookies=None, fresh=False, **kwargs):
         seen["username"] = username
         seen["proxy"] = proxy
         seen["fresh"] = fresh
@@ -401,6 +497,28 @@ async def test_rate_limit_locks_account_and_switches(client_fixture: CF):
     await client.__aexit__(None, None, None)
 
 
+async def test_rate_limit_headers_are_saved_on_release(client_fixture: CF):
+    pool, client, mock = client_fixture
+    reset_ts = utc.ts() + 600
+
+    async with client:
+        mock.add_response(
+            json={"ok": True},
+            headers={
+                "x-rate-limit-remaining": "42",
+                "x-rate-limit-limit": "50",
+                "x-rate-limit-reset": str(reset_ts),
+            },
+        )
+        assert await client.get(URL) is not None
+
+    await pool.flush()
+    qs = "SELECT * FROM account_locks WHERE username = 'user1' AND queue = 'SearchTimeline'"
+    rs = await db.fetchone(pool._db_file, qs)
+    assert rs is not None
+    assert (rs["rl_remaining"], rs["rl_limit"], rs["rl_reset"]) == (42, 50, reset_ts)
+
+
 # --- Ban / inactive ---
 
 
@@ -799,7 +917,7 @@ async def test_404_refreshes_generator_and_retries(client_fixture: CF, monkeypat
         def calc(self, *args, **kwargs):
             return "mocked-clid"
 
-    async def fake_get(cls, username, proxy=None, cookies=None, fresh=False):
+    async def fake_get(cls, username, proxy=None, cookies=None, fresh=False, **kwargs):
         fresh_values.append(fresh)
         return FakeXClIdGen()
 
@@ -823,7 +941,7 @@ async def test_xclid_store_reuses_username_across_proxies_and_refreshes(monkeypa
     created = []
 
     async def fake_create(proxy=None, cookies=None):
-        gen = object()
+        gen = XClIdGen([1, 2, 3], f"key{len(created)}")
         created.append((proxy, cookies, gen))
         return gen
 
@@ -868,6 +986,71 @@ async def test_xclid_store_reuses_username_across_proxies_and_refreshes(monkeypa
     ]
 
 
+async def test_xclid_store_saves_generator_to_pool(pool_mock: AccountsPool, monkeypatch):
+    created = []
+
+    async def fake_create(proxy=None, cookies=None):
+        created.append(XClIdGen([1, 2, 3], f"key{len(created)}"))
+        return created[-1]
+
+    monkeypatch.setattr(XClIdGen, "create", staticmethod(fake_create))
+    await pool_mock.add_account("user1", "pass1", "email1", "email_pass1")
+    XClIdGenStore.items.clear()
+    try:
+        first = await REAL_XCLID_STORE_GET(XClIdGenStore, "user1", pool=pool_mock)
+        await pool_mock.flush()
+
+        # new process: keys are loaded from db without loading x.com page
+        XClIdGenStore.items.clear()
+        loaded = await REAL_XCLID_STORE_GET(XClIdGenStore, "user1", pool=pool_mock)
+        assert len(created) == 1
+        assert loaded is not first
+        assert (loaded.vk_bytes, loaded.anim_key) == ([1, 2, 3], "key0")
+        assert loaded.created_at == first.created_at
+
+        # expired keys are made again
+        XClIdGenStore.items.clear()
+        monkeypatch.setattr(XClIdGenStore, "ttl", 0)
+        expired = await REAL_XCLID_STORE_GET(XClIdGenStore, "user1", pool=pool_mock)
+        assert len(created) == 2 and expired.anim_key == "key1"
+    finally:
+        XClIdGenStore.items.clear()
+
+
+async def test_xclid_store_invalidates_saved_generator_on_404(client_fixture: CF, monkeypatch):
+    pool, client, mock = client_fixture
+    attempts = []
+
+    async def fake_create(proxy=None, cookies=None):
+        if attempts:
+            raise XClIdParseError("Signing script not found")
+        attempts.append(1)
+        return XClIdGen([1, 2, 3], "key")
+
+    monkeypatch.setattr(XClIdGen, "create", staticmethod(fake_create))
+    monkeypatch.setattr(XClIdGenStore, "get", classmethod(REAL_XCLID_STORE_GET))
+    monkeypatch.setattr("twscrape.queue_client.asyncio.sleep", AsyncMock())
+    XClIdGenStore.items.clear()
+    try:
+        await client.__aenter__()
+        assert client.ctx is not None
+        username = client.ctx.acc.username
+
+        mock.add_response(json={"ok": True})
+        await client.get(URL)
+        await pool.flush()
+        assert await pool.get_xclid(username, 60) is not None
+
+        # 404: saved keys are dropped, so other processes do not load them
+        mock.add_response(status_code=404, json={})
+        await client.get(URL)
+        await pool.flush()
+        assert await pool.get_xclid(username, 60) is None
+        await client.__aexit__(None, None, None)
+    finally:
+        XClIdGenStore.items.clear()
+
+
 async def test_queue_client_passes_account_cookies_to_xclid(pool_mock: AccountsPool, monkeypatch):
     mock = MockClient()
     seen = {}
@@ -876,7 +1059,7 @@ async def test_queue_client_passes_account_cookies_to_xclid(pool_mock: AccountsP
         def calc(self, *args, **kwargs):
             return "mocked-clid"
 
-    async def fake_get(cls, username, proxy=None, cookies=None, fresh=False):
+    async def fake_get(cls, username, proxy=None, cookies=None, fresh=False, **kwargs):
         seen["username"] = username
         seen["cookies"] = cookies
         seen["fresh"] = fresh
@@ -953,7 +1136,7 @@ async def test_xclid_account_error_locks_queue_and_rotates(pool_mock: AccountsPo
 
     original_get = XClIdGenStore.get.__func__
 
-    async def fake_get(cls, username, proxy=None, cookies=None, fresh=False):
+    async def fake_get(cls, username, proxy=None, cookies=None, fresh=False, **kwargs):
         if username == "user1":
             raise XClIdAccountError("Logged-out X web app")
         return await original_get(cls, username, proxy, cookies, fresh)
@@ -987,7 +1170,7 @@ async def test_xclid_parse_error_aborts_without_account_state_change(
     )
     messages = []
 
-    async def fake_get(cls, username, proxy=None, cookies=None, fresh=False):
+    async def fake_get(cls, username, proxy=None, cookies=None, fresh=False, **kwargs):
         raise XClIdParseError("Signing script not found (3/3 assets loaded)")
 
     monkeypatch.setattr(XClIdGenStore, "get", classmethod(fake_get))
@@ -1007,3 +1190,104 @@ async def test_xclid_parse_error_aborts_without_account_state_change(
     assert "backend=unknown" in messages[0]
     assert "proxy=True" in messages[0]
     assert "secret" not in messages[0]
+
+
+async def test_xclid_store_creates_generator_once_per_account(monkeypatch):
+    created = []
+
+    async def fake_create(proxy=None, cookies=None):
+        await asyncio.sleep(0.01)
+        created.append(XClIdGen([1, 2, 3], f"key{len(created)}"))
+        return created[-1]
+
+    monkeypatch.setattr(XClIdGen, "create", staticmethod(fake_create))
+    XClIdGenStore.items.clear()
+    try:
+        # burst of requests of one account
+        rs = await asyncio.gather(*[REAL_XCLID_STORE_GET(XClIdGenStore, "user1") for _ in range(5)])
+        assert len(created) == 1 and all(x is created[0] for x in rs)
+
+        # 404 storm: generator is made again once, not by every failed request
+        get = REAL_XCLID_STORE_GET
+        rs = await asyncio.gather(
+            *[get(XClIdGenStore, "user1", fresh=True, stale=created[0]) for _ in range(5)]
+        )
+        assert len(created) == 2 and all(x is created[1] for x in rs)
+        assert await get(XClIdGenStore, "user1", fresh=True, stale=created[0]) is created[1]
+    finally:
+        XClIdGenStore.items.clear()
+
+
+async def test_xclid_store_drops_least_recently_used(monkeypatch):
+    async def fake_create(proxy=None, cookies=None):
+        return XClIdGen([1, 2, 3], "key")
+
+    monkeypatch.setattr(XClIdGen, "create", staticmethod(fake_create))
+    monkeypatch.setattr(XClIdGenStore, "max_items", 2)
+    XClIdGenStore.items.clear()
+    try:
+        for x in ("user1", "user2", "user1", "user3"):
+            await REAL_XCLID_STORE_GET(XClIdGenStore, x)
+        assert list(XClIdGenStore.items) == ["user1", "user3"]
+    finally:
+        XClIdGenStore.items.clear()
+
+
+async def test_xclid_store_refreshes_outdated_generator_in_background(monkeypatch):
+    created: list[XClIdGen] = []
+    builds = iter(["b1", "b1", "b2", "b2"])
+    ready = asyncio.Event()
+
+    async def fake_create(proxy=None, cookies=None):
+        await ready.wait()
+        created.append(XClIdGen([1, 2, 3], f"key{len(created)}", build=next(builds)))
+        return created[-1]
+
+    monkeypatch.setattr(XClIdGen, "create", staticmethod(fake_create))
+    monkeypatch.setattr(XClIdGenStore, "_refresh_at", {})
+    monkeypatch.setattr(XClIdGenStore, "build", None)
+    XClIdGenStore.items.clear()
+    get = REAL_XCLID_STORE_GET
+    try:
+        ready.set()
+        user1, user2 = await get(XClIdGenStore, "user1"), await get(XClIdGenStore, "user2")
+
+        # old keys: request does not wait, new keys are swapped in when ready
+        ready.clear()
+        monkeypatch.setattr(user1, "created_at", user1.created_at - XClIdGenStore.refresh_after - 1)
+        assert await get(XClIdGenStore, "user1") is user1
+        assert XClIdGenStore.items["user1"] is user1
+        ready.set()
+        await asyncio.wait([XClIdGenStore._flight._tasks["user1"]])
+        assert XClIdGenStore.items["user1"] is created[2]
+
+        # new X web build seen with user1: user2 keys are made again too
+        assert XClIdGenStore.build == "b2"
+        assert await get(XClIdGenStore, "user2") is user2
+        await asyncio.wait([XClIdGenStore._flight._tasks["user2"]])
+        assert XClIdGenStore.items["user2"] is created[3]
+        assert len(created) == 4
+    finally:
+        XClIdGenStore.items.clear()
+
+
+async def test_xclid_store_keeps_generator_when_refresh_fails(monkeypatch):
+    async def fake_create(proxy=None, cookies=None):
+        raise XClIdParseError("Signing script not found")
+
+    monkeypatch.setattr(XClIdGenStore, "_refresh_at", {})
+    XClIdGenStore.items.clear()
+    try:
+        old = XClIdGen([1, 2, 3], "key", created_at=1)
+        XClIdGenStore.items["user1"] = old
+        monkeypatch.setattr(XClIdGen, "create", staticmethod(fake_create))
+
+        assert await REAL_XCLID_STORE_GET(XClIdGenStore, "user1") is old
+        await asyncio.wait([XClIdGenStore._flight._tasks["user1"]])
+        assert XClIdGenStore.items["user1"] is old
+
+        # not tried again right away
+        assert await REAL_XCLID_STORE_GET(XClIdGenStore, "user1") is old
+        assert "user1" not in XClIdGenStore._flight._tasks
+    finally:
+        XClIdGenStore.items.clear()
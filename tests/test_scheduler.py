@@ -0,0 +1,136 @@
+import sqlite3
+
+import pytest
+
+from twscrape import db
+from twscrape.account import Account, RateLimit
+from twscrape.accounts_pool import AccountsPool
+from twscrape.queue_client import QueueClient
+from twscrape.utils import utc
+
+from .mock_http import MockClient
+
+Q = "SearchTimeline"
+
+
+@pytest.fixture
+async def pool(tmp_path):
+    pool = AccountsPool(str(tmp_path / "test.db"), in_memory=True)
+    for x in range(1, 4):
+        await pool.add_account(f"user{x}", "pass", "email", "ep")
+        await pool.set_active(f"user{x}", True)
+
+    yield pool
+    await pool.close()
+
+
+async def test_acquire_and_release(pool: AccountsPool):
+    acc1 = await pool.get_for_queue(Q)
+    acc2 = await pool.get_for_queue(Q)
+    acc3 = await pool.get_for_queue(Q)
+    assert acc1 and acc2 and acc3
+    assert {acc1.username, acc2.username, acc3.username} == {"user1", "user2", "user3"}
+    assert await pool.get_for_queue(Q) is None
+
+    await pool.unlock(acc2.username, Q, req_count=5)
+    acc = await pool.get_for_queue(Q)
+    assert acc is not None
+    assert acc.username == acc2.username
+    assert acc.stats[Q] == 5
+
+
+async def test_acquire_many(pool: AccountsPool):
+    accs = await pool.get_many_for_queue(Q, 2)
+    assert len(accs) == 2
+    assert len(await pool.get_many_for_queue(Q, 2)) == 1
+    await pool.flush()
+
+    rs = await db.fetchall(pool._db_file, "SELECT * FROM account_leases")
+    assert len(rs) == 3
+
+
+async def test_changes_are_persisted(pool: AccountsPool):
+    acc = await pool.get_for_queue(Q)
+    assert acc is not None
+    await pool.lock_until(acc.username, Q, utc.ts() + 60, req_count=2)
+    await pool.flush()
+
+    rs = await db.fetchone(pool._db_file, "SELECT * FROM account_locks WHERE username = 'user1'")
+    assert rs is not None
+    assert rs["unlock_at"] == utc.ts() + 60
+    assert rs["req_count"] == 2
+
+
+async def test_acquire_prefers_most_budget(pool: AccountsPool):
+    now = utc.ts()
+    await pool.unlock("user1", Q, rate_limit=RateLimit(5, 50, now + 600))
+    await pool.unlock("user2", Q, rate_limit=RateLimit(40, 50, now + 600))
+    await pool.unlock("user3", Q, rate_limit=RateLimit(10, 50, now + 600))
+
+    accs = await pool.get_many_for_queue(Q, 3)
+    assert [x.username for x in accs] == ["user2", "user3", "user1"]
+
+    # budget is loaded from database too
+    await pool.unlock("user1", Q, rate_limit=RateLimit(45, 50, now + 600))
+    await pool.flush()
+    assert pool._sched is not None
+    pool._sched.invalidate()
+    acc = await pool.get_for_queue(Q)
+    assert acc is not None and acc.username == "user1"
+
+
+async def test_next_unlock_at_from_memory(pool: AccountsPool):
+    now = utc.ts()
+    for x in range(1, 4):
+        await pool.lock_until(f"user{x}", Q, now + 60 * x)
+
+    assert await pool.get_for_queue(Q) is None
+    assert await pool._next_unlock_at(Q) == now + 60
+
+
+async def test_mark_inactive_skips_account(pool: AccountsPool):
+    await pool.get_for_queue(Q)  # load accounts
+    await pool.mark_inactive("user1", "banned")
+
+    usernames = set()
+    while acc := await pool.get_for_queue(Q):
+        usernames.add(acc.username)
+    assert usernames == {"user2", "user3"}
+
+
+async def test_reload_on_external_change(pool: AccountsPool):
+    assert pool._sched is not None
+    pool._sched._refresh_interval = 0
+    while await pool.get_for_queue(Q):
+        pass
+    await pool.flush()
+
+    # other process runs `twscrape reset_locks`
+    with sqlite3.connect(pool._db_file) as conn:
+        conn.execute("DELETE FROM account_leases")
+
+    acc = await pool.get_for_queue(Q)
+    assert acc is not None
+
+
+async def test_reload_on_own_change(pool: AccountsPool):
+    while await pool.get_for_queue(Q):
+        pass
+
+    await pool.reset_locks()
+    assert await pool.get_for_queue(Q) is not None
+
+
+async def test_queue_client_with_scheduler(pool: AccountsPool, monkeypatch):
+    mock = MockClient()
+    monkeypatch.setattr(Account, "make_client", lambda self, proxy=None: mock)
+    await pool.add_account_cookies("user1", "auth_token=token; ct0=csrf")
+
+    async with QueueClient(pool, Q) as client:
+        mock.add_response(json={"foo": "bar"})
+        rep = await client.get("https://example.com/api")
+        assert rep is not None
+
+    acc = await pool.get("user1")
+    assert Q not in acc.locks
+    assert acc.stats[Q] == 1
@@ -0,0 +1,92 @@
+import pytest
+
+from twscrape import db
+from twscrape.account import RateLimit
+from twscrape.accounts_pool import AccountsPool
+from twscrape.strategy import STRATEGIES, RoundRobinStrategy, get_strategy
+from twscrape.utils import utc
+
+Q = "SearchTimeline"
+
+
+async def make_pool(tmp_path, strategy, in_memory: bool) -> AccountsPool:
+    pool = AccountsPool(str(tmp_path / "test.db"), in_memory=in_memory, strategy=strategy)
+    for x in range(1, 5):
+        await pool.add_account(f"user{x}", "pass", "email", "ep")
+        await pool.set_active(f"user{x}", True)
+    return pool
+
+
+async def use(pool: AccountsPool, rate_limit: RateLimit | None = None) -> str:
+    acc = await pool.get_for_queue(Q)
+    assert acc is not None
+    await pool.unlock(acc.username, Q, req_count=1, rate_limit=rate_limit)
+    return acc.username
+
+
+def test_get_strategy():
+    assert isinstance(get_strategy("round_robin"), RoundRobinStrategy)
+    strategy = RoundRobinStrategy()
+    assert get_strategy(strategy) is strategy
+
+    with pytest.raises(ValueError, match="Unknown strategy"):
+        get_strategy("username")
+
+
+@pytest.mark.parametrize("in_memory", [False, True])
+@pytest.mark.parametrize("strategy", list(STRATEGIES))
+async def test_strategy_uses_whole_pool(tmp_path, strategy: str, in_memory: bool):
+    pool = await make_pool(tmp_path, strategy, in_memory)
+    usernames = [await use(pool) for _ in range(40)]
+    assert set(usernames) == {"user1", "user2", "user3", "user4"}
+
+
+@pytest.mark.parametrize("in_memory", [False, True])
+@pytest.mark.parametrize("strategy", ["round_robin", "lru", "budget"])
+async def test_strategy_rotates(tmp_path, strategy: str, in_memory: bool):
+    pool = await make_pool(tmp_path, strategy, in_memory)
+    usernames = [await use(pool) for _ in range(6)]
+    assert usernames == ["user1", "user2", "user3", "user4", "user1", "user2"]
+
+
+@pytest.mark.parametrize("in_memory", [False, True])
+async def test_lru(tmp_path, in_memory: bool):
+    pool = AccountsPool(str(tmp_path / "test.db"), in_memory=in_memory, strategy="lru")
+    for x, ago in (("user1", 10), ("user2", 30), ("user3", None), ("user4", 20)):
+        await pool.add_account(x, "pass", "email", "ep")
+        acc = await pool.get(x)
+        acc.active = True
+        acc.last_used = utc.from_ts(utc.ts() - ago) if ago else None
+        await pool.save(acc)
+
+    accs = await pool.get_many_for_queue(Q, 4)
+    assert [x.username for x in accs] == ["user3", "user2", "user4", "user1"]
+
+
+@pytest.mark.parametrize("in_memory", [False, True])
+async def test_weighted_prefers_healthy(tmp_path, in_memory: bool):
+    pool = await make_pool(tmp_path, "weighted", in_memory)
+    reset = utc.ts() + 600
+    for x in ("user1", "user2", "user3"):
+        await pool.unlock(x, Q, rate_limit=RateLimit(1, 50, reset))
+
+    # user4 has full window and others 2% of it (5% min weight), so it is mostly first
+    first = []
+    for _ in range(20):
+        accs = await pool.get_many_for_queue(Q, 4)
+        first.append(accs[0].username)
+        for x in accs:
+            await pool.unlock(x.username, Q)
+    assert first.count("user4") >= 12
+
+
+async def test_weighted_sql_is_proportional(tmp_path):
+    pool = await make_pool(tmp_path, "weighted", in_memory=False)
+    # health 1.0 against 0.5: exponential race picks first 2 / 3 of times
+    qs = """
+    WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 6000)
+    SELECT AVG(EXP_RANDOM(1.0) < EXP_RANDOM(0.5)) FROM n
+    """
+    rs = await db.fetchone(pool._db_file, qs)
+    assert rs is not None
+    assert 0.63 < rs[0] < 0.70
@@ -1,3 +1,5 @@
+import asyncio
+from collections import OrderedDict
 from unittest.mock import MagicMock, call
 
 import pytest
@@ -32,7 +34,7 @@ async def test_xclid_create_passes_proxy_and_cookies_to_client(monkeypatch):
         seen["client"] = clt
         return "<html></html>"
 
-    async def fake_load_keys(soup, clt):
+    async def fake_load_keys(text, clt):
         seen["load_client"] = clt
         return [1, 2, 3], "anim-key"
 
@@ -71,7 +73,7 @@ async def test_xclid_create_without_proxy_or_cookies(monkeypatch):
     async def fake_get_tw_page_text(url, clt):
         return "<html></html>"
 
-    async def fake_load_keys(soup, clt):
+    async def fake_load_keys(text, clt):
         return [1, 2, 3], "anim-key"
 
     monkeypatch.setattr(xclid, "_make_http_client", fake_make_client)
@@ -172,3 +174,119 @@ async def test_find_indices_url_returns_reference_despite_unrelated_failure():
     )
 
     assert url == "https://x.test/assets/sign.o-abc123.js"
+
+
+async def test_parse_anim_idx_is_shared_by_pages_of_same_build(monkeypatch):
+    monkeypatch.setattr(xclid, "_indices", OrderedDict())
+    page = '<script src="https://abs.twimg.com/x-web/assets/main.abc.js"></script>'
+
+    client = MockClient()
+    client.add_response(text='import("./sign.o-abc123.js")')
+    client.add_response(text="x(a[1], 16); y(a[22], 16)")
+
+    # concurrent lookups download bundles once, later ones do not download at all
+    rs = await asyncio.gather(*[xclid.parse_anim_idx(page, client) for _ in range(3)])
+    assert rs == [[1, 22]] * 3
+    assert await xclid.parse_anim_idx(page, client) == [1, 22]
+
+    # other build is looked up again
+    client.add_response(text='import("./sign.o-def456.js")')
+    client.add_response(text="x(a[3], 16)")
+    assert await xclid.parse_anim_idx(page.replace("abc", "def"), client) == [3]
+
+
+async def test_parse_anim_idx_uses_disk_cache_of_bundles(tmp_path, monkeypatch):
+    monkeypatch.setenv("TWS_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(xclid, "_indices", OrderedDict())
+    page = (
+        '<script src="https://abs.twimg.com/x-web/assets/a.abc.js"></script>'
+        '<script src="https://abs.twimg.com/x-web/assets/b.abc.js"></script>'
+    )
+
+    client = MockClient()
+    client.add_response(text="no reference here")
+    client.add_response(text='import("./sign.o-abc123.js")')
+    client.add_response(text="x(a[1], 16); y(a[22], 16)")
+    assert await xclid.parse_anim_idx(page, client) == [1, 22]
+
+    # new process: bundles are not loaded again
+    monkeypatch.setattr(xclid, "_indices", OrderedDict())
+    assert await xclid.parse_anim_idx(page, client) == [1, 22]
+
+    # new build: only new bundle is loaded, a.abc.js is known to have no reference
+    monkeypatch.setattr(xclid, "_indices", OrderedDict())
+    client.add_response(text='import("./sign.o-def456.js")')
+    client.add_response(text="x(a[3], 16)")
+    assert await xclid.parse_anim_idx(page.replace("b.abc", "b.def"), client) == [3]
+
+    # disabled cache
+    monkeypatch.setenv("TWS_CACHE_DIR", "")
+    assert xclid.load_assets_cache() == {}
+
+
+def _page(svg: str) -> str:
+    key = "AQIDBAUGBwgJCgsMDQ4PEA=="  # bytes 1..16
+    return (
+        f'<html><head><meta content="{key}" name="twitter-site-verification"/></head><body>'
+        f"{svg}</body></html>"
+    )
+
+
+def _anim_svg(idx: int) -> str:
+    return (
+        f'<svg id="loading-x-anim-{idx}" viewBox="0 0 100 100">'
+        '<g><path d="M0 0"></path>'
+        f'<path d="M 10,30 C {idx} 1 2 3 4 5 6 7 8 9 10 C 11 12 13 14 15 16"/></g>'
+        "</svg>"
+    )
+
+
+@pytest.mark.parametrize(
+    "svg",
+    [
+        "".join(_anim_svg(x) for x in range(4)),
+        '<svg id="loading-x-anim-0">\n  <g>\n    <path d="M0"/>\n  </g>\n</svg>' + _anim_svg(1),
+    ],
+)
+def test_extract_page_fast_matches_soup(svg):
+    page = _page(svg)
+    rs = xclid.extract_page_fast(page)
+    assert rs is not None
+    assert rs == xclid.extract_page_soup(page)
+
+
+def test_parse_page():
+    vk_bytes, anim_arr = xclid.parse_page(_page("".join(_anim_svg(x) for x in range(4))))
+    assert vk_bytes == list(range(1, 17))
+    assert anim_arr == [[2, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10], [11, 12, 13, 14, 15, 16]]  # 6 % 4
+
+
+@pytest.mark.parametrize(
+    ("svg", "paths"),
+    [
+        # nested group is also matched by css selector
+        (
+            '<svg id="loading-x-anim-0"><g><path d="M0"/><path d="M 10,30 C 1 2"/>'
+            '<g><path d="M0"/><path d="M 10,30 C 3 4"/></g></g></svg>',
+            ["M 10,30 C 1 2", "M 10,30 C 3 4"],
+        ),
+        # first child is not a group
+        (
+            '<svg id="loading-x-anim-0"><defs/><g><path d="M0"/><path d="M 10,30 C 1"/></g></svg>',
+            [],
+        ),
+    ],
+)
+def test_extract_page_falls_back_to_soup(svg, paths, monkeypatch):
+    page = _page(svg)
+    assert xclid.extract_page_fast(page) is None
+
+    soup = MagicMock(wraps=xclid.extract_page_soup)
+    monkeypatch.setattr(xclid, "extract_page_soup", soup)
+    assert xclid.extract_page(page) == ("AQIDBAUGBwgJCgsMDQ4PEA==", paths)
+    assert soup.call_count == 1
+
+
+def test_parse_page_without_verification_key():
+    with pytest.raises(xclid.XClIdParseError, match="X verification key not found"):
+        xclid.parse_page(f"<html><body>{_anim_svg(0)}</body></html>")
@@ -19,6 +19,21 @@ def has_required_cookies(cookies: dict[str, str]) -> bool:
     return all(cookies.get(name) for name in ("auth_token", "ct0"))
 
 
+UNKNOWN_BUDGET = 1 << 30  # no rate limit headers seen for (account, queue) yet
+
+
+@dataclass
+class RateLimit:
+    # x-rate-limit-* headers of last response for (account, queue)
+    remaining: int
+    limit: int
+    reset: int  # unix time
+
+    def budget(self, now: int) -> int:
+        # requests left for account: full window after reset time
+        return max(self.limit, self.remaining) if self.reset <= now else self.remaining
+
+
 @dataclass
 class Account(JSONTrait):
     username: str
@@ -48,8 +63,14 @@ class Account(JSONTrait):
     @staticmethod
     def from_rs(rs: sqlite3.Row):
         doc = dict(rs)
-        doc["locks"] = {k: utc.from_iso(v) for k, v in json.loads(doc["locks"]).items()}
-        doc["stats"] = {k: v for k, v in json.loads(doc["stats"]).items() if isinstance(v, int)}
+        # since db v5 locks & stats live in account_locks table and selected as _locks / _stats
+        locks = json.loads(doc.pop("_locks", None) or doc["locks"])
+        stats = json.loads(doc.pop("_stats", None) or doc["stats"])
+        doc["locks"] = {
+            k: utc.from_ts(v) if isinstance(v, (int, float)) else utc.from_iso(v)
+            for k, v in locks.items()
+        }
+        doc["stats"] = {k: v for k, v in stats.items() if isinstance(v, int)}
         doc["headers"] = json.loads(doc["headers"])
         doc["cookies"] = json.loads(doc["cookies"])
         doc["active"] = bool(doc["active"])
@@ -70,6 +91,11 @@ class Account(JSONTrait):
         proxies = [x for x in proxies if x is not None]
         return parse_proxy(proxies[0]) if proxies else None
 
+    def client_fingerprint(self) -> str:
+        # HTTP client made by make_client can be reused while this stays the same
+        doc = [self.user_agent, self.headers, self.cookies]
+        return hashlib.sha256(json.dumps(doc, sort_keys=True).encode()).hexdigest()
+
     def make_client(self, proxy: str | None = None) -> HttpClient:
         proxy = self.resolve_proxy(proxy)
         headers = {**self.headers}
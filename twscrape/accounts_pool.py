@@ -1,15 +1,26 @@
 import asyncio
+import base64
+import itertools
 import json
+import os
+import socket
 import sqlite3
-import uuid
+import time
+from collections import defaultdict, deque
 from datetime import datetime, timezone
-from typing import TypedDict
+from typing import Iterator, TypedDict
 
-from .account import Account, has_required_cookies
-from .db import execute, fetchall, fetchone
+import aiosqlite
+
+from . import db
+from .account import Account, RateLimit, has_required_cookies
+from .db import execute, fetchall, fetchone, transaction
 from .http import HttpStatusError
+from .imap import ImapSessions
 from .logger import logger
 from .login import LoginConfig, login
+from .scheduler import AccountScheduler
+from .strategy import BUDGET_SQL, Strategy, get_strategy
 from .utils import get_env_bool, parse_cookies, utc
 
 
@@ -27,14 +38,96 @@ class AccountInfo(TypedDict):
     error_msg: str | None
 
 
+# locks & stats are stored per (username, queue) in account_locks and folded back
+# into json objects here, so Account.from_rs keeps the same locks / stats dicts;
+# in-use leases are shown as locks too
+ACCOUNTS_QS = """
+SELECT a.*,
+    (SELECT json_group_object(queue, unlock_at) FROM (
+        SELECT queue, MAX(unlock_at) AS unlock_at FROM (
+            SELECT queue, unlock_at FROM account_locks
+            WHERE username = a.username AND unlock_at IS NOT NULL
+            UNION ALL
+            SELECT queue, expires_at FROM account_leases WHERE username = a.username
+        ) GROUP BY queue
+    )) AS _locks,
+    (SELECT json_group_object(l.queue, l.req_count) FROM account_locks l
+     WHERE l.username = a.username AND l.req_count > 0) AS _stats
+FROM accounts a
+"""
+
+
+def lease_owner() -> str:
+    # host & pid, so the reaper can free leases of dead processes on the same host right away
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def owner_alive(owner: str) -> bool:
+    host, _, pid = owner.rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit() or os.name == "nt":
+        return True  # unknown, lease expires by itself
+
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass  # exists, but owned by other user
+    return True
+
+
 def guess_delim(line: str):
     lp, rp = tuple([x.strip() for x in line.split("username")])
     return rp[0] if not lp else lp[-1]
 
 
+IMPORT_REQUIRED = {"username", "password", "email", "email_password"}
+IMPORT_COLUMNS = {*IMPORT_REQUIRED, "user_agent", "proxy", "cookies", "mfa_code"}
+
+
+def read_lines(filepath: str, line_format: str) -> Iterator[dict[str, str]]:
+    line_delim = guess_delim(line_format)
+    tokens = line_format.split(line_delim)
+    # cookies may contain delimiter (eg. json), so when last they take the rest of line
+    maxsplit = len(tokens) - 1 if tokens[-1] == "cookies" else -1
+
+    with open(filepath) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+
+            data = [x.strip() for x in line.split(line_delim, maxsplit)]
+            if len(data) < len(tokens):
+                raise ValueError(f"Invalid line: {line}")
+
+            yield {k: v for k, v in zip(tokens, data) if k != "_"}
+
+
+def import_row(vals: dict[str, str], cookies_only=False) -> dict:
+    cookies = parse_cookies(vals["cookies"]) if vals.get("cookies", "") else None
+    if cookies_only and (cookies is None or not has_required_cookies(cookies)):
+        raise ValueError(f"Cookies must include auth_token and ct0: {vals['username']}")
+
+    return {
+        "username": vals["username"],
+        "password": vals.get("password", "_"),
+        "email": vals.get("email", "_"),
+        "email_password": vals.get("email_password", "_"),
+        "user_agent": vals.get("user_agent") or "@chrome",
+        "active": cookies is not None and has_required_cookies(cookies),
+        "cookies": json.dumps(cookies) if cookies is not None else None,
+        "proxy": vals.get("proxy") or None,
+        "mfa_code": vals.get("mfa_code") or None,
+    }
+
+
 class AccountsPool:
-    # _order_by: str = "RANDOM()"
+    # tie-break for accounts equal by selection strategy
     _order_by: str = "username"
+    # accounts are leased for a short time and renewed by QueueClient while in use,
+    # so accounts of crashed workers are not blocked for long
+    _lease_seconds: int = 60
 
     def __init__(
         self,
@@ -43,8 +136,16 @@ class AccountsPool:
         raise_when_no_account=False,
         wait_timeout: float | None = None,
         wait_interval: float = 5.0,
+        in_memory=False,
+        strategy: str | Strategy = "budget",
+        max_leases: int = 1,
     ):
         self._db_file = db_file
+        # order of free accounts: budget, lru, round_robin, weighted, random (see strategy.py)
+        self._strategy = get_strategy(strategy)
+        # concurrent leases of account per queue (eg. parallel paginations); extra ones are
+        # only given while last seen rate limit budget allows
+        self._max_leases = max(int(max_leases), 1)
         self._login_config = login_config or LoginConfig()
         self._raise_when_no_account = raise_when_no_account
         # When every active account is momentarily locked (in-use or rate-limited),
@@ -55,36 +156,125 @@ class AccountsPool:
         # (raise immediately if raise_when_no_account, otherwise block forever).
         self._wait_timeout = wait_timeout
         self._wait_interval = wait_interval
+        self._waiters: defaultdict[str, deque[asyncio.Event]] = defaultdict(deque)
+        self._imaps: ImapSessions | None = None  # set while login_all runs
+        # Opt-in: keep account selection in memory and persist it in background. Only safe
+        # to share the db file with other processes for occasional changes (cli commands).
+        self._sched = AccountScheduler(self) if in_memory else None
+
+    async def flush(self):
+        """Wait until pending account bookkeeping (locks, stats, etc.) is written."""
+        await db.flush(self._db_file)
+
+    async def close(self):
+        """Write pending bookkeeping and close database connection."""
+        await db.close(self._db_file)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    def _changed(self):
+        if self._sched is not None:
+            self._sched.invalidate()
+        self._notify()
 
     @staticmethod
     def _usernames_where(usernames: list[str]) -> tuple[str, dict[str, str]]:
         params = {f"username_{i}": x for i, x in enumerate(dict.fromkeys(usernames))}
         return ",".join(f":{x}" for x in params), params
 
-    async def load_from_file(self, filepath: str, line_format: str):
-        line_delim = guess_delim(line_format)
-        tokens = line_format.split(line_delim)
+    async def load_from_file(
+        self,
+        filepath: str,
+        line_format: str,
+        sync=False,
+        deactivate_missing=False,
+        chunk_size=1000,
+    ):
+        """
+        Import accounts from file in one transaction. Existing accounts are kept as is,
+        unless `sync` is set: then proxy / cookies from file replace changed values and,
+        with `deactivate_missing`, accounts not listed in file are deactivated.
+
+        Format without `password` (eg. `username:cookies`) imports cookie accounts, same as
+        `add_account_cookies` does for one account.
+        """
+        tokens = line_format.split(guess_delim(line_format))
 
-        required = {"username", "password", "email", "email_password"}
-        if not required.issubset(tokens):
+        unknown = set(tokens) - {*IMPORT_COLUMNS, "_"}
+        cookies_only = "password" not in tokens
+        required = {"username", "cookies"} if cookies_only else IMPORT_REQUIRED
+        if unknown or not required.issubset(tokens):
             raise ValueError(f"Invalid line format: {line_format}")
 
-        accounts = []
-        with open(filepath) as f:
-            lines = f.read().split("\n")
-            lines = [x.strip() for x in lines if x.strip()]
-
-            for line in lines:
-                data = [x.strip() for x in line.split(line_delim)]
-                if len(data) < len(tokens):
-                    raise ValueError(f"Invalid line: {line}")
+        # account fields are updated only when they are present in file
+        changes = [x for x in ("proxy", "cookies") if x in tokens]
+        if not (sync or cookies_only):
+            changes = []
+
+        update_qs = None
+        if changes:
+            # cookies: keep headers & state when they are same or not set in line
+            same = "(:cookies IS NULL OR cookies IS :cookies)"
+            sets, where = [], []
+            if "proxy" in changes:
+                sets.append("proxy = :proxy")
+                where.append("proxy IS NOT :proxy")
+            if "cookies" in changes:
+                sets.append("cookies = COALESCE(:cookies, cookies)")
+                sets.append(f"headers = CASE WHEN {same} THEN headers ELSE '{{}}' END")
+                sets.append(f"active = CASE WHEN {same} THEN active ELSE :active END")
+                sets.append(f"error_msg = CASE WHEN {same} THEN error_msg ELSE NULL END")
+                where.append(f"NOT {same}")
+
+            update_qs = f"""
+            UPDATE accounts SET {", ".join(sets)}
+            WHERE username = :username AND ({" OR ".join(where)})
+            """
 
-                data = data[: len(tokens)]
-                vals = {k: v for k, v in zip(tokens, data) if k != "_"}
-                accounts.append(vals)
+        insert_qs = """
+        INSERT INTO accounts
+            (username, password, email, email_password, user_agent, active, cookies, proxy, mfa_code)
+        VALUES
+            (:username, :password, :email, :email_password, :user_agent, :active,
+             COALESCE(:cookies, '{}'), :proxy, :mfa_code)
+        ON CONFLICT(username) DO NOTHING
+        """
 
-        for x in accounts:
-            await self.add_account(**x)
+        await self.flush()
+        counter = {"total": 0, "added": 0, "updated": 0, "deactivated": 0}
+        usernames: set[str] = set()
+
+        async def fn(db: aiosqlite.Connection):
+            rows = (import_row(x, cookies_only) for x in read_lines(filepath, line_format))
+            while chunk := list(itertools.islice(rows, chunk_size)):
+                counter["total"] += len(chunk)
+                async with db.executemany(insert_qs, chunk) as cur:
+                    counter["added"] += cur.rowcount
+                if update_qs is not None:
+                    async with db.executemany(update_qs, chunk) as cur:
+                        counter["updated"] += cur.rowcount
+                if deactivate_missing:
+                    usernames.update(x["username"] for x in chunk)
+
+            if sync and deactivate_missing:
+                qs = """
+                UPDATE accounts SET active = false, error_msg = 'Not in accounts file'
+                WHERE active = true AND username NOT IN (SELECT value FROM json_each(:usernames))
+                """
+                params = {"usernames": json.dumps(list(usernames))}
+                async with db.execute(qs, params) as cur:
+                    counter["deactivated"] += cur.rowcount
+
+        await transaction(self._db_file, fn)
+        self._changed()
+
+        msg = ", ".join(f"{k}={v}" for k, v in counter.items())
+        logger.info(f"Accounts imported from {filepath}: {msg}")
+        return counter
 
     async def add_account(
         self,
@@ -128,6 +318,7 @@ class AccountsPool:
         parsed = parse_cookies(cookies)
         if not has_required_cookies(parsed):
             raise ValueError("Cookies must include auth_token and ct0")
+        await self.flush()
 
         qs = """
         INSERT INTO accounts (username, password, email, email_password, user_agent, active, cookies)
@@ -139,6 +330,7 @@ class AccountsPool:
             error_msg = NULL
         """
         await execute(self._db_file, qs, {"username": username, "cookies": json.dumps(parsed)})
+        self._changed()
         logger.info(f"Cookies for account {username} updated successfully")
 
     async def delete_accounts(self, usernames: str | list[str]):
@@ -147,46 +339,104 @@ class AccountsPool:
             logger.warning("No usernames provided")
             return
 
+        await self.flush()
         placeholders, params = self._usernames_where(usernames)
-        qs = f"DELETE FROM accounts WHERE username IN ({placeholders})"
-        await execute(self._db_file, qs, params)
+
+        async def fn(db: aiosqlite.Connection):
+            qs = f"DELETE FROM account_locks WHERE username IN ({placeholders})"
+            await db.execute(qs, params)
+            qs = f"DELETE FROM account_leases WHERE username IN ({placeholders})"
+            await db.execute(qs, params)
+            qs = f"DELETE FROM xclid WHERE username IN ({placeholders})"
+            await db.execute(qs, params)
+            qs = f"DELETE FROM accounts WHERE username IN ({placeholders})"
+            await db.execute(qs, params)
+
+        await transaction(self._db_file, fn)
+        self._changed()
 
     async def delete_inactive(self):
-        qs = "DELETE FROM accounts WHERE active = false"
-        await execute(self._db_file, qs)
+        await self.flush()
+
+        async def fn(db: aiosqlite.Connection):
+            for table in ("account_locks", "account_leases", "xclid"):
+                qs = f"""
+                DELETE FROM {table}
+                WHERE username IN (SELECT username FROM accounts WHERE active = false)
+                """
+                await db.execute(qs)
+            await db.execute("DELETE FROM accounts WHERE active = false")
+
+        await transaction(self._db_file, fn)
+        self._changed()
 
     async def get(self, username: str):
-        qs = "SELECT * FROM accounts WHERE username = :username"
+        await self.flush()
+        qs = f"{ACCOUNTS_QS} WHERE a.username = :username"
         rs = await fetchone(self._db_file, qs, {"username": username})
         if not rs:
             raise ValueError(f"Account {username} not found")
         return Account.from_rs(rs)
 
     async def get_all(self):
-        qs = "SELECT * FROM accounts"
+        await self.flush()
+        qs = ACCOUNTS_QS
         rs = await fetchall(self._db_file, qs)
         return [Account.from_rs(x) for x in rs]
 
     async def get_account(self, username: str):
-        qs = "SELECT * FROM accounts WHERE username = :username"
+        await self.flush()
+        qs = f"{ACCOUNTS_QS} WHERE a.username = :username"
         rs = await fetchone(self._db_file, qs, {"username": username})
         if not rs:
             return None
         return Account.from_rs(rs)
 
     async def save(self, account: Account):
+        await self.flush()
         data = account.to_rs()
-        cols = list(data.keys())
+        # locks & stats go to account_locks, json columns in accounts are legacy
+        cols = [x for x in data if x not in ("locks", "stats")]
 
         qs = f"""
         INSERT INTO accounts ({",".join(cols)}) VALUES ({",".join([f":{x}" for x in cols])})
         ON CONFLICT(username) DO UPDATE SET {",".join([f"{x}=excluded.{x}" for x in cols])}
         """
-        await execute(self._db_file, qs, data)
+
+        locks = [
+            {
+                "username": account.username,
+                "queue": queue,
+                "unlock_at": int(lock.timestamp()) if (lock := account.locks.get(queue)) else None,
+                "req_count": account.stats.get(queue, 0),
+            }
+            for queue in {*account.locks.keys(), *account.stats.keys()}
+        ]
+
+        async def fn(db: aiosqlite.Connection):
+            await db.execute(qs, {x: data[x] for x in cols})
+            # rate limit budget is not part of Account, so rows are reset instead of deleted
+            await db.execute(
+                "UPDATE account_locks SET unlock_at = NULL, req_count = 0 WHERE username = :username",
+                {"username": account.username},
+            )
+            await db.executemany(
+                """
+                INSERT INTO account_locks (username, queue, unlock_at, req_count)
+                VALUES (:username, :queue, :unlock_at, :req_count)
+                ON CONFLICT(username, queue) DO UPDATE SET
+                    unlock_at = excluded.unlock_at,
+                    req_count = excluded.req_count
+                """,
+                locks,
+            )
+
+        await transaction(self._db_file, fn)
+        self._changed()
 
     async def login(self, account: Account):
         try:
-            await login(account, cfg=self._login_config)
+            await login(account, cfg=self._login_config, imaps=self._imaps)
             logger.info(f"Logged in to {account.username} successfully")
             return True
         except HttpStatusError as e:
@@ -206,23 +456,46 @@ class AccountsPool:
         if usernames is not None and not usernames:
             return {"total": 0, "success": 0, "failed": 0}
 
+        await self.flush()
         params = None
         if usernames is None:
-            qs = "SELECT * FROM accounts WHERE active = false AND error_msg IS NULL"
+            qs = f"{ACCOUNTS_QS} WHERE a.active = false AND a.error_msg IS NULL"
         else:
             placeholders, params = self._usernames_where(usernames)
-            qs = f"SELECT * FROM accounts WHERE username IN ({placeholders})"
+            qs = f"{ACCOUNTS_QS} WHERE a.username IN ({placeholders})"
 
         rs = await fetchall(self._db_file, qs, params)
         accounts = [Account.from_rs(rs) for rs in rs]
         accounts = [x for x in accounts if x.login_method == "password"]
-        # await asyncio.gather(*[login(x) for x in self.accounts])
+
+        # manual mode asks for codes in terminal, one account at a time
+        cfg = self._login_config
+        workers = asyncio.Semaphore(1 if cfg.manual else max(cfg.concurrency, 1))
+        domains: defaultdict[str, asyncio.Semaphore] = defaultdict(
+            lambda: asyncio.Semaphore(max(cfg.per_domain, 1))
+        )
+
+        async def run(acc: Account):
+            async with domains[acc.email.rpartition("@")[2].lower()], workers:
+                logger.info(f"Logging in {acc.username} - {acc.email}")
+                return acc, await self.login(acc)
+
+        # IMAP sessions are shared by logins of this run only, so they are closed at its end
+        own_imaps = self._imaps is None
+        self._imaps = self._imaps or ImapSessions()
+        imaps = self._imaps
 
         counter = {"total": len(accounts), "success": 0, "failed": 0}
-        for i, x in enumerate(accounts, start=1):
-            logger.info(f"[{i}/{len(accounts)}] Logging in {x.username} - {x.email}")
-            status = await self.login(x)
-            counter["success" if status else "failed"] += 1
+        try:
+            for i, task in enumerate(asyncio.as_completed([run(x) for x in accounts]), start=1):
+                acc, status = await task
+                counter["success" if status else "failed"] += 1
+                msg = f"success={counter['success']} failed={counter['failed']}"
+                logger.info(f"[{i}/{len(accounts)}] {acc.username} done ({msg})")
+        finally:
+            if own_imaps:
+                self._imaps = None
+                await imaps.close()
         return counter
 
     async def relogin(self, usernames: str | list[str]):
@@ -232,19 +505,36 @@ class AccountsPool:
             return
 
         placeholders, params = self._usernames_where(usernames)
-        qs = f"""
-        UPDATE accounts SET
-            active = false,
-            locks = json_object(),
-            last_used = NULL,
-            error_msg = NULL,
-            headers = json_object(),
-            cookies = json_object(),
-            user_agent = "@chrome"
-        WHERE username IN ({placeholders}) AND password != '_'
-        """
+        where = f"username IN ({placeholders}) AND password != '_'"
+        await self.flush()
 
-        await execute(self._db_file, qs, params)
+        async def fn(db: aiosqlite.Connection):
+            qs = f"""
+            UPDATE account_locks SET unlock_at = NULL
+            WHERE username IN (SELECT username FROM accounts WHERE {where})
+            """
+            await db.execute(qs, params)
+
+            qs = f"""
+            DELETE FROM account_leases
+            WHERE username IN (SELECT username FROM accounts WHERE {where})
+            """
+            await db.execute(qs, params)
+
+            qs = f"""
+            UPDATE accounts SET
+                active = false,
+                last_used = NULL,
+                error_msg = NULL,
+                headers = json_object(),
+                cookies = json_object(),
+                user_agent = "@chrome"
+            WHERE {where}
+            """
+            await db.execute(qs, params)
+
+        await transaction(self._db_file, fn)
+        self._changed()
         await self.login_all(usernames)
 
     async def relogin_failed(self):
@@ -253,165 +543,440 @@ class AccountsPool:
         await self.relogin([x["username"] for x in rs])
 
     async def reset_locks(self):
-        qs = "UPDATE accounts SET locks = json_object()"
-        await execute(self._db_file, qs)
+        await self.flush()
+
+        async def fn(db: aiosqlite.Connection):
+            await db.execute("UPDATE account_locks SET unlock_at = NULL")
+            await db.execute("DELETE FROM account_leases")
+
+        await transaction(self._db_file, fn)
+        self._changed()
 
     async def set_active(self, username: str, active: bool):
+        await self.flush()
         qs = "UPDATE accounts SET active = :active WHERE username = :username"
         await execute(self._db_file, qs, {"username": username, "active": active})
+        self._changed()
 
-    async def lock_until(self, username: str, queue: str, unlock_at: int, req_count=0):
-        qs = f"""
-        UPDATE accounts SET
-            locks = json_set(locks, '$.{queue}', datetime({unlock_at}, 'unixepoch')),
-            stats = json_set(stats, '$.{queue}', COALESCE(json_extract(stats, '$.{queue}'), 0) + {req_count}),
-            last_used = datetime({utc.ts()}, 'unixepoch')
-        WHERE username = :username
+    # Bookkeeping below is written in background by the group-commit writer of db module,
+    # use `flush` to wait for it. Reads & account selection flush pending writes first.
+
+    def _set_lock(
+        self,
+        username: str,
+        queue: str,
+        unlock_at: int | None,
+        req_count: int,
+        rate_limit: RateLimit | None = None,
+    ) -> asyncio.Future:
+        return self._set_locks([username], queue, unlock_at, req_count, rate_limit)
+
+    def _set_locks(
+        self,
+        usernames: list[str],
+        queue: str,
+        unlock_at: int | None,
+        req_count: int = 0,
+        rate_limit: RateLimit | None = None,
+    ) -> asyncio.Future:
+        # releases own lease and sets rate-limit lock (if any); returned future is done when
+        # the lock is committed, last_used update is best-effort
+        params = {"queue": queue, "unlock_at": unlock_at, "req_count": req_count, "now": utc.ts()}
+        params["last_used"] = utc.now().isoformat()
+        # with several leases, release of one must not clear rate limit lock set by other
+        params["keep_lock"] = self._max_leases > 1
+        params["rl_remaining"] = rate_limit.remaining if rate_limit else None
+        params["rl_limit"] = rate_limit.limit if rate_limit else None
+        params["rl_reset"] = rate_limit.reset if rate_limit else None
+        params = [{**params, "username": x, "owner": lease_owner()} for x in usernames]
+
+        qs = """
+        DELETE FROM account_leases WHERE rowid = (
+            SELECT rowid FROM account_leases
+            WHERE username = :username AND queue = :queue AND owner = :owner
+            ORDER BY expires_at DESC LIMIT 1
+        )
         """
-        await execute(self._db_file, qs, {"username": username})
+        db.execute_later(self._db_file, qs, params)
 
-    async def unlock(self, username: str, queue: str, req_count=0):
-        qs = f"""
-        UPDATE accounts SET
-            locks = json_remove(locks, '$.{queue}'),
-            stats = json_set(stats, '$.{queue}', COALESCE(json_extract(stats, '$.{queue}'), 0) + {req_count}),
-            last_used = datetime({utc.ts()}, 'unixepoch')
-        WHERE username = :username
+        qs = """
+        INSERT INTO account_locks
+            (username, queue, unlock_at, req_count, rl_remaining, rl_limit, rl_reset)
+        SELECT username, :queue, :unlock_at, :req_count, :rl_remaining, :rl_limit, :rl_reset
+        FROM accounts WHERE username = :username
+        ON CONFLICT(username, queue) DO UPDATE SET
+            unlock_at = CASE WHEN :keep_lock AND excluded.unlock_at IS NULL AND unlock_at > :now
+                THEN unlock_at ELSE excluded.unlock_at END,
+            req_count = req_count + excluded.req_count,
+            rl_remaining = COALESCE(excluded.rl_remaining, rl_remaining),
+            rl_limit = COALESCE(excluded.rl_limit, rl_limit),
+            rl_reset = COALESCE(excluded.rl_reset, rl_reset)
         """
-        await execute(self._db_file, qs, {"username": username})
+        done = db.execute_later(self._db_file, qs, params)
 
-    async def _get_and_lock(self, queue: str, condition: str):
-        # if space in condition, it's a subquery, otherwise it's username
-        condition = f"({condition})" if " " in condition else f"'{condition}'"
+        qs = "UPDATE accounts SET last_used = :last_used WHERE username = :username"
+        db.execute_later(self._db_file, qs, params)
+        return done
 
-        if int(sqlite3.sqlite_version_info[1]) >= 35:
-            qs = f"""
-            UPDATE accounts SET
-                locks = json_set(locks, '$.{queue}', datetime('now', '+15 minutes')),
-                last_used = datetime({utc.ts()}, 'unixepoch')
-            WHERE username = {condition}
-            RETURNING *
-            """
-            rs = await fetchone(self._db_file, qs)
+    async def lock_until(
+        self,
+        username: str,
+        queue: str,
+        unlock_at: int,
+        req_count=0,
+        rate_limit: RateLimit | None = None,
+    ):
+        if self._sched is not None:
+            done = self._sched.release(username, queue, unlock_at, req_count, rate_limit)
         else:
-            tx = uuid.uuid4().hex
-            qs = f"""
-            UPDATE accounts SET
-                locks = json_set(locks, '$.{queue}', datetime('now', '+15 minutes')),
-                last_used = datetime({utc.ts()}, 'unixepoch'),
-                _tx = '{tx}'
-            WHERE username = {condition}
+            done = self._set_lock(username, queue, unlock_at, req_count, rate_limit)
+        self._notify(queue)
+        # rate limit must survive exit of event loop, so wait until it is written
+        await asyncio.shield(done)
+
+    async def unlock(
+        self, username: str, queue: str, req_count=0, rate_limit: RateLimit | None = None
+    ):
+        if self._sched is not None:
+            self._sched.release(username, queue, None, req_count, rate_limit)
+        else:
+            self._set_lock(username, queue, None, req_count, rate_limit)
+        self._notify(queue)
+
+    def _lease(self, usernames: list[str], queue: str, expires_at: int):
+        params = {"queue": queue, "owner": lease_owner(), "expires_at": expires_at}
+        params = [{**params, "username": x, "last_used": utc.now().isoformat()} for x in usernames]
+
+        qs = "INSERT INTO account_leases VALUES (:username, :queue, :owner, :expires_at)"
+        db.execute_later(self._db_file, qs, params)
+
+        qs = "UPDATE accounts SET last_used = :last_used WHERE username = :username"
+        db.execute_later(self._db_file, qs, params)
+
+    def _renew_lease(self, username: str, queue: str, expires_at: int) -> asyncio.Future:
+        qs = """
+        UPDATE account_leases SET expires_at = :expires_at
+        WHERE username = :username AND queue = :queue AND owner = :owner
+        """
+        params = {"username": username, "queue": queue, "owner": lease_owner()}
+        return db.execute_later(self._db_file, qs, {**params, "expires_at": expires_at})
+
+    async def renew(self, username: str, queue: str):
+        """Extend in-use lease of account for queue (QueueClient calls it periodically)."""
+        expires_at = utc.ts() + self._lease_seconds
+        if self._sched is not None:
+            return self._sched.renew(username, queue, expires_at)
+        self._renew_lease(username, queue, expires_at)
+
+    async def resume_lease(self, account: Account, queue: str) -> bool:
+        """Renew lease of account taken earlier (eg. with `get_many_for_queue`) right before
+        it is used. Returns False if the lease has expired meanwhile, the account may be
+        used by another consumer then."""
+        leased_until = account.locks.get(queue)
+        if leased_until is None or leased_until <= utc.now():
+            return False
+
+        expires_at = utc.ts() + self._lease_seconds
+        if self._sched is not None:
+            self._sched.renew(account.username, queue, expires_at)
+        else:
+            await asyncio.shield(self._renew_lease(account.username, queue, expires_at))
+        return True
+
+    async def reap_leases(self) -> int:
+        """Free leases which were not renewed in time or whose process is gone."""
+        await self.flush()
+        rs = await fetchall(self._db_file, "SELECT DISTINCT owner FROM account_leases")
+        dead = [x["owner"] for x in rs if not owner_alive(x["owner"])]
+
+        async def fn(db: aiosqlite.Connection):
+            qs = """
+            DELETE FROM account_leases
+            WHERE expires_at <= :now OR owner IN (SELECT value FROM json_each(:dead))
+            """
+            async with db.execute(qs, {"now": utc.ts(), "dead": json.dumps(dead)}) as cur:
+                return cur.rowcount
+
+        count = int(await transaction(self._db_file, fn))
+        if count > 0:
+            logger.debug(f"Freed {count} stale account leases")
+            self._changed()
+        return count
+
+    async def _get_and_lock(
+        self, queue: str, condition: str, extra: dict | None = None
+    ) -> list[Account]:
+        # condition is a subquery selecting usernames to lease
+        params = {
+            **(extra or {}),
+            "queue": queue,
+            "now": utc.ts(),
+            "owner": lease_owner(),
+            "expires_at": utc.ts() + self._lease_seconds,
+            "last_used": utc.now().isoformat(),
+        }
+        lease_qs = "INSERT INTO account_leases VALUES (:username, :queue, :owner, :expires_at)"
+
+        returning = int(sqlite3.sqlite_version_info[1]) >= 35
+
+        async def fn(db: aiosqlite.Connection):
+            if returning:
+                qs = f"""
+                INSERT INTO account_leases (username, queue, owner, expires_at)
+                SELECT username, :queue, :owner, :expires_at FROM ({condition})
+                RETURNING username
+                """
+            else:
+                # no RETURNING, so take write lock first to not race with other processes
+                await db.execute("BEGIN IMMEDIATE")
+                qs = condition
+
+            async with db.execute(qs, params) as cur:
+                usernames = [x[0] for x in await cur.fetchall()]
+            if not usernames:
+                return []
+
+            if not returning:
+                await db.executemany(lease_qs, [{**params, "username": x} for x in usernames])
+
+            names = {"usernames": json.dumps(usernames)}
+            qs = """
+            UPDATE accounts SET last_used = :last_used
+            WHERE username IN (SELECT value FROM json_each(:usernames))
             """
-            await execute(self._db_file, qs)
+            await db.execute(qs, {**params, **names})
+
+            qs = f"{ACCOUNTS_QS} WHERE a.username IN (SELECT value FROM json_each(:usernames))"
+            async with db.execute(qs, names) as cur:
+                rows = await cur.fetchall()
+
+            # keep order of condition (RETURNING order is not guaranteed)
+            order = {x.lower(): i for i, x in enumerate(usernames)}
+            return sorted(rows, key=lambda x: order.get(x["username"].lower(), 0))
+
+        rs = await transaction(self._db_file, fn)
+        self._strategy.picked([x["username"] for x in rs], queue)
+        return [Account.from_rs(x) for x in rs]
 
-            qs = f"SELECT * FROM accounts WHERE _tx = '{tx}'"
-            rs = await fetchone(self._db_file, qs)
+    async def get_for_queue(self, queue: str) -> Account | None:
+        accounts = await self.get_many_for_queue(queue, 1)
+        return accounts[0] if accounts else None
 
-        return Account.from_rs(rs) if rs else None
+    async def get_many_for_queue(self, queue: str, n: int) -> list[Account]:
+        """Lease up to `n` available accounts for `queue` at once."""
+        if self._sched is not None:
+            return await self._sched.acquire_many(queue, n)
 
-    async def get_for_queue(self, queue: str):
+        await self.flush()
+
+        order_by, params = self._strategy.order_by(queue)
         q = f"""
-        SELECT username FROM accounts
-        WHERE active = true AND (
-            locks IS NULL
-            OR json_extract(locks, '$.{queue}') IS NULL
-            OR json_extract(locks, '$.{queue}') < datetime('now')
-        )
-        ORDER BY {self._order_by}
-        LIMIT 1
+        SELECT username FROM accounts a
+        WHERE active = true AND NOT EXISTS (
+            SELECT 1 FROM account_locks l
+            WHERE l.username = a.username AND l.queue = :queue AND l.unlock_at > :now
+        ) AND (
+            SELECT COUNT(*) FROM account_leases s
+            WHERE s.username = a.username AND s.queue = :queue AND s.expires_at > :now
+        ) < MIN(:max_leases, MAX({BUDGET_SQL}, 1))
+        ORDER BY {order_by}, {self._order_by}
+        LIMIT {max(int(n), 0)}
         """
 
-        return await self._get_and_lock(queue, q)
+        return await self._get_and_lock(queue, q, {**params, "max_leases": self._max_leases})
+
+    def _notify(self, queue: str | None = None):
+        # an account was released in this process: wake the first consumer in line,
+        # it passes the turn to the next one after it gets an account (or gives up)
+        queues = [queue] if queue is not None else list(self._waiters.keys())
+        for x in queues:
+            if x in self._waiters and self._waiters[x]:
+                self._waiters[x][0].set()
 
     async def get_for_queue_or_wait(self, queue: str) -> Account | None:
-        start = utc.now()
+        start = time.monotonic()
         msg_shown = False
-        while True:
-            account = await self.get_for_queue(queue)
-            if account is not None:
-                if msg_shown:
-                    logger.info(f"Continuing with account {account.username} on queue {queue}")
-                return account
-
-            raise_no_account = self._raise_when_no_account or get_env_bool(
-                "TWS_RAISE_WHEN_NO_ACCOUNT"
-            )
 
-            # next_available_at returns None only when no active account exists at all,
-            # in which case waiting is futile. A timestamp means active accounts exist
-            # but are all locked right now (in-use or rate-limited).
-            nat = await self.next_available_at(queue)
-            no_active = not nat
-
-            # Give up (raise / stop) when: no active account exists, the caller opted
-            # out of waiting (wait_timeout is None), or the wait budget is exhausted.
-            elapsed = (utc.now() - start).total_seconds()
-            give_up = no_active or self._wait_timeout is None or elapsed >= self._wait_timeout
-            if give_up:
-                if raise_no_account:
-                    raise NoAccountError(f"No account available for queue {queue}")
-                if no_active:
-                    logger.warning("No active accounts. Stopping...")
-                    return None
-                if self._wait_timeout is not None:
+        # Consumers wait in line (FIFO). Only the first one in line queries the pool: it is
+        # woken on release in this process, at the earliest unlock time, or every
+        # wait_interval to notice accounts released by other processes.
+        # Get in line before the first query, so a release during it is not missed.
+        waiters = self._waiters[queue]
+        turn = asyncio.Event()
+        waiters.append(turn)
+
+        try:
+            while True:
+                raise_no_account = self._raise_when_no_account or get_env_bool(
+                    "TWS_RAISE_WHEN_NO_ACCOUNT"
+                )
+
+                elapsed = time.monotonic() - start
+                budget = None if self._wait_timeout is None else self._wait_timeout - elapsed
+
+                timeout = budget
+                if waiters[0] is turn:
+                    account = await self.get_for_queue(queue)
+                    if account is None and await self.reap_leases() > 0:
+                        account = await self.get_for_queue(queue)
+                    if account is not None:
+                        if msg_shown:
+                            logger.info(
+                                f"Continuing with account {account.username} on queue {queue}"
+                            )
+                        return account
+
+                    if turn.is_set():  # account released while querying, try again
+                        turn.clear()
+                        continue
+
+                    # _next_unlock_at returns None only when no active account exists at all,
+                    # in which case waiting is futile. A timestamp means active accounts exist
+                    # but are all locked right now (in-use or rate-limited).
+                    nat = await self._next_unlock_at(queue)
+                    no_active = nat is None
+
+                    # Give up (raise / stop) when: no active account exists, the caller opted
+                    # out of waiting (wait_timeout is None), or the wait budget is exhausted.
+                    give_up = no_active or budget is None or budget <= 0
+                    if give_up:
+                        if raise_no_account:
+                            raise NoAccountError(f"No account available for queue {queue}")
+                        if no_active:
+                            logger.warning("No active accounts. Stopping...")
+                            return None
+                        if budget is not None:
+                            return None
+                        # wait_timeout is None and not raising: fall through to the legacy
+                        # unbounded wait below.
+
+                    if not msg_shown:
+                        at = self._format_at(nat) if nat is not None else None
+                        logger.info(
+                            f'No account available for queue "{queue}". Next available at {at}'
+                        )
+                        msg_shown = True
+
+                    delay = nat - time.time() if nat is not None else 0
+                    delay = min(delay, self._wait_interval) if delay > 0 else self._wait_interval
+                    timeout = delay if budget is None else min(delay, budget)
+
+                elif budget is not None and budget <= 0:
+                    if raise_no_account:
+                        raise NoAccountError(f"No account available for queue {queue}")
                     return None
-                # wait_timeout is None and not raising: fall through to the legacy
-                # unbounded wait below.
 
-            if not msg_shown:
-                logger.info(f'No account available for queue "{queue}". Next available at {nat}')
-                msg_shown = True
+                try:
+                    await asyncio.wait_for(turn.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                turn.clear()
+        finally:
+            is_first = bool(waiters) and waiters[0] is turn
+            if turn in waiters:
+                waiters.remove(turn)
+            if is_first and waiters:
+                waiters[0].set()
+
+    async def _next_unlock_at(self, queue: str) -> int | None:
+        if self._sched is not None:
+            return await self._sched.next_unlock_at(queue)
 
-            await asyncio.sleep(self._wait_interval)
+        await self.flush()
 
-    async def next_available_at(self, queue: str):
-        qs = f"""
-        SELECT json_extract(locks, '$."{queue}"') as lock_until
-        FROM accounts
-        WHERE active = true AND json_extract(locks, '$."{queue}"') IS NOT NULL
-        ORDER BY lock_until ASC
-        LIMIT 1
+        # account is free after both its rate-limit lock and in-use lease end
+        qs = """
+        SELECT MIN(unlock_at) FROM (
+            SELECT MAX(x.unlock_at) AS unlock_at FROM (
+                SELECT username, unlock_at FROM account_locks
+                WHERE queue = :queue AND unlock_at IS NOT NULL
+                UNION ALL
+                SELECT username, expires_at FROM account_leases WHERE queue = :queue
+            ) x
+            JOIN accounts a ON a.username = x.username
+            WHERE a.active = true
+            GROUP BY x.username
+        )
         """
-        rs = await fetchone(self._db_file, qs)
-        if rs:
-            now, trg = utc.now(), utc.from_iso(rs[0])
-            if trg < now:
-                return "now"
+        rs = await fetchone(self._db_file, qs, {"queue": queue})
+        return int(rs[0]) if rs and rs[0] is not None else None
+
+    @staticmethod
+    def _format_at(unlock_at: int) -> str:
+        now, trg = utc.now(), utc.from_ts(unlock_at)
+        if trg < now:
+            return "now"
 
-            at_local = datetime.now() + (trg - now)
-            return at_local.strftime("%H:%M:%S")
+        at_local = datetime.now() + (trg - now)
+        return at_local.strftime("%H:%M:%S")
 
-        return None
+    async def next_available_at(self, queue: str):
+        unlock_at = await self._next_unlock_at(queue)
+        return self._format_at(unlock_at) if unlock_at is not None else None
 
     async def mark_inactive(self, username: str, error_msg: str | None):
+        if self._sched is not None:
+            self._sched.mark_inactive(username, error_msg)
+
         qs = """
         UPDATE accounts SET active = false, error_msg = :error_msg
         WHERE username = :username
         """
-        await execute(self._db_file, qs, {"username": username, "error_msg": error_msg})
+        params = {"username": username, "error_msg": error_msg}
+        await asyncio.shield(db.execute_later(self._db_file, qs, params))
 
-    async def stats(self):
-        def locks_count(queue: str):
-            return f"""
-            SELECT COUNT(*) FROM accounts
-            WHERE json_extract(locks, '$.{queue}') IS NOT NULL
-                AND json_extract(locks, '$.{queue}') > datetime('now')
-            """
+    async def get_xclid(self, username: str, max_age: int) -> tuple[list[int], str, int] | None:
+        """Saved x-client-transaction-id keys of account: (vk_bytes, anim_key, created_at)."""
+        qs = """
+        SELECT vk_bytes, anim_key, created_at FROM xclid
+        WHERE username = :username AND created_at > :expired_at
+        """
+        params = {"username": username, "expired_at": utc.ts() - max_age}
+        rs = await fetchone(self._db_file, qs, params)
+        return (list(base64.b64decode(rs[0])), str(rs[1]), int(rs[2])) if rs else None
 
-        qs = "SELECT DISTINCT(f.key) as k from accounts, json_each(locks) f"
-        rs = await fetchall(self._db_file, qs)
-        gql_ops = [x["k"] for x in rs]
+    def save_xclid(self, username: str, vk_bytes: list[int], anim_key: str, created_at: int):
+        # cache only, so written in background with other bookkeeping
+        qs = """
+        INSERT OR REPLACE INTO xclid (username, vk_bytes, anim_key, created_at)
+        VALUES (:username, :vk_bytes, :anim_key, :created_at)
+        """
+        params = {"username": username, "anim_key": anim_key, "created_at": created_at}
+        params["vk_bytes"] = base64.b64encode(bytes(vk_bytes)).decode()
+        db.execute_later(self._db_file, qs, params)
 
+    def delete_xclid(self, username: str):
+        qs = "DELETE FROM xclid WHERE username = :username"
+        db.execute_later(self._db_file, qs, {"username": username})
+
+    async def stats(self):
+        await self.flush()
         config = [
             ("total", "SELECT COUNT(*) FROM accounts"),
             ("active", "SELECT COUNT(*) FROM accounts WHERE active = true"),
             ("inactive", "SELECT COUNT(*) FROM accounts WHERE active = false"),
-            *[(f"locked_{x}", locks_count(x)) for x in gql_ops],
         ]
 
         qs = f"SELECT {','.join([f'({q}) as {k}' for k, q in config])}"
         rs = await fetchone(self._db_file, qs)
-        return dict(rs) if rs else {}
+        res = dict(rs) if rs else {}
+
+        qs = """
+        SELECT queue, COUNT(DISTINCT CASE WHEN unlock_at > :now THEN username END) AS locked FROM (
+            SELECT username, queue, unlock_at FROM account_locks WHERE unlock_at IS NOT NULL
+            UNION ALL
+            SELECT username, queue, expires_at FROM account_leases
+        )
+        GROUP BY queue
+        """
+        rs = await fetchall(self._db_file, qs, {"now": utc.ts()})
+        res.update({f"locked_{x['queue']}": x["locked"] for x in rs})
+
+        if self._max_leases > 1:
+            qs = "SELECT queue, COUNT(*) FROM account_leases WHERE expires_at > :now GROUP BY queue"
+            rs = await fetchall(self._db_file, qs, {"now": utc.ts()})
+            res.update({f"leases_{x[0]}": x[1] for x in rs})
+        return res
 
     async def accounts_info(self):
         accounts = await self.get_all()
@@ -1,9 +1,13 @@
-from contextlib import aclosing
-from typing import Literal
+import copy
+import json
+from contextlib import AbstractAsyncContextManager, aclosing, asynccontextmanager, nullcontext
+from dataclasses import dataclass
+from typing import AsyncGenerator, Literal
 
+from . import telemetry
 from .accounts_pool import AccountsPool
 from .http import Response
-from .logger import logger, set_log_level
+from .logger import LogOnce, logger, set_log_level
 from .models import (
     AccountAbout,
     Community,
@@ -16,9 +20,10 @@ from .models import (
     parse_tweets,
     parse_user,
     parse_users,
+    rep_index,
 )
 from .queue_client import QueueClient
-from .utils import encode_params, find_obj, get_by_path
+from .utils import RepIndex, get_or
 
 # GraphQL operation IDs used by this module.
 # If you add a new endpoint, add it here manually.
@@ -92,6 +97,119 @@ GQL_FEATURES = {  # search values here (view source) https://x.com/
     "responsive_web_grok_show_grok_translated_post": True,
 }
 
+GQL_FIELD_TOGGLES = {  # per-op `fieldToggles` param
+    "SearchTimeline": {"withArticleRichContentState": False},
+    "ListLatestTweetsTimeline": {"withArticleRichContentState": False},
+    "UserMedia": {"withArticlePlainText": False},
+}
+
+_USER_TIMELINE = "data.user.result.timeline.timeline.instructions"
+_COMMUNITY = "data.communityResults.result"
+GQL_TIMELINES = {  # per-op path of timeline instructions (or items slice of communities)
+    "BlueVerifiedFollowers": _USER_TIMELINE,
+    "Bookmarks": "data.bookmark_timeline_v2.timeline.instructions",
+    "CommunityTweetsTimeline": f"{_COMMUNITY}.ranked_community_timeline.timeline.instructions",
+    "Followers": _USER_TIMELINE,
+    "Following": _USER_TIMELINE,
+    "GenericTimelineById": "data.timeline.timeline.instructions",
+    "ListLatestTweetsTimeline": "data.list.tweets_timeline.timeline.instructions",
+    "ListMembers": "data.list.members_timeline.timeline.instructions",
+    "Retweeters": "data.retweeters_timeline.timeline.instructions",
+    "SearchTimeline": "data.search_by_raw_query.search_timeline.timeline.instructions",
+    "TweetDetail": "data.threaded_conversation_with_injections_v2.instructions",
+    "UserCreatorSubscriptions": _USER_TIMELINE,
+    "UserMedia": _USER_TIMELINE,
+    "UserTweets": _USER_TIMELINE,
+    "UserTweetsAndReplies": _USER_TIMELINE,
+    "membersSliceTimeline_Query": f"{_COMMUNITY}.members_slice",
+    "moderatorsSliceTimeline_Query": f"{_COMMUNITY}.moderators_slice",
+}
+
+
+def _encode_json(obj: dict) -> str:
+    return json.dumps({k: v for k, v in obj.items() if v is not None}, separators=(",", ":"))
+
+
+@dataclass(frozen=True)
+class GqlOp:
+    # Compiled GraphQL operation: features & field toggles are encoded once per process,
+    # so each page serializes only its variables.
+    op: str
+    queue: str
+    url: str
+    params: dict[str, str]
+    cursor_type: str = "Bottom"
+    timeline: str | None = None
+
+    def encode(self, kv: dict, cursor: str | None = None) -> dict[str, str | int]:
+        if cursor is not None:
+            kv = {**kv, "cursor": cursor}
+        return {"variables": _encode_json(kv), **self.params}
+
+
+_gql_ops: dict[tuple, GqlOp] = {}
+
+
+def gql_op(op: str, ft: dict | None = None, cursor_type="Bottom") -> GqlOp:
+    key = (op, cursor_type, tuple((ft or {}).items()))
+    if key not in _gql_ops:
+        queue = op.split("/")[-1]
+        params = {"features": _encode_json({**GQL_FEATURES, **(ft or {})})}
+        if queue in GQL_FIELD_TOGGLES:
+            params["fieldToggles"] = _encode_json(GQL_FIELD_TOGGLES[queue])
+
+        url, timeline = f"{GQL_URL}/{op}", GQL_TIMELINES.get(queue)
+        _gql_ops[key] = GqlOp(op, queue, url, params, cursor_type, timeline)
+    return _gql_ops[key]
+
+
+def _entry_cursor(entry: dict, cursor_type: str) -> dict | None:
+    # cursor entry, cursor item of entry or of module (conversation thread, media grid)
+    content = entry.get("content") or entry.get("item")
+    if not isinstance(content, dict):
+        return None
+
+    items = [content, content.get("itemContent")]
+    items.extend(get_or(x, "item.itemContent") for x in content.get("items") or [])
+    for x in items:
+        if isinstance(x, dict) and x.get("cursorType") == cursor_type:
+            return x
+    return None
+
+
+def read_timeline(obj: dict, path: str, cursor_type="Bottom") -> tuple[list, str | None] | None:
+    # entries & cursor of page at known path of timeline, None for unexpected layout
+    node = get_or(obj, path)
+    if isinstance(node, dict):
+        els = node.get("items_results")
+        return (els, get_or(node, "slice_info.next_cursor")) if isinstance(els, list) else None
+
+    if not isinstance(node, list):
+        return None
+
+    els, cur = None, None
+    for ins in node:
+        if not isinstance(ins, dict):
+            return None
+
+        if isinstance(ins.get("entries"), list):
+            items = ins["entries"]
+            els = items if els is None else els
+        elif isinstance(ins.get("entry"), dict):
+            items = [ins["entry"]]
+        else:
+            items = ins.get("moduleItems") or []
+
+        for x in items if cur is None else []:
+            if not isinstance(x, dict):
+                return None
+            cur = _entry_cursor(x, cursor_type)
+            if cur is not None:
+                break
+
+    return els or [], cur.get("value") if cur is not None else None
+
+
 KV = dict | None
 TrendId = Literal["trending", "news", "sport", "entertainment"] | str
 
@@ -127,9 +245,44 @@ class API:
 
         self.proxy = proxy
         self.debug = debug
+        self._sessions: dict[str, QueueClient] | None = None
         if self.debug:
             set_log_level("DEBUG")
 
+    @asynccontextmanager
+    async def session(self, *queues: str) -> AsyncGenerator["API", None]:
+        """
+        Keep account lease & HTTP connection per queue across API calls made with returned
+        API. Account is changed only on rate limit or error and released at exit. Queues
+        (eg. "UserByScreenName") are leased on enter, other ones on first use.
+
+            async with api.session("UserByScreenName") as s:
+                for login in logins:
+                    user = await s.user_by_login(login)
+
+        Session is for sequential calls, use one per worker task.
+        """
+        api = copy.copy(self)
+        api._sessions = {}
+        try:
+            for queue in queues:
+                queue = queue.split("/")[-1]
+                api._sessions[queue] = QueueClient(self.pool, queue, self.debug, proxy=self.proxy)
+                await api._sessions[queue].__aenter__()
+            yield api
+        finally:
+            for client in api._sessions.values():
+                await client.__aexit__(None, None, None)
+
+    def _queue_client(self, queue: str) -> AbstractAsyncContextManager[QueueClient]:
+        if self._sessions is None:
+            return QueueClient(self.pool, queue, self.debug, proxy=self.proxy)
+
+        # session clients are closed when session ends
+        if queue not in self._sessions:
+            self._sessions[queue] = QueueClient(self.pool, queue, self.debug, proxy=self.proxy)
+        return nullcontext(self._sessions[queue])
+
     # general helpers
 
     def _is_end(self, rep: Response, q: str, res: list, cur: str | None, cnt: int, lim: int):
@@ -161,16 +314,37 @@ class API:
         seen.update(keys)
         return False
 
-    def _get_cursor(self, obj: dict, cursor_type="Bottom") -> str | None:
+    def _get_cursor(self, idx: RepIndex, cursor_type="Bottom") -> str | None:
         # standard timeline cursor: {cursorType: "Bottom", value: "..."}
         # fallback: community endpoints use slice_info.next_cursor (plain string)
-        if cur := find_obj(obj, lambda x: x.get("cursorType") == cursor_type):
+        if (cur := idx.cursors.get(cursor_type)) is not None:
             return cur.get("value")
-        return get_by_path(obj, "next_cursor")
-
-    def _gql_entries(self, obj: dict) -> list:
+        return idx.get("next_cursor")
+
+    def _gql_page(self, gql: GqlOp, rep: Response) -> tuple[list, str | None]:
+        # entries & cursor are read at known path of op, other layouts are deep searched
+        timeline, page = gql.timeline, None
+        if timeline is not None:
+            page = read_timeline(rep.json(), timeline, gql.cursor_type)
+        if page is None:
+            if timeline is not None:
+                msg = f"{gql.queue} – unexpected response layout, searching whole response"
+                LogOnce.once(("gql_layout", gql.queue), "WARNING", msg)
+                telemetry.capture("gql_layout_fallback", {"operation": gql.queue})
+
+            idx = rep_index(rep)
+            return self._gql_entries(idx), self._get_cursor(idx, gql.cursor_type)
+
+        els, cur = page
+        if cur is None:  # last page usually, but cursor can be in place not known here
+            cur = self._get_cursor(rep_index(rep), gql.cursor_type)
+        return self._filter_entries(els), cur
+
+    def _gql_entries(self, idx: RepIndex) -> list:
         # standard timelines put items in "entries"; community endpoints use "items_results"
-        els = get_by_path(obj, "entries") or get_by_path(obj, "items_results") or []
+        return self._filter_entries(idx.get("entries") or idx.get("items_results") or [])
+
+    def _filter_entries(self, els: list) -> list:
         if els and "entryId" in (els[0] or {}):
             # filter out pagination cursors and non-content module entries
             els = [
@@ -187,28 +361,18 @@ class API:
     async def _gql_items(
         self, op: str, kv: dict, ft: dict | None = None, limit=-1, cursor_type="Bottom"
     ):
-        queue, cur, cnt, active = op.split("/")[-1], None, 0, True
-        kv, ft = {**kv}, {**GQL_FEATURES, **(ft or {})}
+        gql = gql_op(op, ft, cursor_type)
+        queue, cur, cnt, active = gql.queue, None, 0, True
         empty_pages = 0
         seen: set[tuple[str, ...]] = set()
 
-        async with QueueClient(self.pool, queue, self.debug, proxy=self.proxy) as client:
+        async with self._queue_client(queue) as client:
             while active:
-                params = {"variables": kv, "features": ft}
-                if cur is not None:
-                    params["variables"]["cursor"] = cur
-                if queue in ("SearchTimeline", "ListLatestTweetsTimeline"):
-                    params["fieldToggles"] = {"withArticleRichContentState": False}
-                if queue in ("UserMedia",):
-                    params["fieldToggles"] = {"withArticlePlainText": False}
-
-                rep = await client.get(f"{GQL_URL}/{op}", params=encode_params(params))
+                rep = await client.get(gql.url, params=gql.encode(kv, cur))
                 if rep is None:
                     return
 
-                obj = rep.json()
-                els = self._gql_entries(obj)
-                cur = self._get_cursor(obj, cursor_type)
+                els, cur = self._gql_page(gql, rep)
 
                 if self._is_stalled(queue, els, cur, seen):
                     logger.warning(f"{queue} pagination stalled, stopping")
@@ -229,11 +393,9 @@ class API:
                 yield rep
 
     async def _gql_item(self, op: str, kv: dict, ft: dict | None = None):
-        ft = ft or {}
-        queue = op.split("/")[-1]
-        async with QueueClient(self.pool, queue, self.debug, proxy=self.proxy) as client:
-            params = {"variables": {**kv}, "features": {**GQL_FEATURES, **ft}}
-            return await client.get(f"{GQL_URL}/{op}", params=encode_params(params))
+        gql = gql_op(op, ft)
+        async with self._queue_client(gql.queue) as client:
+            return await client.get(gql.url, params=gql.encode(kv))
 
     # search
 
@@ -253,14 +415,14 @@ class API:
     async def search(self, q: str, limit=-1, kv: KV = None):
         async with aclosing(self.search_raw(q, limit=limit, kv=kv)) as gen:
             async for rep in gen:
-                for x in parse_tweets(rep.json(), limit):
+                for x in parse_tweets(rep, limit):
                     yield x
 
     async def search_user(self, q: str, limit=-1, kv: KV = None):
         kv = {"product": "People", **(kv or {})}
         async with aclosing(self.search_raw(q, limit=limit, kv=kv)) as gen:
             async for rep in gen:
-                for x in parse_users(rep.json(), limit):
+                for x in parse_users(rep, limit):
                     yield x
 
     # user_by_login
@@ -342,7 +504,7 @@ class API:
     async def tweet_replies(self, twid: int, limit=-1, kv: KV = None):
         async with aclosing(self.tweet_replies_raw(twid, limit=limit, kv=kv)) as gen:
             async for rep in gen:
-                for x in parse_tweets(rep.json(), limit):
+                for x in parse_tweets(rep, limit):
                     if x.inReplyToTweetId == twid:
                         yield x
 
@@ -405,7 +567,7 @@ class API:
     async def tweet_thread(self, twid: int, limit=-1, kv: KV = None):
         async with aclosing(self.tweet_thread_raw(twid, limit=limit, kv=kv)) as gen:
             async for rep in gen:
-                for x in parse_tweets(rep.json(), limit):
+                for x in parse_tweets(rep, limit):
                     if x.conversationId == twid:
                         yield x
 
@@ -422,7 +584,7 @@ class API:
     async def followers(self, uid: int, limit=-1, kv: KV = None):
         async with aclosing(self.followers_raw(uid, limit=limit, kv=kv)) as gen:
             async for rep in gen:
-                for x in parse_users(rep.json(), limit):
+                for x in parse_users(rep, limit):
                     yield x
 
     # verified_followers
@@ -440,7 +602,7 @@ class API:
     async def verified_followers(self, uid: int, limit=-1, kv: KV = None):
         async with aclosing(self.verified_followers_raw(uid, limit=limit, kv=kv)) as gen:
             async for rep in gen:
-                for x in parse_users(rep.json(), limit):
+                for x in parse_users(rep, limit):
                     yield x
 
     # following
@@ -455,7 +617,7 @@ class API:
     async def following(self, uid: int, limit=-1, kv: KV = None):
         async with aclosing(self.following_raw(uid, limit=limit, kv=kv)) as gen:
             async for rep in gen:
-                for x in parse_users(rep.json(), limit):
+                for x in parse_users(rep, limit):
                     yield x
 
     # subscriptions
@@ -470,7 +632,7 @@ class API:
     async def subscriptions(self, uid: int, limit=-1, kv: KV = None):
         async with aclosing(self.subscriptions_raw(uid, limit=limit, kv=kv)) as gen:
             async for rep in gen:
-                for x in parse_users(rep.json(), limit):
+                for x in parse_users(rep, limit):
                     yield x
 
     # retweeters
@@ -485,7 +647,7 @@ class API:
     async def retweeters(self, twid: int, limit=-1, kv: KV = None):
         async with aclosing(self.retweeters_raw(twid, limit=limit, kv=kv)) as gen:
             async for rep in gen:
-                for x in parse_users(rep.json(), limit):
+                for x in parse_users(rep, limit):
                     yield x
 
     # user_tweets
@@ -508,7 +670,7 @@ class API:
     async def user_tweets(self, uid: int, limit=-1, kv: KV = None):
         async with aclosing(self.user_tweets_raw(uid, limit=limit, kv=kv)) as gen:
             async for rep in gen:
-                for x in parse_tweets(rep.json(), limit):
+                for x in parse_tweets(rep, limit):
                     yield x
 
     # user_tweets_and_replies
@@ -531,7 +693,7 @@ class API:
     async def user_tweets_and_replies(self, uid: int, limit=-1, kv: KV = None):
         async with aclosing(self.user_tweets_and_replies_raw(uid, limit=limit, kv=kv)) as gen:
             async for rep in gen:
-                for x in parse_tweets(rep.json(), limit):
+                for x in parse_tweets(rep, limit):
                     yield x
 
     # user_media
@@ -617,7 +779,7 @@ class API:
         }
         async with aclosing(self.search_raw(q, limit=limit, kv=kv)) as gen:
             async for rep in gen:
-                for x in parse_tweets(rep.json(), limit):
+                for x in parse_tweets(rep, limit):
                     yield x
 
     # Get current user bookmarks
@@ -643,7 +805,7 @@ class API:
     async def bookmarks(self, limit=-1, kv: KV = None):
         async with aclosing(self.bookmarks_raw(limit=limit, kv=kv)) as gen:
             async for rep in gen:
-                for x in parse_tweets(rep.json(), limit):
+                for x in parse_tweets(rep, limit):
                     yield x
 
     # list members of a List
@@ -4,15 +4,14 @@ import argparse
 import asyncio
 import getpass
 import io
-import json
 import sqlite3
 import sys
 from importlib.metadata import version
 
-from . import telemetry
+from . import codec, db, telemetry
 from .api import API, AccountsPool
 from .db import get_sqlite_version
-from .http import Response
+from .http import Response, client_cache, proxy_pools
 from .logger import logger, set_log_level
 from .login import LoginConfig
 from .models import Tweet, User
@@ -42,7 +41,7 @@ def to_str(doc: Response | Tweet | User | None) -> str:
         return "Not Found. See --raw for more details."
 
     tmp = doc.json()
-    return tmp if isinstance(tmp, str) else json.dumps(tmp, default=str)
+    return tmp if isinstance(tmp, str) else codec.dumps(tmp)
 
 
 async def main(args):
@@ -53,9 +52,15 @@ async def main(args):
     if args.command == "version":
         print(f"twscrape: {version('twscrape')}")
         print(f"SQLite runtime: {sqlite3.sqlite_version} ({await get_sqlite_version()})")
+        print(f"JSON codec: {codec.get_codec().name}")
         return
 
-    login_config = LoginConfig(getattr(args, "email_first", False), getattr(args, "manual", False))
+    login_config = LoginConfig(
+        getattr(args, "email_first", False),
+        getattr(args, "manual", False),
+        concurrency=getattr(args, "concurrency", 1),
+        per_domain=getattr(args, "per_domain", 2),
+    )
     pool = AccountsPool(args.db, login_config=login_config)
     api = API(pool, debug=args.debug)
 
@@ -79,7 +84,12 @@ async def main(args):
         return
 
     if args.command == "add_accounts":
-        await pool.load_from_file(args.file_path, args.line_format)
+        await pool.load_from_file(
+            args.file_path,
+            args.line_format,
+            sync=args.sync or args.deactivate_missing,
+            deactivate_missing=args.deactivate_missing,
+        )
         print("\nNow run:\ntwscrape login_accounts")
         return
 
@@ -139,6 +149,9 @@ async def _run(args):
     try:
         await main(args)
     finally:
+        await db.close()
+        await client_cache.aclose()
+        await proxy_pools.aclose()
         await telemetry.flush()
 
 
@@ -188,6 +201,10 @@ def run():
     add_accounts = subparsers.add_parser("add_accounts", help="Add accounts from file")
     add_accounts.add_argument("file_path", help="File with accounts")
     add_accounts.add_argument("line_format", help="Account fields separated by delimiter")
+    add_accounts.add_argument("--sync", action="store_true", help="Update proxy & cookies")
+    add_accounts.add_argument(
+        "--deactivate-missing", action="store_true", help="Deactivate accounts not in file"
+    )
 
     add_cookie = subparsers.add_parser("add_cookie", help="Add one account from cookies")
     add_cookie.add_argument("username", help="Local account identifier")
@@ -205,6 +222,8 @@ def run():
     for cmd in login_commands:
         cmd.add_argument("--email-first", action="store_true", help="Check email first")
         cmd.add_argument("--manual", action="store_true", help="Enter email code manually")
+        cmd.add_argument("--concurrency", type=int, default=1, help="Accounts to log in at once")
+        cmd.add_argument("--per-domain", type=int, default=2, help="Max at once per email domain")
 
     subparsers.add_parser("reset_locks", help="Reset all locks")
     subparsers.add_parser("delete_inactive", help="Delete inactive accounts")
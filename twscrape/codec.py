@@ -0,0 +1,132 @@
+import dataclasses
+import functools
+import importlib
+import importlib.util
+import json
+import os
+from datetime import datetime
+from typing import Any
+
+# JSON of responses and models: orjson or msgspec when installed (pip install twscrape[orjson]),
+# stdlib json otherwise. Output of `dumps` parses to the same value as
+# `json.dumps(obj, default=str)` (datetime as `str(dt)`), only formatting differs.
+CODECS = ("orjson", "msgspec", "json")
+
+
+@functools.cache
+def _fields(cls: Any) -> tuple[str, ...]:
+    return tuple(x.name for x in dataclasses.fields(cls))
+
+
+def to_plain(obj: Any) -> Any:
+    # like `dataclasses.asdict`, but without deepcopy of values; datetime as `default=str` does
+    if obj is None or type(obj) in (str, int, float, bool):
+        return obj
+    if isinstance(obj, datetime):
+        return str(obj)
+    if isinstance(obj, dict):
+        return {k: to_plain(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [to_plain(x) for x in obj]
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return {k: to_plain(getattr(obj, k)) for k in _fields(type(obj))}
+    return obj
+
+
+def _default(obj: Any) -> Any:
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return {k: getattr(obj, k) for k in _fields(type(obj))}  # nested ones come back here
+    return str(obj)
+
+
+class JsonCodec:
+    name = "json"
+
+    def loads(self, data: bytes | str) -> Any:
+        return json.loads(data)
+
+    def dumps(self, obj: Any) -> str:
+        return json.dumps(to_plain(obj), default=str)
+
+
+class OrjsonCodec(JsonCodec):
+    name = "orjson"
+
+    def __init__(self):
+        import orjson
+
+        self._orjson = orjson
+        # datetime goes to `default` to keep `str(dt)` format of stdlib codec; dataclasses too,
+        # since orjson skips fields with leading underscore (eg. `_type` of models)
+        self._option = (
+            orjson.OPT_PASSTHROUGH_DATETIME
+            | orjson.OPT_PASSTHROUGH_DATACLASS
+            | orjson.OPT_NON_STR_KEYS
+        )
+
+    def loads(self, data: bytes | str) -> Any:
+        return self._orjson.loads(data)  # its JSONDecodeError is subclass of stdlib one
+
+    def dumps(self, obj: Any) -> str:
+        try:
+            return self._orjson.dumps(obj, default=_default, option=self._option).decode()
+        except self._orjson.JSONEncodeError:  # eg. int over 64 bits
+            return super().dumps(obj)
+
+
+class MsgspecCodec(JsonCodec):
+    name = "msgspec"
+
+    def __init__(self):
+        msgspec = importlib.import_module("msgspec")  # optional
+
+        self._msgspec = msgspec
+        self._decoder = msgspec.json.Decoder()
+        self._encoder = msgspec.json.Encoder(enc_hook=str)
+
+    def loads(self, data: bytes | str) -> Any:
+        try:
+            return self._decoder.decode(data)
+        except self._msgspec.DecodeError as e:
+            raise json.JSONDecodeError(str(e), "", 0) from e
+
+    def dumps(self, obj: Any) -> str:
+        # msgspec writes datetime in ISO format, so models are converted first
+        try:
+            return str(self._encoder.encode(to_plain(obj)), "utf-8")
+        except (self._msgspec.EncodeError, OverflowError):
+            return super().dumps(obj)
+
+
+def _detect_codec() -> str:
+    forced = os.getenv("TWS_JSON", "").lower().strip()
+
+    if forced == "":
+        for name in CODECS[:-1]:
+            if importlib.util.find_spec(name) is not None:
+                return name
+        return "json"
+
+    if forced not in CODECS:
+        raise ValueError(f"Invalid TWS_JSON={forced!r}. Expected 'orjson', 'msgspec' or 'json'.")
+
+    if forced != "json" and importlib.util.find_spec(forced) is None:
+        raise ImportError(
+            f"TWS_JSON={forced} but {forced} is not installed. Run: pip install {forced}"
+        )
+
+    return forced
+
+
+@functools.cache
+def get_codec() -> JsonCodec:
+    name = _detect_codec()
+    return {"orjson": OrjsonCodec, "msgspec": MsgspecCodec}.get(name, JsonCodec)()
+
+
+def loads(data: bytes | str) -> Any:
+    return get_codec().loads(data)
+
+
+def dumps(obj: Any) -> str:
+    return get_codec().dumps(obj)
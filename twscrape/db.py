@@ -1,32 +1,76 @@
 import asyncio
+import json
 import random
 import sqlite3
 from collections import defaultdict
+from typing import Awaitable, Callable, ParamSpec, TypeVar
 
 import aiosqlite
 
 from .logger import logger
+from .utils import utc
+
+T = TypeVar("T")
+P = ParamSpec("P")
 
 MIN_SQLITE_VERSION = "3.24"
+WRITE_DELAY = 0.005  # seconds to gather deferred writes before commit
 
 _lock = asyncio.Lock()
+_loop: asyncio.AbstractEventLoop | None = None
+_watcher: asyncio.Task | None = None
+_conns: dict[str, aiosqlite.Connection] = {}
+_writers: dict[str, "Writer"] = {}
+_version_checked = False
+
+
+def _check_loop():
+    # connections & lock are bound to event loop, eg. new one after asyncio.run() called again
+    global _lock, _loop, _watcher
+    loop = asyncio.get_running_loop()
+    if _loop is loop:
+        return
+
+    for conn in _conns.values():
+        conn.stop()
+    _conns.clear()
+    _lock, _loop = asyncio.Lock(), loop
+    _watcher = loop.create_task(_stop_with_loop(loop))
+
+
+async def _stop_with_loop(loop: asyncio.AbstractEventLoop):
+    # asyncio.run() cancels pending tasks on exit: stop worker threads of connections, so
+    # they do not keep process alive when pool was not closed
+    task = asyncio.current_task()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        if _watcher is task and _loop is loop:
+            conns = list(_conns.values())
+            _conns.clear()
+            for conn in conns:
+                await conn.close()
 
 
-def lock_retry(max_retries=10):
+def lock_retry(max_retries=10) -> Callable[[Callable[P, Awaitable[T]]], Callable[P, Awaitable[T]]]:
     # this lock decorator has double nature:
     # 1. it uses asyncio lock in same process
     # 2. it retries when db locked by other process (eg. two cli instances running)
-    def decorator(func):
-        async def wrapper(*args, **kwargs):
-            for i in range(max_retries):
+    def decorator(func: Callable[P, Awaitable[T]]) -> Callable[P, Awaitable[T]]:
+        async def wrapper(*args: P.args, **kwargs: P.kwargs) -> T:
+            _check_loop()
+            for _ in range(max_retries - 1):
                 try:
                     async with _lock:
                         return await func(*args, **kwargs)
                 except sqlite3.OperationalError as e:
-                    if i == max_retries - 1 or "database is locked" not in str(e):
+                    if "database is locked" not in str(e):
                         raise e
 
-                    await asyncio.sleep(random.uniform(0.5, 1.0))
+                await asyncio.sleep(random.uniform(0.5, 1.0))
+
+            async with _lock:
+                return await func(*args, **kwargs)
 
         return wrapper
 
@@ -84,11 +128,76 @@ async def migrate(db: aiosqlite.Connection):
     async def v4():
         await db.execute("ALTER TABLE accounts ADD COLUMN mfa_code TEXT DEFAULT NULL")
 
+    async def v5():
+        # locks & stats moved out of json columns of accounts, so they can be indexed
+        qs = """
+        CREATE TABLE IF NOT EXISTS account_locks (
+            username TEXT NOT NULL COLLATE NOCASE,
+            queue TEXT NOT NULL,
+            unlock_at INTEGER DEFAULT NULL,
+            req_count INTEGER DEFAULT 0 NOT NULL,
+            PRIMARY KEY (username, queue)
+        ) WITHOUT ROWID;"""
+        await db.execute(qs)
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS account_locks_queue ON account_locks (queue, unlock_at)"
+        )
+
+        rows = []
+        async with db.execute("SELECT username, locks, stats FROM accounts") as cur:
+            async for username, locks, stats in cur:
+                locks, stats = json.loads(locks or "{}"), json.loads(stats or "{}")
+                for queue in {*locks.keys(), *stats.keys()}:
+                    unlock_at = locks.get(queue)
+                    unlock_at = int(utc.from_iso(unlock_at).timestamp()) if unlock_at else None
+                    req_count = stats.get(queue)
+                    req_count = req_count if isinstance(req_count, int) else 0
+                    rows.append((username, queue, unlock_at, req_count))
+
+        qs = "INSERT OR REPLACE INTO account_locks VALUES (?, ?, ?, ?)"
+        await db.executemany(qs, rows)
+        await db.execute("UPDATE accounts SET locks = '{}', stats = '{}'")
+
+    async def v6():
+        # short in-use leases, renewed by owner while working; rate-limit locks stay in account_locks
+        qs = """
+        CREATE TABLE IF NOT EXISTS account_leases (
+            username TEXT NOT NULL COLLATE NOCASE,
+            queue TEXT NOT NULL,
+            owner TEXT NOT NULL,
+            expires_at INTEGER NOT NULL
+        );"""
+        await db.execute(qs)
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS account_leases_username ON account_leases (username, queue)"
+        )
+
+    async def v7():
+        # last seen x-rate-limit-* headers, to pick accounts with most requests left
+        await db.execute("ALTER TABLE account_locks ADD COLUMN rl_remaining INTEGER DEFAULT NULL")
+        await db.execute("ALTER TABLE account_locks ADD COLUMN rl_limit INTEGER DEFAULT NULL")
+        await db.execute("ALTER TABLE account_locks ADD COLUMN rl_reset INTEGER DEFAULT NULL")
+
+    async def v8():
+        # x-client-transaction-id keys of account, so new processes skip loading x.com page
+        qs = """
+        CREATE TABLE IF NOT EXISTS xclid (
+            username TEXT PRIMARY KEY NOT NULL COLLATE NOCASE,
+            vk_bytes TEXT NOT NULL,
+            anim_key TEXT NOT NULL,
+            created_at INTEGER NOT NULL
+        ) WITHOUT ROWID;"""
+        await db.execute(qs)
+
     migrations = {
         1: v1,
         2: v2,
         3: v3,
         4: v4,
+        5: v5,
+        6: v6,
+        7: v7,
+        8: v8,
     }
 
     # logger.debug(f"Current migration v{uv} (latest v{len(migrations)})")
@@ -104,6 +213,47 @@ async def migrate(db: aiosqlite.Connection):
         await db.commit()
 
 
+async def connect(db_path: str) -> aiosqlite.Connection:
+    # One long-lived connection per db file: opening a connection starts a new thread,
+    # so doing it per query dominated pool bookkeeping. Callers are serialized by _lock;
+    # connections are closed with `close` or stopped when event loop ends.
+    global _version_checked
+
+    db_path = str(db_path)
+    if db_path in _conns:
+        return _conns[db_path]
+
+    if not _version_checked:
+        await check_version()
+        _version_checked = True
+
+    db = await aiosqlite.connect(db_path, cached_statements=256)
+    db.row_factory = aiosqlite.Row
+    # Exp(rate) distributed random number, SQLite math functions (ln) are optional
+    await db.create_function("EXP_RANDOM", 1, random.expovariate)
+    await db.execute("PRAGMA journal_mode = WAL")
+    await db.execute("PRAGMA synchronous = NORMAL")
+
+    if not DB._init_once[db_path]:
+        await migrate(db)
+        DB._init_once[db_path] = True
+
+    _conns[db_path] = db
+    return db
+
+
+async def close(db_path: str | None = None):
+    paths = [str(db_path)] if db_path is not None else list({*_conns.keys(), *_writers.keys()})
+    for path in paths:
+        writer = _writers.pop(path, None)
+        if writer is not None:
+            await writer.flush()
+
+        db = _conns.pop(path, None)
+        if db is not None:
+            await db.close()
+
+
 class DB:
     _init_once: defaultdict[str, bool] = defaultdict(bool)
 
@@ -112,21 +262,18 @@ class DB:
         self.conn = None
 
     async def __aenter__(self):
-        await check_version()
-        db = await aiosqlite.connect(self.db_path)
-        db.row_factory = aiosqlite.Row
-
-        if not self._init_once[self.db_path]:
-            await migrate(db)
-            self._init_once[self.db_path] = True
-
-        self.conn = db
-        return db
+        self.conn = await connect(self.db_path)
+        return self.conn
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        if self.conn:
+        if self.conn is None:
+            return
+
+        # connection is shared, so leave it without an open transaction either way
+        if exc_type is None:
             await self.conn.commit()
-            await self.conn.close()
+        else:
+            await self.conn.rollback()
 
 
 @lock_retry()
@@ -149,7 +296,103 @@ async def fetchall(db_path: str, qs: str, params: dict | None = None):
         return rows
 
 
+@lock_retry()
+async def transaction(db_path: str, fn: Callable[[aiosqlite.Connection], Awaitable[T]]) -> T:
+    # runs several statements on the same connection and commits them at once
+    async with DB(db_path) as db:
+        return await fn(db)
+
+
 @lock_retry()
 async def executemany(db_path: str, qs: str, params: list[dict]):
     async with DB(db_path) as db:
         await db.executemany(qs, params)
+
+
+# MARK: group commit
+
+
+@lock_retry()
+async def _commit(db_path: str, items: list[tuple[str, list[dict]]]):
+    async with DB(db_path) as db:
+        for qs, params in items:
+            await db.executemany(qs, params)
+
+
+class Writer:
+    """
+    Gathers small writes (account bookkeeping) for a few milliseconds and commits them
+    in one transaction, in the order they were made.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.loop = asyncio.get_running_loop()
+        self.items: list[tuple[str, list[dict]]] = []
+        self.done: asyncio.Future | None = None  # resolved when current items are committed
+        self.inflight: asyncio.Future | None = None
+        self.now = asyncio.Event()
+        self.task: asyncio.Task | None = None
+
+    def put(self, qs: str, params: list[dict]) -> asyncio.Future:
+        self.items.append((qs, params))
+        if self.done is None:
+            self.done = asyncio.get_running_loop().create_future()
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+        return self.done
+
+    async def run(self):
+        while self.items:
+            if not self.now.is_set():
+                try:
+                    await asyncio.wait_for(self.now.wait(), WRITE_DELAY)
+                except asyncio.TimeoutError:
+                    pass
+
+            self.now.clear()
+            items, done = self.items, self.done
+            self.items, self.done, self.inflight = [], None, done
+            try:
+                await self.commit(items)
+            finally:
+                self.inflight = None
+                if done is not None and not done.done():
+                    done.set_result(None)
+
+    async def commit(self, items: list[tuple[str, list[dict]]]):
+        try:
+            await _commit(self.db_path, items)
+        except Exception:
+            # do not lose the whole batch because of one bad write
+            for item in items:
+                try:
+                    await _commit(self.db_path, [item])
+                except Exception as e:
+                    logger.error(f"Failed to write to {self.db_path}: {e}")
+
+    async def flush(self):
+        done = self.done or self.inflight
+        if done is not None and self.loop is asyncio.get_running_loop():
+            self.now.set()
+            await asyncio.shield(done)
+
+
+def execute_later(db_path: str, qs: str, params: dict | list[dict] | None = None) -> asyncio.Future:
+    # deferred write: committed in background together with other writes, see `flush`
+    db_path = str(db_path)
+    writer = _writers.get(db_path)
+    if writer is None or writer.loop is not asyncio.get_running_loop():
+        # new writer per event loop, eg. after asyncio.run() called again
+        _writers[db_path] = Writer(db_path)
+
+    params = params if isinstance(params, list) else [params or {}]
+    return _writers[db_path].put(qs, params)
+
+
+async def flush(db_path: str | None = None):
+    paths = [str(db_path)] if db_path is not None else list(_writers.keys())
+    for path in paths:
+        writer = _writers.get(path)
+        if writer is not None:
+            await writer.flush()
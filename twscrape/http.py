@@ -1,18 +1,28 @@
+import asyncio
+import contextlib
 import importlib.util
 import os
 import random
+import time
 from abc import ABC, abstractmethod
+from collections import OrderedDict
 from typing import Any, Literal, cast
 
 from fake_useragent import UserAgent
 
+from . import codec
 from .logger import logger
+from .utils import RepIndex
 
 HttpMethod = Literal["GET", "POST", "PUT", "DELETE", "OPTIONS", "HEAD", "TRACE", "PATCH"]
 
 _UNSET = object()
 _CURL_MAX_RETRIES = 3
 _LOGGED_BACKENDS: set[str] = set()
+_LOGGED_PROTOCOLS: set[tuple[str, str]] = set()
+
+# CURLINFO_HTTP_VERSION values
+_CURL_HTTP_VERSIONS = {1: "HTTP/1.0", 2: "HTTP/1.1", 3: "HTTP/2", 30: "HTTP/3"}
 
 # https://curl-impersonate.readthedocs.io/en/latest/fingerprints.html
 _BROWSER_FAMILIES = {"chrome", "safari", "firefox", "edge"}
@@ -40,6 +50,7 @@ class Response:
     def __init__(self, rep: Any):
         self._rep = rep
         self._json: Any = _UNSET
+        self._index: RepIndex | None = None
 
     @property
     def status_code(self) -> int:
@@ -65,11 +76,24 @@ class Response:
     def request(self) -> Any:
         return self._rep.request
 
+    @property
+    def http_version(self) -> str:
+        """Negotiated protocol: "HTTP/1.1", "HTTP/2", ..."""
+        version = getattr(self._rep, "http_version", None)
+        if isinstance(version, int):  # curl_cffi
+            return _CURL_HTTP_VERSIONS.get(version, "unknown")
+        return version if isinstance(version, str) else "unknown"
+
     def json(self) -> Any:
         if self._json is _UNSET:
-            self._json = self._rep.json()
+            self._json = codec.loads(self._rep.content)
         return self._json
 
+    def index(self) -> RepIndex:
+        if self._index is None:
+            self._index = RepIndex(self.json())
+        return self._index
+
     def raise_for_status(self) -> None:
         if self._rep.status_code >= 400:
             raise HttpStatusError(f"HTTP {self._rep.status_code}", response=self)
@@ -99,6 +123,20 @@ def format_error(error: Exception) -> str:
     return f"{name}: {error}"
 
 
+def _log_protocol(backend: str, rep: Response):
+    key = (backend, rep.http_version)
+    if key not in _LOGGED_PROTOCOLS:
+        logger.debug(f"Negotiated {key[1]} with {backend} HTTP client")
+        _LOGGED_PROTOCOLS.add(key)
+
+
+def _http2_from_env() -> bool | None:
+    val = os.getenv("TWS_HTTP2", "").lower().strip()
+    if val == "":
+        return None
+    return val in ("1", "true", "yes")
+
+
 class HttpClient(ABC):
     backend: str
 
@@ -129,6 +167,92 @@ class HttpClient(ABC):
     def headers(self) -> Any: ...
 
 
+class _SharedTransport:
+    """httpx transport of ProxyPools, not closed with client."""
+
+    def __init__(self, transport: Any):
+        self._transport = transport
+
+    async def handle_async_request(self, request: Any) -> Any:
+        return await self._transport.handle_async_request(request)
+
+    async def aclose(self) -> None:
+        pass
+
+
+class ProxyPools:
+    """
+    Upstream connections shared by clients of all accounts with same proxy (or without one),
+    so open sockets are bounded by `max_connections` per proxy instead of growing with number
+    of accounts. Only connections are shared: cookies & headers stay in client of account.
+    Opt-in: `max_connections=0` (default) gives each client own pool.
+    """
+
+    def __init__(self, max_connections: int | None = None):
+        if max_connections is None:
+            max_connections = int(os.getenv("TWS_PROXY_MAX_CONNECTIONS", "0"))
+        self.max_connections = max_connections
+        self._items: dict[tuple, Any] = {}
+        self._slots: dict[tuple, asyncio.Semaphore] = {}
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def _check_loop(self) -> bool:
+        # connections are bound to event loop, so pools are made inside of running one
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return False
+
+        if self._loop is not loop:
+            self._items.clear()
+            self._slots.clear()
+            self._loop = loop
+        return True
+
+    def httpx_transport(self, proxy: str | None, http2: bool) -> Any | None:
+        if self.max_connections <= 0 or not self._check_loop():
+            return None
+
+        key = ("httpx", proxy, http2)
+        if key not in self._items:
+            import httpx
+
+            cap = self.max_connections
+            limits = httpx.Limits(max_connections=cap, max_keepalive_connections=cap)
+            transport = httpx.AsyncHTTPTransport(retries=3, http2=http2, proxy=proxy, limits=limits)
+            self._items[key] = transport
+        return _SharedTransport(self._items[key])
+
+    def curl_pool(self, proxy: str | None) -> tuple[Any, asyncio.Semaphore] | None:
+        if self.max_connections <= 0 or not self._check_loop():
+            return None
+
+        key = ("curl", proxy)
+        if key not in self._items:
+            from curl_cffi import AsyncCurl, CurlMOpt
+
+            # connection cache of libcurl lives in multi handle; MAX_TOTAL_CONNECTIONS is not
+            # enforced with curl_cffi event loop, so requests are capped by semaphore
+            acurl = AsyncCurl()
+            acurl.setopt(CurlMOpt.MAXCONNECTS, self.max_connections)
+            self._items[key] = acurl
+            self._slots[key] = asyncio.Semaphore(self.max_connections)
+        return self._items[key], self._slots[key]
+
+    async def aclose(self):
+        items, self._items, self._slots = list(self._items.values()), {}, {}
+        if self._loop is asyncio.get_running_loop():
+            for x in items:
+                close = x.aclose if hasattr(x, "aclose") else x.close  # AsyncCurl has close
+                try:
+                    await close()
+                except Exception as e:
+                    logger.debug(f"Failed to close connection pool: {format_error(e)}")
+
+
+proxy_pools = ProxyPools()
+
+
 class HttpxClient(HttpClient):
     backend = "httpx"
 
@@ -139,12 +263,26 @@ class HttpxClient(HttpClient):
         headers: dict | None = None,
         cookies: dict | None = None,
         seed: int | None = None,
+        http2: bool | None = None,
     ):
         import httpx
         from httpx import AsyncHTTPTransport
 
+        if http2 is True and importlib.util.find_spec("h2") is None:
+            raise ImportError(
+                "HTTP/2 for httpx requires h2 package. Run: pip install twscrape[http2]"
+            )
+
         self._httpx = httpx
-        transport = AsyncHTTPTransport(retries=3)
+        # one connection multiplexes all concurrent requests with HTTP/2, default is HTTP/1.1
+        transport = proxy_pools.httpx_transport(proxy, http2 is True)
+        timeout = httpx.Timeout(5.0)
+        if transport is not None:
+            proxy = None  # set in shared transport
+            timeout = httpx.Timeout(5.0, pool=60.0)  # wait for free connection of proxy
+        else:
+            transport = AsyncHTTPTransport(retries=3, http2=http2 is True)
+
         resolved_headers = dict(headers or {})
         ua_string, _ = _resolve_browser(resolved_headers.get("user-agent"), seed=seed)
         resolved_headers["user-agent"] = ua_string
@@ -152,6 +290,7 @@ class HttpxClient(HttpClient):
             proxy=proxy,
             follow_redirects=True,
             transport=transport,
+            timeout=timeout,
             headers=resolved_headers,
             cookies=cookies or {},
         )
@@ -173,7 +312,9 @@ class HttpxClient(HttpClient):
     async def _wrap(self, coro: Any) -> Response:
         hx = self._httpx
         try:
-            return Response(await coro)
+            rep = Response(await coro)
+            _log_protocol(self.backend, rep)
+            return rep
         except (hx.ConnectError, hx.ConnectTimeout) as e:
             raise ConnectError(str(e)) from e
         except (hx.ReadTimeout, hx.WriteTimeout, hx.PoolTimeout, hx.ProxyError) as e:
@@ -184,11 +325,19 @@ class CurlClient(HttpClient):
     backend = "curl"
 
     def __init__(
-        self, *, proxy: str | None = None, headers: dict | None = None, cookies: dict | None = None
+        self,
+        *,
+        proxy: str | None = None,
+        headers: dict | None = None,
+        cookies: dict | None = None,
+        http2: bool | None = None,
     ):
+        from curl_cffi.const import CurlHttpVersion
         from curl_cffi.requests import AsyncSession, BrowserTypeLiteral
 
         _, family = _resolve_browser((headers or {}).get("user-agent"))
+        shared = proxy_pools.curl_pool(proxy)
+        self._slots = shared[1] if shared else contextlib.nullcontext()
         # strip user-agent — curl_cffi sets its own UA for the impersonated profile
         safe_headers = {k: v for k, v in (headers or {}).items() if k.lower() != "user-agent"}
         self._session = AsyncSession(
@@ -196,6 +345,9 @@ class CurlClient(HttpClient):
             proxy=proxy,
             allow_redirects=True,
             headers=safe_headers,
+            # None keeps protocol of impersonated browser
+            http_version={True: CurlHttpVersion.V2TLS, False: CurlHttpVersion.V1_1}.get(http2),
+            async_curl=shared[0] if shared else None,
         )
         if cookies:
             self._session.cookies.update(cookies)
@@ -212,7 +364,8 @@ class CurlClient(HttpClient):
         last_err: Exception | None = None
         for _ in range(_CURL_MAX_RETRIES + 1):
             try:
-                return await self._wrap(self._session.request(method, url, **kwargs))
+                async with self._slots:
+                    return await self._wrap(self._session.request(method, url, **kwargs))
             except NetworkError as e:
                 last_err = e
         if last_err is not None:
@@ -224,7 +377,9 @@ class CurlClient(HttpClient):
 
     async def _wrap(self, coro: Any) -> Response:
         try:
-            return Response(await coro)
+            rep = Response(await coro)
+            _log_protocol(self.backend, rep)
+            return rep
         except Exception as e:
             from curl_cffi.requests import errors as _curl_errors
 
@@ -264,9 +419,16 @@ def make_client(
     headers: dict | None = None,
     cookies: dict | None = None,
     seed: int | None = None,
+    http2: bool | None = None,
 ) -> HttpClient:
+    """
+    `http2`: True to negotiate HTTP/2 (concurrent requests share one connection), False to
+    force HTTP/1.1, None for backend default (`TWS_HTTP2` env if set).
+    """
     if backend is None:
         backend = _detect_backend()
+    if http2 is None:
+        http2 = _http2_from_env()
 
     if backend not in _LOGGED_BACKENDS:
         name = "curl-cffi" if backend == "curl" else backend
@@ -274,8 +436,77 @@ def make_client(
         _LOGGED_BACKENDS.add(backend)
 
     if backend == "curl":
-        return CurlClient(proxy=proxy, headers=headers, cookies=cookies)
+        return CurlClient(proxy=proxy, headers=headers, cookies=cookies, http2=http2)
     if backend == "httpx":
-        return HttpxClient(proxy=proxy, headers=headers, cookies=cookies, seed=seed)
+        return HttpxClient(proxy=proxy, headers=headers, cookies=cookies, seed=seed, http2=http2)
 
     raise ValueError(f"Unknown backend: {backend!r}. Expected 'curl' or 'httpx'.")
+
+
+class ClientCache:
+    """
+    Idle HTTP clients by (username, proxy, backend), so next lease of the account reuses open
+    connection and skips TCP / TLS handshake (and proxy CONNECT). LRU-bounded; clients idle
+    for `idle_timeout` seconds or made for other account cookies / headers are closed.
+    """
+
+    def __init__(self, maxsize=64, idle_timeout=60.0):
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        # key: (fingerprint, client, released at)
+        self._items: OrderedDict[tuple, tuple[str, HttpClient, float]] = OrderedDict()
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def _check_loop(self):
+        # connections are bound to event loop, eg. new one after asyncio.run() called again
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._items.clear()
+            self._loop = loop
+
+    @staticmethod
+    async def _close(clt: HttpClient):
+        try:
+            await clt.aclose()
+        except Exception as e:
+            logger.debug(f"Failed to close HTTP client: {format_error(e)}")
+
+    async def _evict(self):
+        expired_at = time.monotonic() - self.idle_timeout
+        while self._items:
+            key, (_, clt, released_at) = next(iter(self._items.items()))
+            if len(self._items) <= self.maxsize and released_at > expired_at:
+                break
+            del self._items[key]
+            await self._close(clt)
+
+    async def take(self, username: str, proxy: str | None, fingerprint: str) -> HttpClient | None:
+        self._check_loop()
+        await self._evict()
+
+        item = self._items.pop((username.lower(), proxy, _detect_backend()), None)
+        if item is None:
+            return None
+        if item[0] != fingerprint:
+            await self._close(item[1])
+            return None
+        return item[1]
+
+    async def put(self, username: str, proxy: str | None, fingerprint: str, clt: HttpClient):
+        self._check_loop()
+        key = (username.lower(), proxy, getattr(clt, "backend", "unknown"))
+        old = self._items.pop(key, None)
+        if old is not None and old[1] is not clt:
+            await self._close(old[1])  # one idle client per key
+
+        self._items[key] = (fingerprint, clt, time.monotonic())
+        await self._evict()
+
+    async def aclose(self):
+        items, self._items = list(self._items.values()), OrderedDict()
+        if self._loop is asyncio.get_running_loop():
+            for _, clt, _ in items:
+                await self._close(clt)
+
+
+client_cache = ClientCache()
@@ -3,6 +3,8 @@ import email as emaillib
 import imaplib
 import os
 import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
 from datetime import datetime
 
 from .logger import logger
@@ -49,7 +51,10 @@ def _get_imap_domain(email: str) -> str:
     return f"imap.{email_domain}"
 
 
-def _wait_email_code(imap: imaplib.IMAP4_SSL, count: int, min_t: datetime | None) -> str | None:
+def _wait_email_code(
+    imap: imaplib.IMAP4_SSL, count: int, min_t: datetime | None, used: set[str] | None = None
+) -> str | None:
+    # used: ids of messages whose codes were taken already by other logins to this mailbox
     for i in range(count, 0, -1):
         _, rep = imap.fetch(str(i), "(RFC822)")
         for x in rep:
@@ -69,21 +74,28 @@ def _wait_email_code(imap: imaplib.IMAP4_SSL, count: int, min_t: datetime | None
 
                 if "info@x.com" in msg_from and "confirmation code is" in msg_subj:
                     # eg. Your Twitter confirmation code is XXX
-                    return msg_subj.split(" ")[-1].strip()
+                    code = msg_subj.split(" ")[-1].strip()
+                    if used is None:
+                        return code
+
+                    msg_id = str(msg.get("Message-ID", "")) or f"{msg_time}:{code}"
+                    if msg_id not in used:
+                        used.add(msg_id)
+                        return code
 
     return None
 
 
 async def imap_get_email_code(
-    imap: imaplib.IMAP4_SSL, email: str, min_t: datetime | None = None
+    imap: imaplib.IMAP4_SSL, email: str, min_t: datetime | None = None, used: set[str] | None = None
 ) -> str:
     try:
         logger.info(f"Waiting for confirmation code for {email}...")
         start_time = time.time()
         while True:
-            _, rep = imap.select("INBOX")
+            _, rep = await asyncio.to_thread(imap.select, "INBOX")
             msg_count = int(rep[0].decode("utf-8")) if len(rep) > 0 and rep[0] is not None else 0
-            code = _wait_email_code(imap, msg_count, min_t)
+            code = await asyncio.to_thread(_wait_email_code, imap, msg_count, min_t, used)
             if code is not None:
                 return code
 
@@ -92,12 +104,15 @@ async def imap_get_email_code(
 
             await asyncio.sleep(5)
     except Exception as e:
-        imap.select("INBOX")
-        imap.close()
+        try:
+            await asyncio.to_thread(imap.select, "INBOX")
+            await asyncio.to_thread(imap.close)
+        except Exception as x:
+            logger.debug(f"Failed to close IMAP mailbox: {x}")
         raise e
 
 
-async def imap_login(email: str, password: str):
+def _imap_connect(email: str, password: str):
     domain = _get_imap_domain(email)
     imap = imaplib.IMAP4_SSL(domain)
 
@@ -109,3 +124,62 @@ async def imap_login(email: str, password: str):
         raise EmailLoginError() from e
 
     return imap
+
+
+async def imap_login(email: str, password: str):
+    # imaplib is blocking, do not stop other logins running concurrently
+    return await asyncio.to_thread(_imap_connect, email, password)
+
+
+class ImapSessions:
+    """
+    IMAP sessions shared between logins of accounts with the same mailbox. Logins hold the
+    mailbox for their whole run (see `lock`), and a message with confirmation code is given
+    to one login only, so codes of logins to the same mailbox are not mixed up.
+    """
+
+    def __init__(self):
+        self._items: dict[tuple[str, str], imaplib.IMAP4_SSL] = {}
+        self._locks: defaultdict[tuple[str, str], asyncio.Lock] = defaultdict(asyncio.Lock)
+        self._used: defaultdict[tuple[str, str], set[str]] = defaultdict(set)
+
+    @staticmethod
+    def _key(email: str, password: str) -> tuple[str, str]:
+        return (email.lower(), password)
+
+    @asynccontextmanager
+    async def lock(self, email: str, password: str):
+        async with self._locks[self._key(email, password)]:
+            yield
+
+    async def get(self, email: str, password: str) -> imaplib.IMAP4_SSL:
+        # opened on first use; callers hold the mailbox with `lock`
+        key = self._key(email, password)
+        if key not in self._items:
+            self._items[key] = await imap_login(email, password)
+        return self._items[key]
+
+    async def get_email_code(self, email: str, password: str, min_t: datetime | None) -> str:
+        key = self._key(email, password)
+        imap = await self.get(email, password)
+        try:
+            return await imap_get_email_code(imap, email, min_t, self._used[key])
+        except Exception:
+            await self._drop(key)  # session may be broken, open new one next time
+            raise
+
+    async def _drop(self, key: tuple[str, str]):
+        imap = self._items.pop(key, None)
+        if imap is not None:
+            await self._logout(imap)
+
+    async def _logout(self, imap: imaplib.IMAP4_SSL):
+        try:
+            await asyncio.to_thread(imap.logout)
+        except Exception as e:
+            logger.debug(f"Failed to logout from IMAP: {e}")
+
+    async def close(self):
+        items, self._items = list(self._items.values()), {}
+        for imap in items:
+            await self._logout(imap)
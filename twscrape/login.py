@@ -7,7 +7,7 @@ import pyotp
 
 from .account import Account
 from .http import HttpClient, Response
-from .imap import imap_get_email_code, imap_login
+from .imap import ImapSessions, imap_get_email_code, imap_login
 from .logger import logger
 from .utils import utc
 
@@ -18,6 +18,8 @@ LOGIN_URL = "https://api.x.com/1.1/onboarding/task.json"
 class LoginConfig:
     email_first: bool = False
     manual: bool = False
+    concurrency: int = 1  # accounts logged in at once by login_all (manual mode is sequential)
+    per_domain: int = 2  # at once per email domain, to not overload IMAP provider
 
 
 @dataclass
@@ -27,6 +29,7 @@ class TaskCtx:
     cfg: LoginConfig
     prev: Any
     imap: None | imaplib.IMAP4_SSL
+    imaps: ImapSessions | None = None
 
 
 async def get_guest_token(client: HttpClient):
@@ -177,6 +180,9 @@ async def login_confirm_email_code(ctx: TaskCtx):
         print(f"Enter email code for {ctx.acc.username} / {ctx.acc.email}")
         value = input("Code: ")
         value = value.strip()
+    elif ctx.imaps is not None:
+        now_time = utc.now() - timedelta(seconds=30)
+        value = await ctx.imaps.get_email_code(ctx.acc.email, ctx.acc.email_password, now_time)
     else:
         if not ctx.imap:
             ctx.imap = await imap_login(ctx.acc.email, ctx.acc.email_password)
@@ -248,22 +254,37 @@ async def next_login_task(ctx: TaskCtx, rep: Response):
     return None
 
 
-async def login(acc: Account, cfg: LoginConfig | None = None) -> Account:
+async def login(
+    acc: Account, cfg: LoginConfig | None = None, imaps: ImapSessions | None = None
+) -> Account:
     log_id = f"{acc.username} - {acc.email}"
     if acc.active:
         logger.info(f"account already active {log_id}")
         return acc
 
-    cfg, imap = cfg or LoginConfig(), None
+    cfg = cfg or LoginConfig()
+    if imaps is None:
+        return await _login(acc, cfg, None)
+
+    # other logins to the same mailbox wait, so they do not take confirmation code of this one
+    async with imaps.lock(acc.email, acc.email_password):
+        return await _login(acc, cfg, imaps)
+
+
+async def _login(acc: Account, cfg: LoginConfig, imaps: ImapSessions | None) -> Account:
+    imap = None
     if cfg.email_first and not cfg.manual:
-        imap = await imap_login(acc.email, acc.email_password)
+        if imaps is not None:
+            await imaps.get(acc.email, acc.email_password)
+        else:
+            imap = await imap_login(acc.email, acc.email_password)
 
     async with acc.make_client() as client:
         guest_token = await get_guest_token(client)
         client.headers["x-guest-token"] = guest_token
 
         rep = await login_initiate(client)
-        ctx = TaskCtx(client, acc, cfg, None, imap)
+        ctx = TaskCtx(client, acc, cfg, None, imap, imaps)
         while True:
             rep = await next_login_task(ctx, rep)
             if not rep:
@@ -10,9 +10,10 @@ from dataclasses import asdict, dataclass, field
 from datetime import datetime, timezone
 from typing import Generator, Optional, Union
 
+from .codec import dumps as json_dumps
 from .http import Response
 from .logger import logger
-from .utils import find_item, get_or, int_or, to_old_obj, to_old_rep, utc
+from .utils import RepIndex, find_item, get_or, int_or, to_old_obj, to_old_rep, utc
 
 
 @dataclass
@@ -20,8 +21,8 @@ class JSONTrait:
     def dict(self):
         return asdict(self)
 
-    def json(self):
-        return json.dumps(self.dict(), default=str)
+    def json(self) -> str:
+        return json_dumps(self)
 
 
 @dataclass
@@ -827,6 +828,14 @@ def _write_dump(kind: str, e: Exception, x: dict, obj: dict):
     logger.error(f"Failed to parse response of {kind}, writing dump to {dumpfile}")
 
 
+def rep_index(rep: Response | dict) -> RepIndex:
+    # index of Response is kept, so API pagination and parsers walk page once
+    if isinstance(rep, dict):
+        return RepIndex(rep)
+    # check for attr, because Response can be mocked in tests with different type
+    return rep.index() if hasattr(rep, "index") else RepIndex(rep.json())
+
+
 def _parse_items(rep: Response, kind: str, limit: int = -1):
     if kind == "user":
         Cls, key = User, "users"
@@ -837,9 +846,7 @@ def _parse_items(rep: Response, kind: str, limit: int = -1):
     else:
         raise ValueError(f"Invalid kind: {kind}")
 
-    # check for dict, because Response can be mocked in tests with different type
-    res = rep if isinstance(rep, dict) else rep.json()
-    obj = to_old_rep(res)
+    obj = to_old_rep(rep_index(rep))
     retweeted_ids: set[str] = obj.get("retweeted_ids", set())
 
     ids = set()
@@ -1,12 +1,15 @@
 import asyncio
 import json
 import os
+import time
+from collections import OrderedDict
 from enum import Enum, auto
+from functools import lru_cache, partial
 from typing import Any
 from urllib.parse import urlparse
 
 from . import telemetry
-from .account import Account, has_required_cookies
+from .account import Account, RateLimit, has_required_cookies
 from .accounts_pool import AccountsPool
 from .http import (
     ConnectError,
@@ -15,10 +18,11 @@ from .http import (
     HttpStatusError,
     NetworkError,
     Response,
+    client_cache,
     format_error,
 )
 from .logger import LogOnce, logger
-from .utils import utc
+from .utils import SingleFlight, utc
 from .xclid import XClIdAccountError, XClIdGen, XClIdParseError
 
 ReqParams = dict[str, str | int] | None
@@ -42,7 +46,19 @@ class FailKind(Enum):
 
 
 class XClIdGenStore:
-    items: dict[str, XClIdGen] = {}
+    items: OrderedDict[str, XClIdGen] = OrderedDict()
+    # generators kept in memory by account, least recently used are dropped over this
+    max_items = 1000
+    # keys saved to accounts db are reused by new processes for this long, 404 refreshes them
+    ttl = 6 * 60 * 60
+    # keys older than this or made from previous X web build are made again in background,
+    # requests use old ones meanwhile; one try per account per refresh_interval
+    refresh_after = 60 * 60
+    refresh_interval = 60
+    build: str | None = None  # latest X web build seen
+    # many requests of one account (eg. burst at start or 404 storm) wait for one creation
+    _flight = SingleFlight()
+    _refresh_at: dict[str, float] = {}
 
     @classmethod
     async def get(
@@ -51,22 +67,98 @@ class XClIdGenStore:
         proxy: str | None = None,
         cookies: dict[str, str] | None = None,
         fresh=False,
+        pool: AccountsPool | None = None,
+        stale: XClIdGen | None = None,
     ) -> XClIdGen:
-        if username in cls.items and not fresh:
-            return cls.items[username]
+        # stale: generator which got 404, not made again if other request replaced it already
+        gen = cls.items.get(username)
+        if gen is not None and not (fresh and (stale is None or gen is stale)):
+            cls.items.move_to_end(username)
+            if cls._outdated(gen):
+                cls._refresh(username, proxy, cookies, pool)
+            return gen
+
+        if pool is not None and fresh:
+            pool.delete_xclid(username)  # got 404 with these keys
+        fn = partial(cls._create, username, proxy, cookies, pool, saved=not fresh)
+        return await cls._flight.run(username, fn)
+
+    @classmethod
+    def _outdated(cls, gen: XClIdGen) -> bool:
+        if time.time() - gen.created_at > cls.refresh_after:
+            return True
+        return gen.build is not None and cls.build is not None and gen.build != cls.build
+
+    @classmethod
+    def _refresh(
+        cls,
+        username: str,
+        proxy: str | None,
+        cookies: dict[str, str] | None,
+        pool: AccountsPool | None,
+    ):
+        now = time.monotonic()
+        if cls._refresh_at.get(username, 0) > now:
+            return
+
+        cls._refresh_at[username] = now + cls.refresh_interval
+        # new generator replaces old one in `items` when ready, requests in flight keep old one
+        fn = partial(cls._create, username, proxy, cookies, pool, saved=False)
+        cls._flight.start(username, fn).add_done_callback(cls._refreshed)
+
+    @staticmethod
+    def _refreshed(task: asyncio.Future):
+        error = None if task.cancelled() else task.exception()
+        if isinstance(error, Exception):
+            logger.debug(f"Failed to refresh XClIdGen: {format_error(error)}")
+
+    @classmethod
+    async def _create(
+        cls,
+        username: str,
+        proxy: str | None,
+        cookies: dict[str, str] | None,
+        pool: AccountsPool | None,
+        saved=True,
+    ) -> XClIdGen:
+        if pool is not None and saved:
+            rs = await pool.get_xclid(username, cls.ttl)
+            if rs is not None:
+                return cls._put(username, XClIdGen(*rs))
 
         clid_gen = await XClIdGen.create(proxy=proxy, cookies=cookies)
-        cls.items[username] = clid_gen
-        return clid_gen
+        if pool is not None:
+            pool.save_xclid(username, clid_gen.vk_bytes, clid_gen.anim_key, clid_gen.created_at)
+        if clid_gen.build is not None:
+            cls.build = clid_gen.build
+        return cls._put(username, clid_gen)
+
+    @classmethod
+    def _put(cls, username: str, gen: XClIdGen) -> XClIdGen:
+        cls.items[username] = gen
+        cls.items.move_to_end(username)
+        while len(cls.items) > cls.max_items:
+            cls.items.popitem(last=False)
+        return gen
 
 
 class Ctx:
-    def __init__(self, acc: Account, clt: HttpClient, proxy: str | None = None):
+    def __init__(
+        self,
+        acc: Account,
+        clt: HttpClient,
+        proxy: str | None = None,
+        pool: AccountsPool | None = None,
+    ):
         self.req_count = 0
         self.acc = acc
         self.clt = clt
         self.proxy = proxy
+        self.pool = pool  # keeps XClIdGen between processes
         self.fails = {FailKind.TRANSPORT: 0, FailKind.LOADSHED: 0, FailKind.UNKNOWN: 0}
+        self.closed = asyncio.Event()
+        self.heartbeat: asyncio.Task | None = None
+        self.rate_limit: RateLimit | None = None  # from last response, saved on release
 
     def fail(self, kind: FailKind) -> bool:
         """Count a failed attempt of this kind, return whether it's still worth retrying."""
@@ -81,21 +173,29 @@ class Ctx:
         await asyncio.sleep(2 ** self.fails[kind])
         return True
 
-    async def aclose(self):
-        await self.clt.aclose()
+    async def aclose(self, reuse=True):
+        self.closed.set()
+        # keep connection for next lease of account, unless it failed
+        if reuse and self.fails[FailKind.TRANSPORT] == 0:
+            fp = self.acc.client_fingerprint()
+            await client_cache.put(self.acc.username, self.proxy, fp, self.clt)
+        else:
+            await self.clt.aclose()
 
     async def req(self, method: HttpMethod, url: str, params: ReqParams = None) -> Response:
         # if code 404 on first try then generate new x-client-transaction-id and retry
         # https://github.com/vladkens/twscrape/issues/248
-        path = urlparse(url).path or "/"
+        path = _url_path(url)
 
-        tries = 0
+        tries, gen = 0, None
         while tries < 3:
             gen = await XClIdGenStore.get(
                 self.acc.username,
                 proxy=self.proxy,
                 cookies=self.acc.cookies,
                 fresh=tries > 0,
+                pool=self.pool,
+                stale=gen,
             )
             hdr = {"x-client-transaction-id": gen.calc(method, path)}
             rep = await self.clt.request(method, url, params=params, headers=hdr)
@@ -111,6 +211,12 @@ class Ctx:
         )
 
 
+@lru_cache(maxsize=256)
+def _url_path(url: str) -> str:
+    # GraphQL urls are the same for every page of operation
+    return urlparse(url).path or "/"
+
+
 def req_id(rep: Response):
     lr = str(rep.headers.get("x-rate-limit-remaining", -1))
     ll = str(rep.headers.get("x-rate-limit-limit", -1))
@@ -162,12 +268,26 @@ def dump_rep(rep: Response):
 
 
 class QueueClient:
-    def __init__(self, pool: AccountsPool, queue: str, debug=False, proxy: str | None = None):
+    def __init__(
+        self,
+        pool: AccountsPool,
+        queue: str,
+        debug=False,
+        proxy: str | None = None,
+        account: Account | None = None,
+    ):
         self.pool = pool
         self.queue = queue
         self.debug = debug
         self.ctx: Ctx | None = None
         self.proxy = proxy
+        # already locked for queue, eg. with `pool.get_many_for_queue`; used before picking one
+        self.account = account
+
+    @classmethod
+    async def many(cls, pool: AccountsPool, queue: str, n: int, **kwargs) -> list["QueueClient"]:
+        accounts = await pool.get_many_for_queue(queue, n)
+        return [cls(pool, queue, account=x, **kwargs) for x in accounts]
 
     async def __aenter__(self):
         await self._get_ctx()
@@ -182,30 +302,54 @@ class QueueClient:
 
         ctx, self.ctx, self.req_count = self.ctx, None, 0
         username = ctx.acc.username
-        await ctx.aclose()
+        await ctx.aclose(reuse=not inactive)
 
         if inactive:
             await self.pool.mark_inactive(username, msg)
             return
 
+        rl = ctx.rate_limit
         if reset_at > 0:
-            await self.pool.lock_until(ctx.acc.username, self.queue, reset_at, ctx.req_count)
+            await self.pool.lock_until(username, self.queue, reset_at, ctx.req_count, rl)
             return
 
-        await self.pool.unlock(ctx.acc.username, self.queue, ctx.req_count)
+        await self.pool.unlock(username, self.queue, ctx.req_count, rl)
 
     async def _get_ctx(self):
         if self.ctx:
             return self.ctx
 
-        acc = await self.pool.get_for_queue_or_wait(self.queue)
+        acc, self.account = self.account, None
+        if acc is not None and not await self.pool.resume_lease(acc, self.queue):
+            logger.debug(f"Lease of {acc.username} for {self.queue} expired, taking another one")
+            acc = None
+        if acc is None:
+            acc = await self.pool.get_for_queue_or_wait(self.queue)
         if acc is None:
             return None
 
-        clt = acc.make_client(proxy=self.proxy)
-        self.ctx = Ctx(acc, clt, proxy=acc.resolve_proxy(self.proxy))
+        proxy = acc.resolve_proxy(self.proxy)
+        clt = await client_cache.take(acc.username, proxy, acc.client_fingerprint())
+        clt = clt or acc.make_client(proxy=self.proxy)
+        self.ctx = Ctx(acc, clt, proxy=proxy, pool=self.pool)
+        self.ctx.heartbeat = asyncio.create_task(self._keep_lease(self.ctx))
         return self.ctx
 
+    async def _keep_lease(self, ctx: Ctx):
+        # account is leased for a short time, renew it until ctx is closed
+        interval = self.pool._lease_seconds / 3
+        while True:
+            try:
+                await asyncio.wait_for(ctx.closed.wait(), interval)
+                return
+            except asyncio.TimeoutError:
+                pass
+
+            try:
+                await self.pool.renew(ctx.acc.username, self.queue)
+            except Exception as e:
+                logger.warning(f"Failed to renew lease: {self._format_ctx_error(ctx, e)}")
+
     def _format_ctx_error(self, ctx: Ctx, error: Exception | str) -> str:
         message = format_error(error) if isinstance(error, Exception) else error
         return (
@@ -234,7 +378,9 @@ class QueueClient:
 
         limit_remaining = int(rep.headers.get("x-rate-limit-remaining", -1))
         limit_reset = int(rep.headers.get("x-rate-limit-reset", -1))
-        # limit_max = int(rep.headers.get("x-rate-limit-limit", -1))
+        limit_max = int(rep.headers.get("x-rate-limit-limit", -1))
+        if self.ctx is not None and limit_remaining >= 0 and limit_reset > 0:
+            self.ctx.rate_limit = RateLimit(limit_remaining, max(limit_max, 0), limit_reset)
 
         errors: list[str] = []
         if isinstance(res, dict) and "errors" in res:
@@ -0,0 +1,253 @@
+import asyncio
+import heapq
+import time
+from typing import TYPE_CHECKING, TypeVar
+
+from .account import UNKNOWN_BUDGET, Account, RateLimit
+from .db import fetchall, fetchone
+from .logger import logger
+from .utils import utc
+
+if TYPE_CHECKING:
+    from .accounts_pool import AccountsPool
+
+E = TypeVar("E", bound=tuple)
+
+
+class AccountScheduler:
+    """
+    In-process mirror of the accounts pool. Accounts are loaded once and kept per queue in
+    two heaps: locked ones by unlock time, free ones by key of pool selection strategy. So
+    acquire / release are O(log n) and do not wait for the database. Changes are written
+    to SQLite in background by group-commit writer.
+
+    Changes made by other processes (eg. `twscrape reset_locks`) are detected with
+    `PRAGMA data_version`, which is checked at most every `refresh_interval` seconds.
+    """
+
+    def __init__(self, pool: "AccountsPool", refresh_interval: float = 1.0):
+        self._pool = pool
+        self._refresh_interval = refresh_interval
+        self._accounts: dict[str, Account] | None = None
+        self._locked: dict[str, list[tuple[int, str]]] = {}
+        self._ready: dict[str, list[tuple[tuple, str]]] = {}
+        # current heap entry of (username, queue), others are outdated (lazy deletion)
+        self._entries: dict[tuple[str, str], tuple] = {}
+        # state by (username, queue): rate limit lock, in-use leases and last rate limit
+        self._locks: dict[tuple[str, str], int] = {}
+        self._leases: dict[tuple[str, str], list[int]] = {}
+        self._limits: dict[tuple[str, str], RateLimit] = {}
+        self._data_version: int | None = None
+        self._checked_at = 0.0
+        self._sync_lock = asyncio.Lock()
+
+    # MARK: state
+
+    def invalidate(self):
+        self._accounts = None
+        self._locked.clear()
+        self._ready.clear()
+        self._entries.clear()
+
+    async def _get_data_version(self) -> int:
+        rs = await fetchone(self._pool._db_file, "PRAGMA data_version")
+        return int(rs[0]) if rs else 0
+
+    async def _sync(self) -> dict[str, Account]:
+        now = time.monotonic()
+        if self._accounts is not None and now - self._checked_at < self._refresh_interval:
+            return self._accounts
+
+        async with self._sync_lock:
+            if self._accounts is not None and now - self._checked_at < self._refresh_interval:
+                return self._accounts
+
+            # own changes must land before comparing with (or reloading from) database
+            await self._pool.flush()
+            version = await self._get_data_version()
+            if self._accounts is None or version != self._data_version:
+                if self._accounts is not None:
+                    logger.debug("Accounts changed outside of this process, reloading")
+
+                self.invalidate()
+                accounts = await self._pool.get_all()
+                self._accounts = {x.username: x for x in accounts}
+                await self._load_locks()
+                self._data_version = version
+
+            self._checked_at = time.monotonic()
+            return self._accounts
+
+    async def _load_locks(self):
+        db_file, params = self._pool._db_file, {"now": utc.ts()}
+
+        qs = """
+        SELECT username, queue, unlock_at, rl_remaining, rl_limit, rl_reset FROM account_locks
+        WHERE unlock_at > :now OR rl_remaining IS NOT NULL
+        """
+        rows = await fetchall(db_file, qs, params)
+        self._locks = {(x[0], x[1]): x[2] for x in rows if x[2] and x[2] > params["now"]}
+        self._limits = {
+            (x[0], x[1]): RateLimit(x[3], x[4] or 0, x[5] or 0) for x in rows if x[3] is not None
+        }
+
+        qs = "SELECT username, queue, expires_at FROM account_leases WHERE expires_at > :now"
+        self._leases = {}
+        for x in await fetchall(db_file, qs, params):
+            self._leases.setdefault((x[0], x[1]), []).append(x[2])
+
+    def _free_at(self, username: str, queue: str, now: int) -> int:
+        # time when account is not rate limited & has less leases than allowed for queue
+        key = (username, queue)
+        leases = self._leases[key] = sorted(x for x in self._leases.get(key, []) if x > now)
+
+        limit = self._limits.get(key)
+        budget = limit.budget(now) if limit else UNKNOWN_BUDGET
+        cap = min(self._pool._max_leases, max(budget, 1))
+        lease_ts = leases[len(leases) - cap] if len(leases) >= cap else 0
+        return max(self._locks.get(key, 0), lease_ts)
+
+    def _update(self, acc: Account, queue: str):
+        # locks of Account show time until all leases end, as when loaded from database
+        key = (acc.username, queue)
+        ts = max([self._locks.get(key, 0), *self._leases.get(key, [])])
+        if ts > utc.ts():
+            acc.locks[queue] = utc.from_ts(ts)
+        else:
+            acc.locks.pop(queue, None)
+
+    def _put(self, queue: str, acc: Account):
+        if queue not in self._locked or not acc.active:
+            return
+
+        now = utc.ts()
+        ts = self._free_at(acc.username, queue, now)
+        if ts > now:
+            entry = (ts, acc.username)
+            heapq.heappush(self._locked[queue], entry)
+        else:
+            limit = self._limits.get((acc.username, queue))
+            entry = (self._pool._strategy.key(acc, queue, limit, now), acc.username)
+            heapq.heappush(self._ready[queue], entry)
+        self._entries[(acc.username, queue)] = entry
+
+    def _is_current(self, accounts: dict[str, Account], queue: str, entry: tuple) -> bool:
+        acc = accounts.get(entry[1])
+        return acc is not None and acc.active and self._entries.get((acc.username, queue)) is entry
+
+    def _prepare(self, accounts: dict[str, Account], queue: str):
+        if queue not in self._locked:
+            self._locked[queue], self._ready[queue] = [], []
+            for x in accounts.values():
+                self._put(queue, x)
+
+        # move accounts with ended locks to free ones
+        now, locked = utc.ts(), self._locked[queue]
+        while locked and locked[0][0] <= now:
+            entry = heapq.heappop(locked)
+            if self._is_current(accounts, queue, entry):
+                self._put(queue, accounts[entry[1]])
+
+    def _top(self, heap: list[E], accounts: dict[str, Account], queue: str) -> E | None:
+        while heap:
+            if self._is_current(accounts, queue, heap[0]):
+                return heap[0]
+            heapq.heappop(heap)
+        return None
+
+    # MARK: pool operations
+
+    async def acquire(self, queue: str) -> Account | None:
+        accounts = await self.acquire_many(queue, 1)
+        return accounts[0] if accounts else None
+
+    async def acquire_many(self, queue: str, n: int) -> list[Account]:
+        accounts = await self._sync()
+        self._prepare(accounts, queue)
+
+        items: list[Account] = []
+        keys: list[tuple] = []
+        unlock_at = utc.ts() + self._pool._lease_seconds
+        while len(items) < n:
+            top = self._top(self._ready[queue], accounts, queue)
+            if top is None:
+                break
+
+            heapq.heappop(self._ready[queue])
+            acc = accounts[top[1]]
+            self._leases.setdefault((acc.username, queue), []).append(unlock_at)
+            self._update(acc, queue)
+            acc.last_used = utc.now()
+            items.append(acc)
+            keys.append(top[0])
+
+        if items:
+            usernames = [x.username for x in items]
+            self._pool._lease(usernames, queue, unlock_at)
+            self._pool._strategy.picked(usernames, queue, keys)
+
+        # back to heaps after strategy updated, one account is given once per call
+        for acc in items:
+            self._put(queue, acc)
+        return items
+
+    def renew(self, username: str, queue: str, expires_at: int):
+        acc = (self._accounts or {}).get(username)
+        leases = self._leases.get((username, queue), [])
+        if acc is None or not leases:
+            return  # released already
+
+        # as in database, all own leases of account for queue are extended
+        self._pool._renew_lease(username, queue, expires_at)
+        self._leases[(username, queue)] = [max(x, expires_at) for x in leases]
+        self._update(acc, queue)
+        self._put(queue, acc)
+
+    def release(
+        self,
+        username: str,
+        queue: str,
+        unlock_at: int | None,
+        req_count: int,
+        rate_limit: RateLimit | None = None,
+    ) -> asyncio.Future:
+        done = self._pool._set_lock(username, queue, unlock_at, req_count, rate_limit)
+
+        key = (username, queue)
+        if rate_limit is not None:
+            self._limits[key] = rate_limit
+        leases = self._leases.get(key, [])
+        if leases:
+            leases.pop(0)
+        if unlock_at is not None:
+            self._locks[key] = unlock_at
+        elif self._pool._max_leases == 1 or self._locks.get(key, 0) <= utc.ts():
+            # other leases may have hit rate limit meanwhile, same as in database
+            self._locks.pop(key, None)
+
+        acc = (self._accounts or {}).get(username)
+        if acc is None:
+            return done
+
+        self._update(acc, queue)
+        if req_count > 0:
+            acc.stats[queue] = acc.stats.get(queue, 0) + req_count
+        acc.last_used = utc.now()
+        self._put(queue, acc)
+        return done
+
+    def mark_inactive(self, username: str, error_msg: str | None):
+        acc = (self._accounts or {}).get(username)
+        if acc is not None:
+            acc.active, acc.error_msg = False, error_msg
+
+    async def next_unlock_at(self, queue: str) -> int | None:
+        accounts = await self._sync()
+        self._prepare(accounts, queue)
+
+        top = self._top(self._ready[queue], accounts, queue)
+        if top is not None:
+            return utc.ts()
+
+        top = self._top(self._locked[queue], accounts, queue)
+        return top[0] if top is not None else None
@@ -0,0 +1,151 @@
+import random
+from collections import defaultdict
+from typing import Sequence
+
+from .account import UNKNOWN_BUDGET, Account, RateLimit
+
+# requests left for (account, queue) in SQL, same as RateLimit.budget
+BUDGET_SQL = f"""IFNULL((
+    SELECT CASE WHEN l.rl_reset <= :now THEN MAX(l.rl_limit, l.rl_remaining)
+        ELSE l.rl_remaining END
+    FROM account_locks l WHERE l.username = a.username AND l.queue = :queue
+), {UNKNOWN_BUDGET})"""
+
+# last_used is iso text (older versions wrote "YYYY-MM-DD HH:MM:SS"), compared as text
+LAST_USED_SQL = "REPLACE(a.last_used, ' ', 'T')"
+
+# share of rate limit window left, 1.0 when unknown
+HEALTH_SQL = """IFNULL((
+    SELECT CASE WHEN l.rl_reset <= :now THEN 1.0
+        ELSE MAX(l.rl_remaining * 1.0 / l.rl_limit, 0.05) END
+    FROM account_locks l
+    WHERE l.username = a.username AND l.queue = :queue AND l.rl_limit > 0
+), 1.0)"""
+
+
+class Strategy:
+    """
+    Order in which free accounts are leased for a queue.
+
+    `order_by` is used when accounts are selected in SQL (columns of `accounts a`, params
+    `:queue` & `:now` are available), `key` when selected in memory by `AccountScheduler`
+    (smaller first). Key is computed when account becomes free, so it should not depend
+    on other accounts. Ties are broken by `AccountsPool._order_by` / username.
+    """
+
+    name = ""
+
+    def order_by(self, queue: str) -> tuple[str, dict]:
+        raise NotImplementedError()
+
+    def key(self, acc: Account, queue: str, limit: RateLimit | None, now: int) -> tuple:
+        raise NotImplementedError()
+
+    def picked(self, usernames: list[str], queue: str, keys: Sequence[tuple] = ()):
+        # called after accounts are leased, with their keys when selected in memory
+        pass
+
+
+class BudgetStrategy(Strategy):
+    """Most requests left first (not used for queue yet counts as full), then LRU."""
+
+    name = "budget"
+
+    def order_by(self, queue: str) -> tuple[str, dict]:
+        return f"{BUDGET_SQL} DESC, {LAST_USED_SQL}", {}
+
+    def key(self, acc: Account, queue: str, limit: RateLimit | None, now: int) -> tuple:
+        budget = limit.budget(now) if limit else UNKNOWN_BUDGET
+        return (-budget, _last_used(acc))
+
+
+class LRUStrategy(Strategy):
+    """Least recently used account first."""
+
+    name = "lru"
+
+    def order_by(self, queue: str) -> tuple[str, dict]:
+        return LAST_USED_SQL, {}
+
+    def key(self, acc: Account, queue: str, limit: RateLimit | None, now: int) -> tuple:
+        return (_last_used(acc),)
+
+
+class RoundRobinStrategy(Strategy):
+    """Accounts in turn by username, state is kept per process."""
+
+    name = "round_robin"
+
+    def __init__(self):
+        self._cursor: dict[str, str] = {}  # queue: last picked username
+        self._rounds: defaultdict[tuple[str, str], int] = defaultdict(int)
+
+    def order_by(self, queue: str) -> tuple[str, dict]:
+        return "a.username <= :rr_cursor, a.username", {"rr_cursor": self._cursor.get(queue, "")}
+
+    def key(self, acc: Account, queue: str, limit: RateLimit | None, now: int) -> tuple:
+        return (self._rounds[(queue, acc.username.lower())], acc.username.lower())
+
+    def picked(self, usernames: list[str], queue: str, keys: Sequence[tuple] = ()):
+        for x in usernames:
+            self._rounds[(queue, x.lower())] += 1
+        if usernames:
+            self._cursor[queue] = usernames[-1]
+
+
+class WeightedStrategy(Strategy):
+    """Random, weighted by health: share of rate limit window left for queue."""
+
+    name = "weighted"
+
+    def __init__(self):
+        self._clock: defaultdict[str, float] = defaultdict(float)
+
+    def weight(self, limit: RateLimit | None, now: int) -> float:
+        if limit is None or limit.limit <= 0 or limit.reset <= now:
+            return 1.0
+        return max(limit.remaining / limit.limit, 0.05)
+
+    def order_by(self, queue: str) -> tuple[str, dict]:
+        # same exponential race as in memory, smallest Exp(weight) wins
+        return f"EXP_RANDOM({HEALTH_SQL})", {}
+
+    def key(self, acc: Account, queue: str, limit: RateLimit | None, now: int) -> tuple:
+        # exponential race: free accounts wait for clock of queue + Exp(weight). Waiting is
+        # memoryless, so each pick is weighted random, whenever accounts became free
+        return (self._clock[queue] + random.expovariate(self.weight(limit, now)),)
+
+    def picked(self, usernames: list[str], queue: str, keys: Sequence[tuple] = ()):
+        if keys:
+            self._clock[queue] = max(self._clock[queue], keys[-1][0])
+
+
+class RandomStrategy(WeightedStrategy):
+    """Uniformly random account."""
+
+    name = "random"
+
+    def weight(self, limit: RateLimit | None, now: int) -> float:
+        return 1.0
+
+    def order_by(self, queue: str) -> tuple[str, dict]:
+        return "RANDOM()", {}
+
+
+STRATEGIES: dict[str, type[Strategy]] = {
+    x.name: x
+    for x in (BudgetStrategy, LRUStrategy, RoundRobinStrategy, WeightedStrategy, RandomStrategy)
+}
+
+
+def get_strategy(strategy: str | Strategy) -> Strategy:
+    if isinstance(strategy, Strategy):
+        return strategy
+
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown strategy: {strategy}, expected one of {list(STRATEGIES)}")
+    return STRATEGIES[strategy]()
+
+
+def _last_used(acc: Account) -> float:
+    return acc.last_used.timestamp() if acc.last_used else 0.0
@@ -1,9 +1,10 @@
+import asyncio
 import base64
 import json
 import os
 from collections import defaultdict
 from datetime import datetime, timezone
-from typing import Any, AsyncGenerator, Callable, TypeVar, overload
+from typing import Any, AsyncGenerator, Awaitable, Callable, Hashable, TypeVar, cast, overload
 
 T = TypeVar("T")
 
@@ -17,11 +18,38 @@ class utc:
     def from_iso(iso: str) -> datetime:
         return datetime.fromisoformat(iso).replace(tzinfo=timezone.utc)
 
+    @staticmethod
+    def from_ts(ts: int) -> datetime:
+        return datetime.fromtimestamp(ts, tz=timezone.utc)
+
     @staticmethod
     def ts() -> int:
         return int(utc.now().timestamp())
 
 
+class SingleFlight:
+    """Runs one call per key at once; concurrent callers with the same key share its result."""
+
+    def __init__(self):
+        self._tasks: dict[Hashable, asyncio.Future] = {}
+
+    def start(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> "asyncio.Future[T]":
+        task = self._tasks.get(key)
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            task = asyncio.ensure_future(fn())
+            self._tasks[key] = task
+            task.add_done_callback(lambda x: self._done(key, x))
+        return cast("asyncio.Future[T]", task)
+
+    async def run(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        # cancelled caller does not cancel the call for the others
+        return await asyncio.shield(self.start(key, fn))
+
+    def _done(self, key: Hashable, task: asyncio.Future):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+
+
 async def gather(gen: AsyncGenerator[T, None]) -> list[T]:
     items = []
     async for x in gen:
@@ -132,6 +160,48 @@ def get_typed_object(obj: dict, res: defaultdict[str, list]):
     return res
 
 
+class RepIndex:
+    """
+    Objects of GraphQL response collected in one walk: typed objects (by `__typename`),
+    first cursor of each `cursorType` and first value of `keys` (same as `get_by_path`).
+    """
+
+    keys = ("entries", "items_results", "next_cursor")
+
+    def __init__(self, obj: dict):
+        self.typed: defaultdict[str, list[dict]] = defaultdict(list)
+        self.cursors: dict[str, dict] = {}
+        self.found: dict[str, Any] = {}
+
+        # hot path on big pages: locals & exact type checks instead of isinstance
+        typed, cursors, found, keys = self.typed, self.cursors, self.found, set(self.keys)
+
+        def walk(obj: dict):
+            obj_type = obj.get("__typename")
+            if obj_type is not None:
+                typed[obj_type].append(obj)
+
+            cursor_type = obj.get("cursorType")
+            if cursor_type is not None and cursor_type not in cursors:
+                cursors[cursor_type] = obj
+
+            for k, v in obj.items():
+                if k in keys and k not in found:
+                    found[k] = v
+
+                if type(v) is dict:
+                    walk(v)
+                elif type(v) is list:
+                    for x in v:
+                        if type(x) is dict:
+                            walk(x)
+
+        walk(obj)
+
+    def get(self, key: str, default=None):
+        return self.found.get(key, default)
+
+
 def _merge_legacy(base: dict, legacy) -> dict:
     # top-level wins, missing keys filled from legacy if it is a dict
     out = dict(base)
@@ -267,8 +337,8 @@ def to_old_obj(obj: dict):
     return _flatten_tweet_v2(obj)
 
 
-def to_old_rep(obj: dict) -> dict[str, Any]:
-    tmp = get_typed_object(obj, defaultdict(list))
+def to_old_rep(obj: dict | RepIndex) -> dict[str, Any]:
+    tmp = (obj if isinstance(obj, RepIndex) else RepIndex(obj)).typed
 
     # "legacy" in x still matches under the new schema: the key is present
     # with value None, so membership tests keep working.
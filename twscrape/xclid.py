@@ -1,10 +1,14 @@
 import asyncio
 import base64
 import hashlib
+import json
 import math
+import os
 import random
 import re
 import time
+from collections import OrderedDict
+from functools import partial
 from urllib.parse import urljoin
 
 import bs4
@@ -12,6 +16,7 @@ import bs4
 from .http import HttpClient, format_error
 from .http import make_client as _make_http_client
 from .logger import logger
+from .utils import SingleFlight
 
 
 class XClIdError(Exception): ...
@@ -103,6 +108,15 @@ def get_scripts_list(text: str) -> list[str]:
     ]
 
 
+def get_web_build(text: str) -> str | None:
+    # script bundle URLs contain content hashes, so they identify X web build of the page
+    try:
+        scripts = get_scripts_list(text)
+    except XClIdError:
+        return None
+    return hashlib.sha1("\n".join(scripts).encode()).hexdigest()[:12]
+
+
 # MARK: XClientTxId parsing
 
 # Code mostly taken from https://github.com/iSarabjitDhiman/XClientTransaction (MIT licensed)
@@ -237,14 +251,12 @@ def cacl_anim_key(frames: list[float], target_time: float) -> str:
     return re.sub(r"[.-]", "", "".join(str_arr))
 
 
-def parse_vk_bytes(soup: bs4.BeautifulSoup) -> list[int]:
-    el = soup.find("meta", {"name": "twitter-site-verification", "content": True})
-    el = str(el.get("content")) if el and isinstance(el, bs4.Tag) else None
-    if not el:
+def parse_vk_bytes(key: str | None) -> list[int]:
+    if not key:
         raise XClIdParseError("X verification key not found")
 
     try:
-        return list(base64.b64decode(bytes(el, "utf-8"), validate=True))
+        return list(base64.b64decode(bytes(key, "utf-8"), validate=True))
     except ValueError as e:
         raise XClIdParseError("Invalid X verification key") from e
 
@@ -255,10 +267,75 @@ def parse_vk_bytes(soup: bs4.BeautifulSoup) -> list[int]:
 INDICES_FILE_RE = re.compile(r"(?:\.{0,2}/)?[\w./-]*?\b(?:ondemand\.s|sign\.o)[\w.-]*\.js")
 
 
-async def _find_indices_url(scripts: list[str], clt: HttpClient) -> str:
+# MARK: bundles cache
+
+# What was found in X web bundles is kept on disk between processes: bundle URLs contain content
+# hashes, so a URL always has the same content. Items: bundle URL -> {"ref": url of indices file
+# or None}, indices file URL -> {"indices": [...]}. Bump version when parsing of bundles changes.
+ASSETS_CACHE_VERSION = 1
+ASSETS_CACHE_SIZE = 2000
+
+
+def _assets_cache_file() -> str | None:
+    # TWS_CACHE_DIR="" disables the cache
+    path = os.getenv("TWS_CACHE_DIR")
+    if path is None:
+        base = os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+        path = os.path.join(base, "twscrape")
+    return os.path.join(path, "xclid-assets.json") if path else None
+
+
+def load_assets_cache() -> dict[str, dict]:
+    path = _assets_cache_file()
+    if path is None:
+        return {}
+
+    try:
+        with open(path) as fp:
+            data = json.load(fp)
+    except (OSError, ValueError):
+        return {}
+
+    if not isinstance(data, dict) or data.get("version") != ASSETS_CACHE_VERSION:
+        return {}
+    return data.get("items", {})
+
+
+def save_assets_cache(items: dict[str, dict]):
+    path = _assets_cache_file()
+    if path is None or not items:
+        return
+
+    # merged with what other processes saved meanwhile, oldest items are dropped
+    merged = {**load_assets_cache(), **items}
+    merged = dict(list(merged.items())[-ASSETS_CACHE_SIZE:])
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp, "w") as fp:
+            json.dump({"version": ASSETS_CACHE_VERSION, "items": merged}, fp)
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.debug(f"Failed to save XClId cache {path}: {e}")
+
+
+async def _find_indices_url(
+    scripts: list[str],
+    clt: HttpClient,
+    cache: dict[str, dict] | None = None,
+    found: dict[str, dict] | None = None,
+) -> str:
     # The indices file (sign.o-*.js) is not linked in the page directly — it is
     # dynamically imported from one of the bundle chunks. Scan chunks
     # concurrently and resolve the first reference we find, then stop.
+    # cache: known bundles (see above), not loaded again; found: filled with scanned ones
+    cache = cache or {}
+    for url in scripts:
+        ref = cache.get(url, {}).get("ref")
+        if ref is not None:
+            return str(ref)
+    scripts = [x for x in scripts if x not in cache]
+
     sem = asyncio.Semaphore(16)
 
     async def fetch(url: str) -> tuple[str, str | None]:
@@ -282,8 +359,11 @@ async def _find_indices_url(scripts: list[str], clt: HttpClient) -> str:
 
             loaded += 1
             m = INDICES_FILE_RE.search(body)
-            if m:
-                return urljoin(url, m.group(0))
+            ref = urljoin(url, m.group(0)) if m else None
+            if found is not None:
+                found[url] = {"ref": ref}
+            if ref is not None:
+                return ref
     finally:
         for t in tasks:
             t.cancel()
@@ -295,44 +375,147 @@ async def _find_indices_url(scripts: list[str], clt: HttpClient) -> str:
     )
 
 
+# Signing indices by script URLs of the page. Bundle URLs contain content hashes, so accounts
+# served the same web build share one lookup (concurrent ones also one download).
+_indices: OrderedDict[tuple[str, ...], list[int]] = OrderedDict()
+_indices_flight = SingleFlight()
+INDICES_CACHE_SIZE = 16
+
+
 async def parse_anim_idx(text: str, clt: HttpClient) -> list[int]:
     scripts = list(get_scripts_list(text))
     if not scripts:
         raise XClIdParseError("X web scripts not found")
 
-    # Legacy build links the indices file directly; the current x-web build
-    # hides it behind a dynamic import inside a bundle chunk.
-    direct = [x for x in scripts if INDICES_FILE_RE.search(x)]
-    url = direct[0] if direct else await _find_indices_url(scripts, clt)
+    key = tuple(scripts)
+    if key not in _indices:
+        items = await _indices_flight.run(key, partial(_load_anim_idx, scripts, clt))
+        _indices[key] = items
+        while len(_indices) > INDICES_CACHE_SIZE:
+            _indices.popitem(last=False)
+
+    _indices.move_to_end(key)
+    return _indices[key]
 
-    text = await get_tw_page_text(url, clt)
 
-    items = [int(x.group(2)) for x in INDICES_REGEX.finditer(text)]
-    if not items:
-        raise XClIdParseError("Signing indices not found")
+async def _load_anim_idx(scripts: list[str], clt: HttpClient) -> list[int]:
+    cache, found = await asyncio.to_thread(load_assets_cache), {}
+    try:
+        # Legacy build links the indices file directly; the current x-web build
+        # hides it behind a dynamic import inside a bundle chunk.
+        direct = [x for x in scripts if INDICES_FILE_RE.search(x)]
+        url = direct[0] if direct else await _find_indices_url(scripts, clt, cache, found)
+
+        cached = cache.get(url, {}).get("indices")
+        if cached is not None:
+            return [int(x) for x in cached]
+
+        text = await get_tw_page_text(url, clt)
+        items = [int(x.group(2)) for x in INDICES_REGEX.finditer(text)]
+        if not items:
+            raise XClIdParseError("Signing indices not found")
+
+        found[url] = {"indices": items}
+        return items
+    finally:
+        await asyncio.to_thread(save_assets_cache, found)
 
-    return items
 
+# Page parsing is CPU work on ~1MB of html, so it runs in worker thread. Fast path pulls
+# only the verification key and animation paths with regexps; it gives up (returns None) on
+# any markup it does not expect, then BeautifulSoup parses the page as before.
+META_RE = re.compile(r"<meta\s[^>]*?(?<=\s)name=[\"']twitter-site-verification[\"'][^>]*>", re.I)
+ANIM_SVG_RE = re.compile(r"<svg\s[^>]*?(?<=\s)id=[\"']loading-x-anim[^>]*>(.*?)</svg>", re.I | re.S)
+TAG_RE = re.compile(r"<(/?)([a-zA-Z][\w:-]*)([^>]*)>")
 
-def parse_anim_arr(soup: bs4.BeautifulSoup, vk_bytes: list[int]) -> list[list[float]]:
+
+def _attr(tag: str, name: str) -> str | None:
+    m = re.search(rf"\s{name}=([\"'])(.*?)\1", tag, re.S)
+    return str(m.group(2)) if m else None
+
+
+def _anim_paths(svg: str) -> list[str] | None:
+    # `g:first-child path:nth-child(2)` for plain `svg > g > path*` layout only, selector
+    # can match more in nested markup, which is left to BeautifulSoup
+    tags = [(closing, name.lower(), attrs) for closing, name, attrs in TAG_RE.findall(svg)]
+    if not tags or tags[0][:2] != ("", "g") or tags[0][2].rstrip().endswith("/"):
+        return None
+
+    paths, idx = [], 1
+    while idx < len(tags) and tags[idx][:2] == ("", "path"):
+        paths.append(tags[idx][2])
+        idx += 1
+        if not paths[-1].rstrip().endswith("/"):
+            if idx >= len(tags) or tags[idx][:2] != ("/", "path"):
+                return None
+            idx += 1
+
+    if idx >= len(tags) or tags[idx][:2] != ("/", "g"):
+        return None
+    if any(name == "g" for _, name, _ in tags[idx + 1 :]):
+        return None
+
+    return [(_attr(paths[1], "d") or "").strip()] if len(paths) > 1 else []
+
+
+def extract_page_fast(text: str) -> tuple[str, list[str]] | None:
+    metas = META_RE.findall(text)
+    if len(metas) != 1:
+        return None
+
+    key = _attr(metas[0], "content")
+    if key is None or "&" in key:
+        return None
+
+    paths = []
+    for svg in ANIM_SVG_RE.finditer(text):
+        items = _anim_paths(svg.group(1))
+        if items is None:
+            return None
+        paths.extend(items)
+
+    return (key, paths) if paths else None
+
+
+def extract_page_soup(text: str) -> tuple[str | None, list[str]]:
+    soup = bs4.BeautifulSoup(text, "html.parser")
+    el = soup.find("meta", {"name": "twitter-site-verification", "content": True})
+    key = str(el.get("content")) if el and isinstance(el, bs4.Tag) else None
+
+    els = soup.select("svg[id^='loading-x-anim'] g:first-child path:nth-child(2)")
+    return key, [str(x.get("d") or "").strip() for x in els]
+
+
+def extract_page(text: str) -> tuple[str | None, list[str]]:
+    rs = extract_page_fast(text)
+    if rs is None:
+        logger.debug("XClIdGen: unexpected page markup, parse with BeautifulSoup")
+        rs = extract_page_soup(text)
+    return rs
+
+
+def parse_anim_arr(paths: list[str], vk_bytes: list[int]) -> list[list[float]]:
     # https://github.com/fa0311/twitter-tid-deobf/blob/c4fd61c36/output/a.js#L18
-    els = list(soup.select("svg[id^='loading-x-anim'] g:first-child path:nth-child(2)"))
-    els = [str(x.get("d") or "").strip() for x in els]
-    if not els:
+    if not paths:
         raise XClIdParseError("Animation data not found")
 
-    idx = vk_bytes[5] % len(els)
-    dat = els[idx][9:].split("C")
+    idx = vk_bytes[5] % len(paths)
+    dat = paths[idx][9:].split("C")
     try:
         return [list(map(float, re.sub(r"[^\d]+", " ", x).split())) for x in dat]
     except (IndexError, ValueError) as e:
         raise XClIdParseError("Invalid animation data") from e
 
 
-async def load_keys(soup: bs4.BeautifulSoup, clt: HttpClient) -> tuple[list[int], str]:
-    anim_idx = await parse_anim_idx(str(soup), clt)
-    vk_bytes = parse_vk_bytes(soup)
-    anim_arr = parse_anim_arr(soup, vk_bytes)
+def parse_page(text: str) -> tuple[list[int], list[list[float]]]:
+    key, paths = extract_page(text)
+    vk_bytes = parse_vk_bytes(key)
+    return vk_bytes, parse_anim_arr(paths, vk_bytes)
+
+
+async def load_keys(text: str, clt: HttpClient) -> tuple[list[int], str]:
+    anim_idx = await parse_anim_idx(text, clt)
+    vk_bytes, anim_arr = await asyncio.to_thread(parse_page, text)
 
     frame_time = 1
     for x in anim_idx[1:]:
@@ -356,15 +539,22 @@ class XClIdGen:
         clt = _make_client(proxy=proxy, cookies=cookies)
         try:
             text = await get_tw_page_text("https://x.com/tesla", clt)
-            soup = bs4.BeautifulSoup(text, "html.parser")
-            vk_bytes, anim_key = await load_keys(soup, clt)
-            return XClIdGen(vk_bytes, anim_key)
+            vk_bytes, anim_key = await load_keys(text, clt)
+            return XClIdGen(vk_bytes, anim_key, build=get_web_build(text))
         finally:
             await clt.aclose()
 
-    def __init__(self, vk_bytes: list[int], anim_key: str):
+    def __init__(
+        self,
+        vk_bytes: list[int],
+        anim_key: str,
+        created_at: int | None = None,
+        build: str | None = None,
+    ):
         self.vk_bytes = vk_bytes
         self.anim_key = anim_key
+        self.created_at = created_at or int(time.time())
+        self.build = build  # X web build keys were made from, None when unknown
 
     def calc(self, method: str, path: str) -> str:
         ts = math.floor((time.time() * 1000 - 1682924400 * 1000) / 1000)